@@ -0,0 +1,104 @@
+"""
+Per-article overhead and peak memory of the feed -> dedup -> score -> record path.
+
+Compares the NewsItem generator pipeline of the analyzer with the previous
+DataFrame + iterrows implementation (reproduced below as the baseline). Scoring
+and the database are replaced by constants, so only the pipeline's own cost is
+measured.
+
+    python benchmarks/news_pipeline.py [--articles 100 1000 10000] [--repeat 5]
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+import pandas as pd  # noqa: E402
+
+import stock_news_sentiment_analyzer as analyzer  # noqa: E402
+import utils.trading_date_lookup as td  # noqa: E402
+
+ANSWER = analyzer.SentimentAnswer(score=1, type='story', comment='Positive outlook')
+
+
+def make_entries(count):
+    return [SimpleNamespace(id=f"uuid-{i}", title=f"Title of article {i}", link=f"https://example.com/{i}",
+                            published=f"Thu, {1 + i % 28:02d} Mar 2024 {i % 24:02d}:{i % 60:02d}:00 +0000",
+                            description="Article description " * 10)
+            for i in range(count)]
+
+
+def baseline_pipeline(entries, known):
+    """
+    The previous implementation: DataFrame per feed, vectorized times, iterrows and Series rows.
+    """
+    data = pd.DataFrame([{'uuid': e.id, 'title': e.title, 'link': e.link, 'publication date': e.published,
+                          'description': e.description} for e in entries])
+    data['publication date'] = pd.to_datetime(data['publication date'], format='%a, %d %b %Y %H:%M:%S %z',
+                                              errors='coerce', utc=True)
+    est_time = data['publication date'].dt.tz_convert('America/New_York').dt.tz_localize(None)
+    data['est_time'] = est_time
+    data['trading_dt'] = pd.Series(td.get_trading_dates(est_time), index=data.index).dt.date
+
+    records = []
+    for index, row in data.iterrows():
+        if row['uuid'] in known:
+            continue
+        row['score'] = ANSWER.score
+        row['type'] = ANSWER.type
+        row['comment'] = ANSWER.comment
+        news_ts = pd.to_datetime(row['est_time'])
+        records.append((row['uuid'], 'RY', news_ts, row['trading_dt'], row['title'], row['link'],
+                        row['description'], row['type'], row['score'], row['comment'], analyzer.OPENAI_MODEL))
+    return records
+
+
+def item_pipeline(entries, known):
+    """
+    The NewsItem pipeline: generator stages over slotted records.
+    """
+    records = []
+    for item in analyzer.news_items(entries):
+        if item.uuid in known:
+            continue
+        item.set_sentiment(ANSWER)
+        records.append(analyzer.ynews_record(item, 'RY'))
+    return records
+
+
+def measure(pipeline, entries, known, repeat):
+    pipeline(entries, known)  # warm up calendars and imports
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pipeline(entries, known)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    pipeline(entries, known)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(timings), peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the news pipeline against the DataFrame baseline")
+    parser.add_argument('--articles', type=int, nargs='+', default=[100, 1000, 10000], help="feed sizes")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per size (the fastest is reported)")
+    args = parser.parse_args(argv)
+
+    print(f"{'articles':>8}  {'pipeline':<10} {'us/article':>10} {'peak KiB':>10}")
+    for count in args.articles:
+        entries = make_entries(count)
+        known = {f"uuid-{i}" for i in range(0, count, 10)}
+        for name, pipeline in [('dataframe', baseline_pipeline), ('newsitem', item_pipeline)]:
+            seconds, peak = measure(pipeline, entries, known, args.repeat)
+            print(f"{count:>8}  {name:<10} {seconds / count * 1e6:>10.1f} {peak / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Startup cost of each CLI subcommand, measured with `python -X importtime`.
+
+For every subcommand a fresh interpreter imports the command's module (without
+running it) and the import time report is summarized: total wall time, total
+import time and the slowest top-level imports.
+
+    python benchmarks/startup_time.py [--repeat 3] [--top 8] [command ...]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+src_dir = Path(__file__).resolve().parent.parent / 'src'
+sys.path.insert(0, str(src_dir))
+
+from main_sentiment_analyzer import COMMANDS  # noqa: E402
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def measure(command):
+    """
+    Import a command's module in a new interpreter.
+
+    :return: (wall seconds, {top-level module: cumulative microseconds})
+    """
+    code = f"import main_sentiment_analyzer as cli; cli.load_command({command!r})"
+    env = {**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=src_dir, env=env,
+                            capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{command}: {result.stderr.strip().splitlines()[-1]}")
+
+    top_level = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        # Nesting is shown by two spaces per level; one space marks a top-level import
+        if match and len(match.group(3)) == 1:
+            top_level[match.group(4)] = int(match.group(2))
+    return wall, top_level
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the import time of each CLI subcommand")
+    parser.add_argument('commands', nargs='*', default=list(COMMANDS), help="subcommands to measure")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per command (the median is reported)")
+    parser.add_argument('--top', type=int, default=8, help="slowest top-level imports to list")
+    args = parser.parse_args(argv)
+
+    for command in args.commands:
+        runs = [measure(command) for _ in range(args.repeat)]
+        wall = statistics.median(run[0] for run in runs)
+        imports = runs[len(runs) // 2][1]
+        total = sum(imports.values()) / 1e6
+
+        print(f"{command}: {wall * 1000:.0f} ms wall, {total * 1000:.0f} ms importing")
+        for module, cumulative in sorted(imports.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {cumulative / 1000:8.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ setup(
     version="0.1",
     packages=find_packages(where="src"),
     package_dir={"": "src"},
+    python_requires=">=3.9",
     install_requires=[
         "pandas",
         "datetime",
@@ -14,9 +15,9 @@ setup(
         "mysql-connector-python",
         "pydantic",
         "langchain",
-        "pymysql",
         "scikit-learn",
         "statsmodels",
+        "scipy",
     ],
     entry_points={
         'console_scripts': [
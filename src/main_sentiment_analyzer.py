@@ -0,0 +1,35 @@
+import argparse
+import importlib
+import sys
+
+# Subcommands and the module implementing each; a module is only imported when its command runs
+COMMANDS = {
+    'fetch': ('stock_news_sentiment_analyzer', "fetch, score and store the news of the configured tickers"),
+    'score': ('sentiment_backfill', "rescore stored articles with the OpenAI Batch API"),
+    'load-prices': ('utils.load_stock_prices', "load stock prices and fundamentals from Yahoo Finance"),
+    'analyze': ('stock_news_sentiment_score_test', "regress price changes on news sentiment scores"),
+    'rebuild-daily': ('utils.ynews_daily', "rebuild the ynews_daily aggregate from the stored articles"),
+}
+
+
+def load_command(name):
+    """
+    Import the module of a subcommand and return its main function.
+    """
+    module_name, _ = COMMANDS[name]
+    return importlib.import_module(module_name).main
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='sentiment_analyzer', description="Stock news sentiment analyzer")
+    subparsers = parser.add_subparsers(dest='command', required=True, metavar='command')
+    for name, (_, help_text) in COMMANDS.items():
+        subparsers.add_parser(name, help=help_text, add_help=False)
+
+    args, remaining = parser.parse_known_args(argv)
+    # Options after the command (including --help) belong to the command's own parser
+    return load_command(args.command)(remaining)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+import argparse
+import json
+import sys
+import time
+import uuid as uuid_lib
+from pathlib import Path
+from types import SimpleNamespace
+
+import stock_news_sentiment_analyzer as analyzer
+from utils import db
+from utils.ynews_daily import rebuild_ynews_daily
+
+# Batch API limit is 50,000 requests per input file
+MAX_REQUESTS_PER_FILE = 50000
+POLL_INTERVAL = 60
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+
+# Structured output schema sent with every batch request
+def sentiment_response_format() -> dict:
+    schema = analyzer.SentimentAnswer.model_json_schema()
+    schema['additionalProperties'] = False
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": "SentimentAnswer", "strict": True, "schema": schema},
+    }
+
+
+# SQL: Stream articles that were never scored or were scored by another model
+def stream_stale_articles(connection, model: str, batch_size: int = 1000):
+    query = """
+        SELECT uuid, symbol, title, description
+        FROM ynews
+        WHERE sentiment_model IS NULL OR sentiment_model <> %s
+    """
+    # Unbuffered cursor: rows are streamed from the server instead of loaded at once
+    cursor = connection.cursor(buffered=False)
+    try:
+        cursor.execute(query, (model,))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+
+# Write batch request files for the given articles; returns the list of files written
+def write_batch_files(articles, model: str, out_dir, max_requests: int = MAX_REQUESTS_PER_FILE) -> list:
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    response_format = sentiment_response_format()
+
+    files = []
+    handle = None
+    count = 0
+    try:
+        for uuid, symbol, title, description in articles:
+            if handle is None or count >= max_requests:
+                if handle:
+                    handle.close()
+                path = out_dir / f"batch_{len(files):04d}.jsonl"
+                handle = open(path, 'w', encoding='utf-8')
+                files.append(path)
+                count = 0
+            request = {
+                "custom_id": uuid,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": model,
+                    "messages": analyzer.sentiment_messages(symbol, title, description),
+                    "response_format": response_format,
+                },
+            }
+            handle.write(json.dumps(request) + "\n")
+            count += 1
+    finally:
+        if handle:
+            handle.close()
+
+    return files
+
+
+# Upload request files and create one batch per file; returns the batch ids
+def submit_batches(client, files) -> list:
+    batch_ids = []
+    for path in files:
+        with open(path, 'rb') as handle:
+            input_file = client.files.create(file=handle, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+            metadata={"source": "sentiment_backfill", "file": Path(path).name},
+        )
+        print(f"Submitted {path} as batch {batch.id}")
+        batch_ids.append(batch.id)
+    return batch_ids
+
+
+# Poll the batches until every one of them reaches a final status
+def wait_for_batches(client, batch_ids, poll_interval: float = POLL_INTERVAL) -> list:
+    pending = list(batch_ids)
+    finished = {}
+    while pending:
+        for batch_id in list(pending):
+            batch = client.batches.retrieve(batch_id)
+            if batch.status in FINAL_STATUSES:
+                print(f"Batch {batch_id} {batch.status}")
+                finished[batch_id] = batch
+                pending.remove(batch_id)
+        if pending:
+            time.sleep(poll_interval)
+    return [finished[batch_id] for batch_id in batch_ids]
+
+
+# Parse a batch output file into (uuid, SentimentAnswer) pairs, skipping failed or malformed answers
+def parse_batch_output(text: str):
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        response = result.get('response') or {}
+        if result.get('error') or response.get('status_code') != 200:
+            print(f"Batch request {result.get('custom_id')} failed: {result.get('error')}")
+            continue
+        try:
+            content = response['body']['choices'][0]['message']['content']
+            answer = analyzer.SentimentAnswer.model_validate_json(content)
+        except Exception as e:
+            print(f"Invalid answer for {result.get('custom_id')}: {e}")
+            continue
+        if analyzer.is_valid_sentiment(answer):
+            yield result['custom_id'], answer
+
+
+# SQL: Apply scored answers to ynews in chunks, recording the model that produced them
+def apply_results(connection, results, model: str, chunk_size: int = 1000) -> int:
+    query = """
+        UPDATE ynews
+        SET sentiment_score = %s, news_type = %s, comment = %s, sentiment_model = %s
+        WHERE uuid = %s
+    """
+    applied = 0
+    chunk = []
+
+    def flush():
+        cursor = connection.cursor()
+        try:
+            cursor.executemany(query, chunk)
+            connection.commit()
+        finally:
+            cursor.close()
+
+    for uuid, answer in results:
+        chunk.append((answer.score, answer.type, answer.comment[:1024], model, uuid))
+        if len(chunk) >= chunk_size:
+            flush()
+            applied += len(chunk)
+            chunk = []
+    if chunk:
+        flush()
+        applied += len(chunk)
+    return applied
+
+
+# Download the output of finished batches and apply it to ynews. Expired, failed or cancelled batches
+# may still have an output file with the requests they completed, which is applied as well.
+# Rescored articles change the ynews_daily aggregates of their days, so the aggregate is rebuilt.
+def collect_results(client, connection, batches, model: str) -> int:
+    applied = 0
+    for batch in batches:
+        if not batch.output_file_id:
+            print(f"Skipping batch {batch.id} ({batch.status}, no output)")
+            continue
+        if batch.status != 'completed':
+            print(f"Collecting the completed requests of batch {batch.id} ({batch.status})")
+        output = client.files.content(batch.output_file_id).text
+        applied += apply_results(connection, parse_batch_output(output), model)
+    if applied:
+        print(f"Aggregated news days: {rebuild_ynews_daily(connection)}")
+    return applied
+
+
+class LocalBatchClient:
+    """
+    Offline stand-in for the files and batches endpoints of the OpenAI client.
+
+    Batches are processed synchronously on `create` by calling `respond(body)` for
+    each request, which must return the assistant message content (a JSON string).
+    """
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.stored_files = {}
+        self.stored_batches = {}
+        self.files = SimpleNamespace(create=self._create_file, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch)
+
+    def _create_file(self, file, purpose):
+        file_id = f"file-{uuid_lib.uuid4().hex}"
+        self.stored_files[file_id] = file.read().decode('utf-8')
+        return SimpleNamespace(id=file_id, purpose=purpose)
+
+    def _file_content(self, file_id):
+        return SimpleNamespace(text=self.stored_files[file_id])
+
+    def _create_batch(self, input_file_id, endpoint, completion_window, metadata=None):
+        lines = []
+        for line in self.stored_files[input_file_id].splitlines():
+            request = json.loads(line)
+            try:
+                content = self.respond(request['body'])
+                response = {"status_code": 200, "body": {"choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": content}}]}}
+                lines.append({"custom_id": request['custom_id'], "response": response, "error": None})
+            except Exception as e:
+                lines.append({"custom_id": request['custom_id'], "response": None,
+                              "error": {"message": str(e)}})
+
+        output_id = f"file-{uuid_lib.uuid4().hex}"
+        self.stored_files[output_id] = "\n".join(json.dumps(line) for line in lines)
+        batch = SimpleNamespace(id=f"batch-{uuid_lib.uuid4().hex}", status='completed',
+                                output_file_id=output_id, endpoint=endpoint, metadata=metadata)
+        self.stored_batches[batch.id] = batch
+        return batch
+
+    def _retrieve_batch(self, batch_id):
+        return self.stored_batches[batch_id]
+
+
+# Directory of one backfill run below out_dir, so runs never overwrite each other's files
+def new_run_dir(out_dir) -> Path:
+    return Path(out_dir) / f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid_lib.uuid4().hex[:8]}"
+
+
+# Record the batches of a run together with the model they were submitted with
+def write_run(run_dir, model: str, batch_ids):
+    (Path(run_dir) / 'batches.json').write_text(json.dumps({'model': model, 'batch_ids': batch_ids}))
+
+
+# Read the model and batch ids of a run
+def read_run(run_dir):
+    run = json.loads((Path(run_dir) / 'batches.json').read_text())
+    return run['model'], run['batch_ids']
+
+
+# Resume: wait for the batches of an earlier run and apply them, tagged with the model they were submitted with
+def resume(connection, client, run_dir, model: str = None, poll_interval: float = POLL_INTERVAL) -> int:
+    recorded_model, batch_ids = read_run(run_dir)
+    if model and model != recorded_model:
+        print(f"Batches of {run_dir} were submitted with {recorded_model}, ignoring --model {model}")
+    batches = wait_for_batches(client, batch_ids, poll_interval)
+    applied = collect_results(client, connection, batches, recorded_model)
+    print(f"Rescored articles: {applied}")
+    return applied
+
+
+# Backfill: export stale rows, submit them to the Batch API, wait and apply the results.
+# The batch files and batches.json of the run are written to a new directory below out_dir.
+def backfill(connection, client, model: str, out_dir, poll_interval: float = POLL_INTERVAL) -> int:
+    run_dir = new_run_dir(out_dir)
+    files = write_batch_files(stream_stale_articles(connection, model), model, run_dir)
+    if not files:
+        run_dir.rmdir()
+        print("No articles to rescore.")
+        return 0
+
+    batch_ids = submit_batches(client, files)
+    write_run(run_dir, model, batch_ids)
+    print(f"Submitted {len(batch_ids)} batches; resume with --resume {run_dir}")
+
+    batches = wait_for_batches(client, batch_ids, poll_interval)
+    applied = collect_results(client, connection, batches, model)
+    print(f"Rescored articles: {applied}")
+    return applied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rescore ynews articles with the OpenAI Batch API")
+    parser.add_argument('--model', help=f"model to rescore with (default: {analyzer.OPENAI_MODEL}; "
+                                         "on --resume, the model the batches were submitted with)")
+    parser.add_argument('--out-dir', default=str(analyzer.root_dir / 'data' / 'backfill'),
+                        help="directory for batch request files; each run writes to a new subdirectory")
+    parser.add_argument('--resume', metavar='RUN_DIR',
+                        help="wait for and apply the batches recorded in the directory of an earlier run")
+    args = parser.parse_args(argv)
+
+    try:
+        connection = db.get_pool().acquire()
+    except analyzer.mysql_connector.Error as e:
+        print(f"Error connecting to MySQL: {e}")
+        return 1
+    if not analyzer.migrate_ynews(connection):
+        connection.close()
+        return 1
+
+    try:
+        if args.resume:
+            resume(connection, analyzer.get_client(), args.resume, args.model)
+        else:
+            backfill(connection, analyzer.get_client(), args.model or analyzer.OPENAI_MODEL, args.out_dir)
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
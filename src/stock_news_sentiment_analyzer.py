@@ -1,16 +1,32 @@
-import pandas as pd
+from __future__ import annotations
+
+import argparse
 import datetime
 import os
+import signal
+import sys
+import threading
 import pytz
-import feedparser
-import openai
-import mysql.connector
 import utils.trading_date_lookup as td
-from utils.holiday_manager import load_holiday_dates_from_csv
-from pydantic import BaseModel, Field
-from typing import Optional
+from utils.lazy import lazy_import
+from utils import db
+from utils.ynews_writer import YnewsWriter, add_sentiment_model_column
+from utils.ynews_daily import create_ynews_daily, refresh_days, touched_days
+from utils.scoring_engine import ScoringEngine, estimate_tokens, is_retryable
+from utils.sentiment_cache import SentimentCache, sentiment_cache_key
+from utils.feed_fetcher import FeedCache, iter_feeds, batch_symbols, fan_out_entries
+from utils.news_item import NewsItem, parse_published, to_exchange_time
+from utils.poll_scheduler import PollScheduler
+from utils.work_queue import WorkQueue
+from utils.shard_coordinator import ShardCoordinator, seed_registry
+from typing import TYPE_CHECKING, Optional
 from pathlib import Path
 
+# Heavy dependencies are imported on first use, so importing this module stays cheap
+feedparser = lazy_import('feedparser')
+openai = lazy_import('openai')
+mysql_connector = lazy_import('mysql.connector')
+
 # List of stock tickers to analyze
 tickers = ['ACO-X.TO', 'AEM.TO', 'ALA.TO', 'ALC.TO', 'ALS.TO', 'ARE.TO', 'AQN', 'ATD.TO', 'BCE', 'BDGI.TO', 'BMO', 'BN', 'BNS', 'CCO.TO', 'CEU.TO', 'CM',
             'CNQ.TO', 'CNR.TO', 'CVE.TO', 'CP', 'CU.TO', 'EIF.TO', 'EMA.TO', 'ENB', 'FC.TO', 'FTS', 'GWO.TO', 'H.TO', 'HPS-A.TO', 'IMO.TO', 'IFC.TO', 'KEY.TO', 'L.TO', 'MFC',
@@ -18,17 +34,39 @@ tickers = ['ACO-X.TO', 'AEM.TO', 'ALA.TO', 'ALC.TO', 'ALS.TO', 'ARE.TO', 'AQN',
             'SIA.TO', 'SLF.TO', 'SU', 'T.TO', 'TIH.TO', 'TD', 'TRI', 'TRP.TO', 'WCN.TO', 'WN.TO', 'WPM.TO', 'X.TO']
 
 
-# Pydantic model to structure sentiment response
-class SentimentAnswer(BaseModel):
-    score: int = Field(description="Sentiment score: negative=-1, neutral=0, positive=1")
-    type: str = Field(description="Type of article: story or fs (financial statement)")
-    comment: str = Field(description="Explanation for the sentiment score")
+# The pydantic answer models live in utils.sentiment_models and are imported where they are used
+# (a plain import, safe on the scoring threads), so importing this module does not load pydantic.
+# They remain available as attributes of this module.
+if TYPE_CHECKING:
+    from utils.sentiment_models import SentimentAnswer
+
+def __getattr__(name):
+    if name in ('SentimentAnswer', 'SentimentItem', 'BatchSentimentAnswer'):
+        from utils import sentiment_models
+        return getattr(sentiment_models, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # OpenAI API setup
 openai_api_key = os.getenv('OPENAI_API_KEY')
 #OPENAI_MODEL = 'ft:gpt-4.1-mini-2025-04-14:personal::DpfZVRx2'
 OPENAI_MODEL = 'ft:gpt-4o-mini-2024-07-18:personal::A5cBFbkn'
-client = openai.OpenAI()
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    The shared OpenAI client, created on first use (so that importing the module
+    does not require an API key).
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = openai.OpenAI()
+    return _client
+
+# Bump when the prompts change so cached answers of the old prompts are not reused
+SENTIMENT_TEMPLATE_VERSION = 1
 
 # Template to request sentiment analysis from the OpenAI model
 sentiment_template = """
@@ -44,66 +82,229 @@ Return:
 - type: "story" or "fs"
 - comment: maximum 20 words
 """
-# Ensure holidays are loaded at initialization
+
+# Template to request sentiment analysis for several articles in one completion
+batch_sentiment_template = """
+Estimate sentiment score for each news article below for the stock given with the article: negative=-1, neutral=0, positive=1.
+Provide answer as an integer number and a short comment indicating the reason.
+If article is not about the specific stock, please rate neutral.
+Detect if the article is a financial statement - provide answer as type 'story' or 'fs' for financial statement.
+A financial statement is a report issued by that company summarizing financial performance for the last quarter or year.
+{articles}
+Return one item for every article with:
+- id: the article id
+- score: -1, 0, or 1
+- type: "story" or "fs"
+- comment: maximum 20 words
+"""
+
+batch_article_template = """
+Id: {id}
+Stock: {symbol}
+Title: {title}
+Article: {article}
+"""
+# Holidays are read from data/tsx_holidays.csv by the trading calendar on first use
 root_dir = Path(__file__).parent.parent
-file_path = root_dir / 'data' / 'tsx_holidays.csv'
-load_holiday_dates_from_csv(file_path)
+
+# Concurrent feed fetching: requests in flight, per-request timeout (seconds) and ETag/Last-Modified cache
+FETCH_CONCURRENCY = 8
+FETCH_TIMEOUT = 10
+FEED_CACHE_PATH = root_dir / 'data' / 'feed_cache.json'
+# Number of symbols requested per feed; 1 keeps one request per ticker
+FETCH_BATCH_SIZE = 1
+
+# Concurrent scoring: requests in flight and the OpenAI rate limit budgets of the account
+SCORING_WORKERS = 8
+OPENAI_RPM = 500
+OPENAI_TPM = 200000
+# Batched scoring: articles per completion and estimated prompt tokens per batch
+SCORING_BATCH_SIZE = 8
+SCORING_BATCH_TOKENS = 4000
+
+# Daemon mode: bounds of the per-ticker polling interval (seconds)
+DAEMON_MIN_INTERVAL = 60
+DAEMON_MAX_INTERVAL = 3600
+
+# Sharding: lease lifetime of a worker's shards and the time workers of a one-shot run wait for each other (seconds)
+SHARD_LEASE_SECONDS = 60
+SHARD_SETTLE_SECONDS = 10
+
+# Durable queue of fetched articles: a run that dies resumes from it, and several processes may drain it
+WORK_QUEUE_PATH = root_dir / 'data' / 'work_queue.db'
+WORK_QUEUE_LEASE_SECONDS = 600
+WORK_QUEUE_MAX_ATTEMPTS = 5
+# Days stored articles stay in the queue before they are purged
+WORK_QUEUE_RETENTION_DAYS = 7
+
+# Persistent cache of sentiment answers keyed by model and content; opened by main()
+SENTIMENT_CACHE_PATH = root_dir / 'data' / 'sentiment_cache.db'
+SENTIMENT_CACHE_TTL_DAYS = 365
+sentiment_cache = None
+
+# Function to build the RSS feed URL for the given symbol (or comma-separated symbols)
+def news_url(symbol: str) -> str:
+    return f"https://feeds.finance.yahoo.com/rss/2.0/headline?s={symbol}&region=USA&lang=en-US&count=500"
 
 # Function to get news for the given symbol
 def get_news(symbol: str):
 
-    # URL of the RSS feed
-    rss_url = f"https://feeds.finance.yahoo.com/rss/2.0/headline?s={symbol}&region=USA&lang=en-US&count=500"
-
     # Parse the RSS feed
-    feed = feedparser.parse(rss_url)
+    feed = feedparser.parse(news_url(symbol))
+
+    return news_from_feed(feed)
+
+# Function to convert a parsed RSS feed into a list of NewsItems
+def news_from_feed(feed):
 
     # Check if the feed was successfully parsed
     if feed.bozo:
         print("Failed to parse the RSS feed.")
         return None
 
-    news_items = []
-    # Loop through each news item and collect details
-    for entry in feed.entries:
-        news_items.append({
-            'uuid': entry.id,
-            'title': entry.title,
-            'link': entry.link,
-            'publication date': entry.published,
-            'description': entry.description
-        })
-
-    # Convert the list of news items into a DataFrame
-    news_df = pd.DataFrame(news_items)
-
-    # Convert the 'Publication Date' to datetime
-    #news_df['publication date'] = pd.to_datetime(news_df['publication date'])
-    news_df['publication date'] = pd.to_datetime(
-    news_df['publication date'],
-    format='%a, %d %b %Y %H:%M:%S %z',
-    errors='coerce')
-
-    return news_df
+    return news_from_entries(feed.entries)
+
+# Stage: turn feed entries into NewsItems with their New York time and trading date.
+# The trading dates of a whole feed are looked up at once in the session array
+def news_items(entries):
+    entries = list(entries)
+    published = [parse_published(entry.published) for entry in entries]
+    est_times = [to_exchange_time(value) for value in published]
+    trading_dts = td.get_trading_dates(est_times).astype(object) if entries else []
+    for entry, published_at, est_time, trading_dt in zip(entries, published, est_times, trading_dts):
+        yield NewsItem(entry.id, entry.title, entry.link, entry.description, published_at, est_time, trading_dt)
+
+# Function to convert a list of feed entries into a list of NewsItems
+def news_from_entries(entries):
+    if not entries:
+        return None
+    return list(news_items(entries))
+
+# Function to build the chat messages requesting sentiment for one article
+def sentiment_messages(symbol: str, title: str, article: str) -> list:
+    # Create the user message based on the template
+    user_message = sentiment_template.format(symbol=symbol, title=title, article=article)
+    return [
+        {"role": "system", "content": "You are a financial news sentiment analysis assistant."},
+        {"role": "user", "content": user_message}
+    ]
+
+# Function to send a sentiment analysis request to OpenAI; errors are raised to the caller
+def request_sentiment(symbol: str, title: str, article: str, openai_client=None) -> Optional[SentimentAnswer]:
+    from utils.sentiment_models import SentimentAnswer
+    messages = sentiment_messages(symbol, title, article)
+
+    # Request the sentiment from OpenAI and parse the structured response
+    completion = (openai_client or get_client()).beta.chat.completions.parse(
+        model=OPENAI_MODEL,
+        messages=messages,
+        response_format=SentimentAnswer,
+    )
+
+    return completion.choices[0].message.parsed
+
+# Function to send one sentiment analysis request for several (id, symbol, title, article) items
+def request_batch_sentiment(items, openai_client=None) -> dict:
+    from utils.sentiment_models import BatchSentimentAnswer, SentimentAnswer
+    articles = "".join(batch_article_template.format(id=id, symbol=symbol, title=title, article=article)
+                       for id, symbol, title, article in items)
+    messages = [
+        {"role": "system", "content": "You are a financial news sentiment analysis assistant."},
+        {"role": "user", "content": batch_sentiment_template.format(articles=articles)}
+    ]
+
+    completion = (openai_client or get_client()).beta.chat.completions.parse(
+        model=OPENAI_MODEL,
+        messages=messages,
+        response_format=BatchSentimentAnswer,
+    )
+
+    # Keep the first well-formed answer for each requested id
+    requested = {str(item[0]) for item in items}
+    answers = {}
+    for answer in completion.choices[0].message.parsed.items:
+        if answer.id in requested and answer.id not in answers and is_valid_sentiment(answer):
+            answers[answer.id] = SentimentAnswer(score=answer.score, type=answer.type, comment=answer.comment)
+    return answers
+
+# Check that a structured answer holds an allowed score and article type
+def is_valid_sentiment(answer: SentimentAnswer) -> bool:
+    return answer.score in (-1, 0, 1) and answer.type in ('story', 'fs')
+
+# Cache: look up a previously scored article with the same model, prompt and content
+def cached_sentiment(symbol: str, title: str, article: str) -> Optional[SentimentAnswer]:
+    from utils.sentiment_models import SentimentAnswer
+    if sentiment_cache is None:
+        return None
+    answer = sentiment_cache.get(sentiment_cache_key(OPENAI_MODEL, SENTIMENT_TEMPLATE_VERSION, symbol, title, article))
+    return SentimentAnswer(**answer) if answer else None
+
+# Cache: remember the answer for an article
+def cache_sentiment(symbol: str, title: str, article: str, sentiment: Optional[SentimentAnswer]):
+    if sentiment_cache is None or sentiment is None:
+        return
+    key = sentiment_cache_key(OPENAI_MODEL, SENTIMENT_TEMPLATE_VERSION, symbol, title, article)
+    sentiment_cache.put(key, sentiment.model_dump())
+
+# Cache: split articles into those with a cached answer and those still to be scored, so that
+# only the misses are submitted to the engine and charged to its rate limits
+def split_cached(items, symbol: str):
+    cached, misses = {}, []
+    for item in items:
+        sentiment = cached_sentiment(symbol, item.title, item.description)
+        if sentiment:
+            cached[item.uuid] = sentiment
+        else:
+            misses.append(item)
+    return cached, misses
+
+# Function to score (id, symbol, title, article) items, batching several articles per completion.
+# The answers are cached; callers look up the cache before submitting items (see split_cached).
+def score_articles(items, openai_client=None) -> dict:
+    answers = request_articles(items, openai_client)
+    for id, symbol, title, article in items:
+        cache_sentiment(symbol, title, article, answers.get(str(id)))
+    return answers
+
+# Function to request sentiment for (id, symbol, title, article) items, several articles per completion.
+# Items missing from or malformed in the batched answer are left out; score_batches sends them again
+# one per request. A batch failing with a non-retryable error leaves out all of its items.
+def request_articles(items, openai_client=None) -> dict:
+    if len(items) == 1:
+        id, symbol, title, article = items[0]
+        return {str(id): request_sentiment(symbol, title, article, openai_client)}
+
+    try:
+        return request_batch_sentiment(items, openai_client)
+    except Exception as e:
+        # let the caller back off on rate limits instead of multiplying the requests
+        if is_retryable(e):
+            raise
+        print(f"Error fetching batch sentiment analysis: {e}")
+        return {}
+
+# Split items into batches capped by item count and estimated prompt tokens
+def batch_articles(items, max_items: int = SCORING_BATCH_SIZE, max_tokens: int = SCORING_BATCH_TOKENS):
+    batch, batch_tokens = [], 0
+    for item in items:
+        tokens = estimate_tokens(*item)
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        yield batch
 
 # Function to send a sentiment analysis request to OpenAI
 def get_sentiment_analysis(symbol: str, title: str, article: str) -> Optional[SentimentAnswer]:
+    sentiment = cached_sentiment(symbol, title, article)
+    if sentiment:
+        return sentiment
     try:
-        # Create the user message based on the template
-        user_message = sentiment_template.format(symbol=symbol, title=title, article=article)
-        messages = [
-            {"role": "system", "content": "You are a financial news sentiment analysis assistant."},
-            {"role": "user", "content": user_message}
-        ]
-
-        # Request the sentiment from OpenAI and parse the structured response
-        completion = client.beta.chat.completions.parse(
-            model=OPENAI_MODEL,
-            messages=messages,
-            response_format=SentimentAnswer,
-        )
-
-        return completion.choices[0].message.parsed
+        sentiment = request_sentiment(symbol, title, article)
+        cache_sentiment(symbol, title, article, sentiment)
+        return sentiment
     except Exception as e:
         print(f"Error fetching sentiment analysis: {e}")
         return None
@@ -120,29 +321,65 @@ def article_exists(connection, uuid: str) -> bool:
         print(f"Error checking if entry exists: {e}")
         return False
 
-# SQL: Insert a new news article into the database
-def insert_ynews(row: pd.Series, connection, symbol: str):
-    uuid = row['uuid']
-    title = row['title']
-    description = row['description']
-    link = row['link']
-    news_ts = pd.to_datetime(row['est_time'])
-    trading_dt = td.get_trading_date(news_ts) #convert to correct trading date
-    news_type = row['type']
-    sentiment_score = row['score']
-    comment = row['comment']
+# UUIDs of articles already stored in ynews: warmed once at startup and updated on insert
+known_uuids = set()
+
+# SQL: Load the UUIDs of all stored articles into the known_uuids cache
+def load_known_uuids(connection):
+    global known_uuids
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT uuid FROM ynews;")
+            known_uuids = {row[0] for row in cursor.fetchall()}
+        print(f"Loaded known articles: {len(known_uuids)}")
+    except Exception as e:
+        print(f"Error loading known articles: {e}")
+
+# SQL: Return the UUIDs that are not in the database yet, using one query for the whole feed
+def filter_new_articles(connection, uuids) -> list:
+    candidates = [uuid for uuid in dict.fromkeys(uuids) if uuid not in known_uuids]
+    if not candidates:
+        return []
+
+    try:
+        with connection.cursor() as cursor:
+            placeholders = ', '.join(['%s'] * len(candidates))
+            sql = f"SELECT uuid FROM ynews WHERE uuid IN ({placeholders});"
+            cursor.execute(sql, tuple(candidates))
+            existing = {row[0] for row in cursor.fetchall()}
+    except Exception as e:
+        print(f"Error checking existing entries: {e}")
+        return candidates
+
+    known_uuids.update(existing)
+    return [uuid for uuid in candidates if uuid not in existing]
 
+# Build the ynews row values for a scored article
+def ynews_record(item: NewsItem, symbol: str) -> tuple:
+    news_ts = item.est_time
+    trading_dt = item.trading_dt
+    if trading_dt is None and news_ts is not None:
+        trading_dt = td.get_trading_date(news_ts) #convert to correct trading date
+
+    return (item.uuid, symbol, news_ts, trading_dt, item.title, item.link, item.description, item.type, item.score,
+            item.comment, OPENAI_MODEL)
+
+# SQL: Insert a new news article into the database
+def insert_ynews(item: NewsItem, connection, symbol: str):
     query = """
-    INSERT INTO ynews(uuid, symbol, news_ts, trading_dt, title, link, description, news_type, sentiment_score, comment)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    INSERT INTO ynews(uuid, symbol, news_ts, trading_dt, title, link, description, news_type, sentiment_score, comment,
+                      sentiment_model)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
     """
-    data = (uuid, symbol, news_ts, trading_dt, title, link, description, news_type, sentiment_score, comment)
-    
+    data = ynews_record(item, symbol)
+
     cursor = connection.cursor()
     try:
         cursor.execute(query, data)
+        refresh_days(cursor, touched_days([data]))
         connection.commit()
-    except mysql.connector.Error as err:
+        known_uuids.add(item.uuid)
+    except mysql_connector.Error as err:
         print(f"Error inserting news: {err}")
         connection.rollback()
     finally:
@@ -158,58 +395,356 @@ def utc_to_est(utc_time: datetime) -> str:
         print(f"Error converting Unix time: {e}")
         return None
 
-# Main: Establish connection to MySQL database
-def main():
-    try:
-        connection = mysql.connector.connect(
-            host='127.0.0.1',
-            user="moberc",
-            password="moberc",
-            database="investments",
-            auth_plugin="mysql_native_password"
-        )
-    except mysql.connector.Error as e:
-        print(f"Error connecting to MySQL: {e}")
+# Stage: keep the articles that are not in the database yet, checking the whole feed with one query
+def new_articles(items, connection):
+    items = list(items)
+    new_uuids = set(filter_new_articles(connection, [item.uuid for item in items]))
+    for item in items:
+        # skip if already processed (including articles stored earlier in this run)
+        if item.uuid not in new_uuids or item.uuid in known_uuids:
+            continue
+        new_uuids.discard(item.uuid)
+        yield item
+
+# Stage: group articles into scoring batches of the engine, keyed by the symbol and the batch's items
+def article_batches(items, symbol: str):
+    items_by_id = {}
+
+    def scoring_items():
+        for item in items:
+            items_by_id[item.uuid] = item
+            yield (item.uuid, symbol, item.title, item.description)
+
+    for batch in batch_articles(scoring_items()):
+        yield (symbol, [items_by_id.pop(uuid) for uuid, *_ in batch]), (batch,)
+
+# Stage: a scoring batch of the engine holding a single article
+def single_batch(item: NewsItem, symbol: str):
+    return (symbol, [item]), ([(item.uuid, symbol, item.title, item.description)],)
+
+# Stage: pass on the answers of scored batches. Articles a batched answer left out are scored again
+# one per request, through the engine, so each request is charged to the rate limits and retried
+# when rate limited.
+def score_batches(engine: ScoringEngine, scored):
+    singles = []
+    for (symbol, batch_items), answers in scored:
+        if len(batch_items) > 1:
+            singles.extend(single_batch(item, symbol) for item in batch_items if not answers.get(item.uuid))
+            batch_items = [item for item in batch_items if answers.get(item.uuid)]
+        yield (symbol, batch_items), answers
+    if singles:
+        yield from engine.score(singles)
+
+# Store one scored article, either directly or through the buffered writer
+def store_news(item: NewsItem, sentiment: SentimentAnswer, connection, symbol: str, writer: YnewsWriter = None):
+    item.set_sentiment(sentiment)
+
+    if writer is None:
+        insert_ynews(item, connection, symbol)
+    else:
+        writer.add(ynews_record(item, symbol))
+        known_uuids.add(item.uuid)
+
+# Store the answered items of a scored batch; unanswered items go to the engine's retry queue on their own
+def store_answers(items, answers: dict, connection, symbol: str, writer: YnewsWriter, engine: ScoringEngine):
+    for item in items:
+        sentiment = answers.get(item.uuid)
+        if sentiment:
+            store_news(item, sentiment, connection, symbol, writer)
+        else:
+            engine.retry_queue.append((*single_batch(item, symbol), None))
+
+# Queue: score claimed articles with the engine; failed articles are released for a later attempt
+def score_claimed(queue: WorkQueue, claimed, engine: ScoringEngine):
+    items_by_symbol = {}
+    for symbol, item in claimed:
+        items_by_symbol.setdefault(symbol, []).append(item)
+    for symbol, items in items_by_symbol.items():
+        cached, items_by_symbol[symbol] = split_cached(items, symbol)
+        queue.mark_scored(symbol, cached)
+    batches = (batch for symbol, items in items_by_symbol.items() for batch in article_batches(items, symbol))
+
+    for (symbol, batch_items), answers in score_batches(engine, engine.score(batches)):
+        answered = {item.uuid: answers[item.uuid] for item in batch_items if answers.get(item.uuid)}
+        queue.mark_scored(symbol, answered)
+        queue.release(symbol, [item.uuid for item in batch_items if item.uuid not in answered])
+    # The queue retries failed articles itself, across runs
+    for (symbol, batch_items), _, error in engine.retry_queue:
+        queue.release(symbol, [item.uuid for item in batch_items], error)
+    engine.retry_queue.clear()
+
+# Queue: write claimed scored articles to ynews; they are marked stored once the writer committed them
+def store_scored(queue: WorkQueue, writer: YnewsWriter) -> int:
+    claimed = queue.claim_scored()
+    for symbol, item in claimed:
+        writer.add(ynews_record(item, symbol))
+        known_uuids.add(item.uuid)
+    writer.flush()
+    if writer.buffer:
+        # Not written: the rows are claimed again once their lease expires
+        return 0
+    return queue.mark_stored((symbol, item.uuid) for symbol, item in claimed)
+
+# Queue: score and store queued articles until none are left that can be claimed.
+# Returns the number of articles stored.
+def drain_queue(queue: WorkQueue, writer: YnewsWriter, engine: ScoringEngine) -> int:
+    stored = 0
+    while True:
+        claimed = queue.claim_scoring(SCORING_BATCH_SIZE * SCORING_WORKERS)
+        if claimed:
+            score_claimed(queue, claimed, engine)
+        stored_now = store_scored(queue, writer)
+        stored += stored_now
+        if not claimed and not stored_now:
+            return stored
+
+# Score and store the articles of one feed that are not in the database yet.
+# With a writer, rows are buffered and written in batches instead of one commit per article.
+# With an engine, articles are scored concurrently and failures are kept on its retry queue.
+# With a work queue, articles are queued durably first and scored and stored from the queue.
+# Returns the number of new articles.
+def process_news(items, connection, symbol: str, writer: YnewsWriter = None, engine: ScoringEngine = None,
+                 queue: WorkQueue = None) -> int:
+    items = list(new_articles(items, connection))
+
+    if queue is not None:
+        # Articles an earlier poll already queued are not new arrivals
+        added = queue.enqueue(symbol, items)
+        drain_queue(queue, writer, engine)
+        return added
+
+    if engine is None:
+        for item in items:
+            sentiment = get_sentiment_analysis(symbol, item.title, item.description)
+            if sentiment:
+                store_news(item, sentiment, connection, symbol, writer)
+    else:
+        cached, misses = split_cached(items, symbol)
+        for item in items:
+            if item.uuid in cached:
+                store_news(item, cached[item.uuid], connection, symbol, writer)
+        for (symbol, batch_items), answers in score_batches(engine, engine.score(article_batches(misses, symbol))):
+            store_answers(batch_items, answers, connection, symbol, writer, engine)
+
+    if writer is not None:
+        writer.flush()
+    return len(items)
+
+# Process fetched feeds as they arrive; each unique article is fanned out to the tickers of its batch.
+# Returns the number of new articles per ticker. Tickers whose feed or articles could not be processed
+# are left out, so that a failure is not taken for a poll without news.
+def process_feeds(results, connection, feed_cache: FeedCache, writer: YnewsWriter, engine: ScoringEngine,
+                  queue: WorkQueue = None) -> dict:
+    new_counts = {}
+    for result in results:
+        symbols = result.key.split(',')
+        failed = len(engine.retry_queue)
+
+        if result.error is not None:
+            print(f"\nError fetching news for {result.key}: {result.error}")
+            continue
+        if result.status == 304:
+            print(f"\nNo new news for {result.key}.")
+            new_counts.update(dict.fromkeys(symbols, 0))
+            continue
+        if result.feed.bozo:
+            print(f"\nFailed to parse the RSS feed for {result.key}.")
+            continue
+
+        entries_by_symbol = fan_out_entries(result.feed.entries, symbols)
+        complete = True
+        for symbol in symbols:
+            print(f"\nProcessing {symbol}")
+
+            try:
+                data = news_from_entries(entries_by_symbol[symbol])
+                if data is None:
+                    print(f"No news available for {symbol}.")
+                    new_counts[symbol] = 0
+                    continue
+                for item in data:
+                    print(f"{item.est_time}  {item.title}")
+            except Exception as e:
+                print(f"Error fetching news for {symbol}: {e}")
+                complete = False
+                continue
+
+            try:
+                new_counts[symbol] = process_news(data, connection, symbol, writer, engine, queue)
+            except Exception as e:
+                print(f"Error processing news for {symbol}: {e}")
+                complete = False
+
+        # Only remember the validators once the feed's articles have been stored
+        if complete and not writer.buffer and len(engine.retry_queue) == failed:
+            feed_cache.update(result.key, result.etag, result.modified)
+    return new_counts
+
+# Give articles that failed scoring another chance; those failing again stay on the retry queue
+def retry_failed_scores(connection, writer: YnewsWriter, engine: ScoringEngine):
+    if not engine.retry_queue:
         return
+    print(f"\nRetrying {len(engine.retry_queue)} failed scoring requests")
+    for (symbol, batch_items), answers in score_batches(engine, engine.retry_failed()):
+        store_answers(batch_items, answers, connection, symbol, writer, engine)
+    writer.flush()
 
-    # Process news for each stock symbol
-    for symbol in tickers:
-        print(f"\nProcessing {symbol}")
+# Daemon mode: poll each ticker at the adaptive interval of the scheduler until `stop` is set.
+# Waiting happens on the stop event, so a shutdown request interrupts the wait right away.
+# With a coordinator, the polled tickers follow the shards it holds.
+def run_daemon(connection, feed_cache: FeedCache, writer: YnewsWriter, engine: ScoringEngine,
+               stop: threading.Event, scheduler: PollScheduler = None, fetch=iter_feeds, queue: WorkQueue = None,
+               symbols=None, coordinator: ShardCoordinator = None):
+    if scheduler is None:
+        symbols = coordinator.symbols() if coordinator is not None else symbols or tickers
+        scheduler = PollScheduler(symbols, DAEMON_MIN_INTERVAL, DAEMON_MAX_INTERVAL)
+    while not stop.is_set():
+        due = scheduler.next_due()
+        wait = DAEMON_MAX_INTERVAL if due is None else max(0.0, due - scheduler.clock())
+        if coordinator is not None:
+            # Pick up shards taken over from other workers or handed to them
+            wait = min(wait, coordinator.lease_seconds / 3)
+        if stop.wait(wait):
+            break
+        if coordinator is not None:
+            try:
+                scheduler.set_symbols(coordinator.symbols())
+            except Exception as e:
+                print(f"\nError refreshing the held shards: {e}")
+        symbols = scheduler.pop_due()
+        if not symbols:
+            continue
 
+        # One failed cycle (e.g. a lost database connection) must not end the daemon
+        new_counts = {}
         try:
-            data = get_news(symbol)
-            if data is None:
-                print(f"No news available for {symbol}.")
-                continue
-            data['est_time'] = data['publication date'].apply(utc_to_est)
-            print(data[['title', 'est_time']])
+            urls = {batch: news_url(batch) for batch in batch_symbols(symbols, FETCH_BATCH_SIZE)}
+            new_counts = process_feeds(fetch(urls, feed_cache, FETCH_CONCURRENCY, FETCH_TIMEOUT),
+                                       connection, feed_cache, writer, engine, queue)
+            if queue is not None:
+                # Articles whose retry backoff has passed
+                drain_queue(queue, writer, engine)
+            retry_failed_scores(connection, writer, engine)
+            feed_cache.save()
         except Exception as e:
-            print(f"Error fetching news for {symbol}: {e}")
-            continue
+            print(f"\nError in polling cycle: {e}")
 
-        data['score'] = None
-        data['type'] = None
-        data['comment'] = None
+        # Tickers that failed are polled again without changing their arrival rate
+        for symbol in symbols:
+            scheduler.record(symbol, new_counts.get(symbol))
+        next_poll = datetime.datetime.fromtimestamp(scheduler.next_due() or scheduler.clock()).strftime('%H:%M:%S')
+        print(f"\nPolled {len(symbols)} tickers, {sum(new_counts.values())} new articles; next poll at {next_poll}")
 
-        for index, row in data.iterrows():
-            uuid = row['uuid']
-            title = row['title']
-            article = row['description']
+# Add the ynews columns of newer versions to an existing table; False if the table cannot be written to
+def migrate_ynews(connection):
+    try:
+        if add_sentiment_model_column(connection):
+            print("Added the sentiment_model column to ynews")
+        return True
+    except mysql_connector.Error as e:
+        print(f"Error adding the sentiment_model column to ynews: {e}\n"
+              "Add it with: ALTER TABLE ynews ADD COLUMN sentiment_model VARCHAR(128)")
+        return False
 
-            # skip if already processed
-            if article_exists(connection, uuid):
-                continue
+# Main: Establish connection to MySQL database
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch, score and store the news of the configured tickers")
+    parser.add_argument('--daemon', action='store_true',
+                        help="keep running and poll each ticker at an adaptive interval until interrupted")
+    parser.add_argument('--drain', action='store_true',
+                        help="only score and store the queued articles; several processes may drain at once")
+    parser.add_argument('--shards', action='store_true',
+                        help="split the registered tickers with the other workers started with --shards")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="give the queued articles that failed scoring another round of attempts")
+    args = parser.parse_args(argv)
 
-            sentiment = get_sentiment_analysis(symbol, title, article)
-            if sentiment:
-                row['score'] = sentiment.score
-                row['type'] = sentiment.type
-                row['comment'] = sentiment.comment
+    try:
+        connection = db.get_pool().acquire()
+    except mysql_connector.Error as e:
+        print(f"Error connecting to MySQL: {e}")
+        return 1
+    if not migrate_ynews(connection):
+        connection.close()
+        return 1
+
+    load_known_uuids(connection)
+    try:
+        create_ynews_daily(connection)
+    except mysql_connector.Error as e:
+        print(f"Error creating the daily news aggregate: {e}")
 
-                insert_ynews(row, connection, symbol)
+    # The registry holds the tickers to fetch; the configured list is registered on every start
+    try:
+        symbols = seed_registry(connection, tickers)
+    except mysql_connector.Error as e:
+        print(f"Error reading the ticker registry: {e}")
+        symbols = tickers
+    coordinator = None
+    if args.shards:
+        coordinator = ShardCoordinator(db.get_pool().acquire(), lease_seconds=SHARD_LEASE_SECONDS)
+
+    global sentiment_cache
+    sentiment_cache = SentimentCache(SENTIMENT_CACHE_PATH, ttl_days=SENTIMENT_CACHE_TTL_DAYS)
+
+    # Fetch all feeds concurrently and process each one as soon as it arrives.
+    # Symbols are requested in batches and each unique article is fanned out to its tickers.
+    feed_cache = FeedCache(FEED_CACHE_PATH)
+    writer = YnewsWriter(connection)
+    engine = ScoringEngine(score_articles, SCORING_WORKERS, OPENAI_RPM, OPENAI_TPM)
+    queue = WorkQueue(WORK_QUEUE_PATH, WORK_QUEUE_LEASE_SECONDS, WORK_QUEUE_MAX_ATTEMPTS)
+    try:
+        # Resume with the articles an earlier run queued but did not store
+        reclaimed = queue.reclaim()
+        if reclaimed:
+            print(f"Reclaimed queued articles of stopped workers: {reclaimed}")
+        if args.retry_failed:
+            print(f"Requeued failed articles: {queue.requeue_failed()}")
+        if queue.pending():
+            print(f"Resuming queued articles: {queue.counts()}")
+            drain_queue(queue, writer, engine)
+
+        if args.daemon:
+            # SIGINT/SIGTERM finish the current poll, then shut down
+            stop = threading.Event()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: stop.set())
+            if coordinator is not None:
+                coordinator.start()
+            run_daemon(connection, feed_cache, writer, engine, stop, queue=queue, symbols=symbols,
+                       coordinator=coordinator)
+        elif not args.drain:
+            rounds = [symbols]
+            if coordinator is not None:
+                print(f"Shards: {sorted(coordinator.join(SHARD_SETTLE_SECONDS))}")
+                coordinator.start()
+                # Shards taken over during the run are fetched in further rounds
+                rounds = coordinator.symbol_rounds()
+            for round_symbols in rounds:
+                urls = {batch: news_url(batch) for batch in batch_symbols(round_symbols, FETCH_BATCH_SIZE)}
+                process_feeds(iter_feeds(urls, feed_cache, FETCH_CONCURRENCY, FETCH_TIMEOUT),
+                              connection, feed_cache, writer, engine, queue)
+
+        # Give articles that failed scoring another chance before giving up on this run
+        retry_failed_scores(connection, writer, engine)
+        for (symbol, batch_items), _, error in engine.retry_queue:
+            for item in batch_items:
+                print(f"Could not score {item.uuid} for {symbol}: {error}")
+        print(f"Work queue: {queue.counts()}")
+    finally:
+        if coordinator is not None:
+            coordinator.stop()
+            coordinator.connection.close()
+        writer.close()
+        queue.purge(WORK_QUEUE_RETENTION_DAYS)
+        queue.close()
+        feed_cache.save()
+        print(f"Sentiment cache: {sentiment_cache.stats()}")
+        sentiment_cache.close()
+        sentiment_cache = None
 
     # Close DB connection
     connection.close()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,245 +1,168 @@
-import pymysql
+import argparse
+import atexit
+import os
 import math
-from datetime import datetime
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
 from decimal import Decimal
-import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import r2_score
-import statsmodels.api as sm
+from utils import db
+from utils.lazy import lazy_import
+from utils.event_regression import fit_event_regressions
+from utils.price_series_cache import price_cache
+from utils.ynews_daily import REBUILD_HINT, StaleAggregateError, symbols_missing_daily
 
-def get_prev_business_dt(symbol, trading_dt, db_connection):
-    """
-    Fetch the previous business day for a given symbol and trading date.
-    """
-    if isinstance(trading_dt, str):
-        trading_dt = datetime.strptime(trading_dt, '%Y-%m-%d')
-    
-    query = """
-        SELECT max(close_dt)
-        FROM stock_price
-        WHERE symbol = %s AND close_dt < %s
-    """
+pd = lazy_import('pandas')
 
-    with db_connection.cursor() as cursor:
-        cursor.execute(query, (symbol, trading_dt))
-        prev_dt = cursor.fetchone()
-        
-        if prev_dt is None or len(prev_dt) == 0:
-            raise ValueError(f"Not enough data to calculate price change for {symbol} around {trading_dt}")
-    
-    return prev_dt[0]
-
-
-def get_stock_price_change(symbol, trading_dt, db_connection):
-    """
-    Get stock price changes for a given symbol and trading date.
-    """
-    prev_dt = get_prev_business_dt(symbol, trading_dt, db_connection)
-    
-    query = """
-        SELECT adj_close_price
-        FROM stock_price
-        WHERE symbol = %s AND close_dt >= %s
-        ORDER BY close_dt ASC
-        LIMIT 6;
+def build_event_returns(news_items, stock_series, index_series):
     """
+    Join aggregated news scores with the stock and index price changes around each news day.
 
-    with db_connection.cursor() as cursor:
-        cursor.execute(query, (symbol, prev_dt))
-        rows = cursor.fetchall()
-
-        if len(rows) < 6:
-            return None  # not enough data
-
-        adj_close_prices = [row[0] for row in rows]
-        previous_price = adj_close_prices[0]
-
-        price_changes = [
-            np.log(float(adj_close_prices[i] / previous_price))
-            for i in range(1, len(adj_close_prices))
-        ]
+    :param news_items: Rows of (symbol, trading_dt, min_score, max_score)
+    :param stock_series: PriceSeries of the stock
+    :param index_series: PriceSeries of the market index
+    :return: List of 15-column rows as produced by process_ticker
+    """
+    if not news_items:
+        return []
 
-        """ price_changes = [
-            round(100 * (adj_close_prices[i] - previous_price) / previous_price, 4)
-            for i in range(1, len(adj_close_prices))
-        ] """
+    event_dates = [news[1] for news in news_items]
+    valid, price, changes = stock_series.event_changes(event_dates)
+    index_valid, _, index_changes = index_series.event_changes(event_dates)
 
-    return adj_close_prices, price_changes
+    data = []
+    for i in np.flatnonzero(valid & index_valid):
+        symbol, trading_dt, min_score, max_score = news_items[i]
+        data.append([symbol, trading_dt, min_score, max_score, price[i], *changes[i], *index_changes[i]])
+    return data
 
-def process_ticker(symbol, connection, tsx_symbol):
+def process_ticker(symbol, connection, tsx_symbol, cache=price_cache, index_series=None):
     """
     Process a single ticker and fetch the necessary stock price and news data.
+    Price series come from the process's cache; pool workers get the index series
+    from the parent instead (see analyze_tickers), so it is loaded once per run.
     """
-    data = []
+    # Daily aggregate maintained by the ynews writer; days with only 'fs' rows have no stories
     query = """
-        SELECT symbol, trading_dt, 
-        COALESCE(MIN(CASE WHEN sentiment_score < 0 THEN sentiment_score END), 0) AS min_score,
-        COALESCE(MAX(CASE WHEN sentiment_score > 0 THEN sentiment_score END), 0) AS max_score 
-        FROM ynews
-        WHERE symbol = %s AND news_type <> 'fs'
-        GROUP BY symbol, trading_dt
-        ORDER BY symbol, trading_dt
+        SELECT symbol, trading_dt,
+        LEAST(COALESCE(min_score, 0), 0) AS min_score,
+        GREATEST(COALESCE(max_score, 0), 0) AS max_score
+        FROM ynews_daily
+        WHERE symbol = %s AND news_count > 0
+        ORDER BY trading_dt
     """
     
     to_symbol = f"{symbol}.TO" if not symbol.endswith('.TO') else symbol
 
-    with connection.cursor() as cursor:
-        cursor.execute(query, (symbol,))
-        news_items = cursor.fetchall()
-
-        for news in news_items:
-            symbol, trading_dt, min_score, max_score = news
-            result = get_stock_price_change(to_symbol, trading_dt, connection)
-            
-            if result is None:
-                continue
-
-            adj_close_prices, price_changes = result
-            tsx_result = get_stock_price_change(tsx_symbol, trading_dt, connection)
+    news_items = db.fetch_all(connection, query, (symbol,))
 
-            if tsx_result is None:
-                continue
+    if not news_items:
+        if symbols_missing_daily(connection, [symbol]):
+            raise StaleAggregateError(f"ynews_daily is incomplete for {symbol}; {REBUILD_HINT}")
+        return []
 
-            tsx_adj_close_prices, tsx_price_changes = tsx_result
-            data.append([
-                symbol, trading_dt, min_score, max_score, adj_close_prices[1],
-                price_changes[0], price_changes[1], price_changes[2], price_changes[3], price_changes[4],
-                tsx_price_changes[0], tsx_price_changes[1], tsx_price_changes[2], tsx_price_changes[3], tsx_price_changes[4]
-            ])
+    stock_series = cache.get(to_symbol, connection)
+    if index_series is None:
+        index_series = cache.get(tsx_symbol, connection)
+    return build_event_returns(news_items, stock_series, index_series)
 
-    return data
-
-def fit_OLS(data):
-    """
-    Fit an OLS model to the data and print a summary of the results.
-    """
-    # Convert data to DataFrame
-    df = pd.DataFrame(data, columns=['symbol', 'trading_dt', 'min_score', 'max_score',
-    'price', 'price_change', 't1_price_change', 't2_price_change', 't3_price_change', 't4_price_change',
-    'tsx_price_change', 'tsx_t1_price_change', 'tsx_t2_price_change', 'tsx_t3_price_change', 'tsx_t4_price_change'
-    ])
-
-    # Ensure that numeric columns are in the correct format
-    df['price_change'] = pd.to_numeric(df['price_change'], errors='coerce')
-    df['tsx_price_change'] = pd.to_numeric(df['tsx_price_change'], errors='coerce')
-
-    # Drop any rows with missing values (optional, if applicable)
-    df = df.dropna()
-
-    # Define independent variables  
-    X = df[['min_score', 'max_score', 'tsx_price_change']]
-    y = df['price_change']
-
-    # Split the data into training and testing sets (80% train, 20% test)
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-    # Fit the linear regression model using statsmodels to get coefficient significance
-    model = sm.OLS(y_train, X_train).fit()
-
-    # Get the predictions
-    y_pred = model.predict(X_test)
-
-    # Evaluate the model performance using r-squared
-    r2 = r2_score(y_test, y_pred)
-    print(f"R-squared on test data: {r2}")
+# List of stock tickers to analyze
+TICKERS = ['AQN', 'FC.TO', 'BCE', 'PAAS', 'ENB', 'CM', 'BMO', 'TD', 'RY', 'MFC', 'BNS', 'CP', 'TRI', 'SU', 'AEM', 'L.TO']
+TSX = '^GSPTSE'
 
-    # Print the full statistical summary of the model
-    print(model.summary())
-
-def F_test(data):
+def news_symbols(connection):
     """
-    Fit an OLS model to the data and determine score impact.
+    All symbols of the daily news aggregate, for running the analysis over the whole universe.
     """
-    # Convert data to DataFrame
-    df = pd.DataFrame(data, columns=['symbol', 'trading_dt', 'min_score', 'max_score',
-    'price', 'price_change', 't1_price_change', 't2_price_change', 't3_price_change', 't4_price_change',
-    'tsx_price_change', 'tsx_t1_price_change', 'tsx_t2_price_change', 'tsx_t3_price_change', 'tsx_t4_price_change'
-    ])
-
-    # Ensure that numeric columns are in the correct format
-    df['price_change'] = pd.to_numeric(df['price_change'], errors='coerce')
-    df['tsx_price_change'] = pd.to_numeric(df['tsx_price_change'], errors='coerce')
-
-    # Drop any rows with missing values (optional, if applicable)
-    df = df.dropna()
-
-    # Define independent variables  
-    X = df[['min_score', 'max_score', 'tsx_price_change']]
-    y = df['price_change']
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT DISTINCT symbol FROM ynews_daily ORDER BY symbol")
+        return [row[0] for row in cursor.fetchall()]
 
-    # Fit a reduced model (without `min_score` and `max_score`)
-    reduced_model = sm.OLS(y, df['tsx_price_change']).fit()
+# Connection and index series of a pool worker process, set once by init_worker
+worker_connection = None
+worker_index_series = None
 
-    # Fit a full model (with `min_score` and `max_score`)
-    full_model = sm.OLS(y, X).fit()
+def init_worker(connect, index_series=None):
+    global worker_connection, worker_index_series
+    worker_connection = connect()
+    worker_index_series = index_series
+    atexit.register(worker_connection.close)
 
-    # Perform an F-test
-    f_test_result = full_model.compare_f_test(reduced_model)
-    print("F-Test result for min and max scores:", f_test_result)
+def process_ticker_in_worker(symbol, tsx_symbol):
+    return process_ticker(symbol, worker_connection, tsx_symbol, price_cache, worker_index_series)
 
-def fit_OLS(data):
-    """
-    Fit an OLS model to the data and print a summary of the results.
-    """
-    # Convert data to DataFrame
-    df = pd.DataFrame(data, columns=['symbol', 'trading_dt', 'min_score', 'max_score',
-    'price', 'price_change', 't1_price_change', 't2_price_change', 't3_price_change', 't4_price_change',
-    'tsx_price_change', 'tsx_t1_price_change', 'tsx_t2_price_change', 'tsx_t3_price_change', 'tsx_t4_price_change'
-    ])
-
-    # Ensure that numeric columns are in the correct format
-    df['price_change'] = pd.to_numeric(df['price_change'], errors='coerce')
-    df['tsx_price_change'] = pd.to_numeric(df['tsx_price_change'], errors='coerce')
-
-    # Drop any rows with missing values (optional, if applicable)
-    df = df.dropna()
-
-    # Define independent variables  
-    X = df[['min_score', 'max_score', 'tsx_price_change']]
-    y = df['price_change']
-
-    # Split the data into training and testing sets (80% train, 20% test)
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-    # Fit the linear regression model using statsmodels to get coefficient significance
-    model = sm.OLS(y_train, X_train).fit()
-
-    # Get the predictions
-    y_pred = model.predict(X_test)
-
-    # Evaluate the model performance using r-squared
-    r2 = r2_score(y_test, y_pred)
-    print(f"R-squared on test data: {r2}")
-
-    # Print the full statistical summary of the model
-    print(model.summary())
-
-def main():
-    # Database connection details
-    db_config = {
-        'database': 'investments',
-        'user': 'moberc',
-        'password': 'moberc',
-        'host': 'localhost',
-        'port': 3306
-    }
-
-    # List of stock tickers to analyze
-    tickers = ['AQN', 'FC.TO', 'BCE', 'PAAS', 'ENB', 'CM', 'BMO', 'TD', 'RY', 'MFC', 'BNS', 'CP', 'TRI', 'SU', 'AEM', 'L.TO']
-    TSX = '^GSPTSE'
-
-    with pymysql.connect(**db_config) as connection:
+def analyze_serial(tickers, tsx_symbol, connect=db.worker_connection):
+    results = {}
+    with connect() as connection:
         for symbol in tickers:
             print(f"Processing {symbol}")
+            results[symbol] = process_ticker(symbol, connection, tsx_symbol)
+    return results
 
-            data = process_ticker(symbol, connection, TSX)
+def analyze_tickers(tickers, tsx_symbol=TSX, workers=None, connect=db.worker_connection):
+    """
+    Build the event rows of many tickers, spread over a pool of worker processes
+    with one database connection each. The index series is loaded once in this
+    process and handed to the workers when they start.
+
+    :param tickers: Symbols to process
+    :param workers: Number of worker processes (defaults to the CPU count); 1 runs serially
+    :param connect: Connection factory, called once in each worker (defaults to a checkout
+                    of the worker's connection pool)
+    :return: Event rows of all tickers, in the order of `tickers` whatever the worker scheduling
+    """
+    workers = min(workers or os.cpu_count() or 1, len(tickers))
+    results = None
+    if workers > 1:
+        try:
+            with connect() as connection:
+                index_series = price_cache.get(tsx_symbol, connection)
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(connect, index_series)) as executor:
+                processed = executor.map(process_ticker_in_worker, tickers, [tsx_symbol] * len(tickers))
+                results = dict(zip(tickers, processed))
+        except (BrokenProcessPool, OSError) as e:
+            print(f"Process pool failed ({e}), processing tickers serially")
+
+    if results is None:
+        results = analyze_serial(tickers, tsx_symbol, connect)
 
-            if data:
-                F_test(data)
-                fit_OLS(data)
+    data = []
+    for symbol in tickers:
+        data.extend(results[symbol])
+    return data
 
-            print()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regress price changes on news sentiment scores")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: CPU count, 1 to run serially)")
+    parser.add_argument('--all', action='store_true', help="analyze every symbol of the ynews_daily aggregate")
+    args = parser.parse_args(argv)
+
+    tickers = TICKERS
+    try:
+        with db.get_pool().connection() as connection:
+            if args.all:
+                tickers = [symbol for symbol in news_symbols(connection) if symbol != TSX]
+            # The analysis reads ynews_daily only; stories missing from it would be dropped silently
+            missing = symbols_missing_daily(connection, tickers)
+    except Exception as e:
+        print(f"Error reading the daily news aggregate ({e}); {REBUILD_HINT}")
+        return 1
+    if missing:
+        print(f"ynews_daily is incomplete for {', '.join(missing)}; {REBUILD_HINT}")
+        return 1
+
+    try:
+        data = analyze_tickers(tickers, workers=args.workers)
+    except StaleAggregateError as e:
+        print(e)
+        return 1
+
+    results = fit_event_regressions(data)
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(results)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
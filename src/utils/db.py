@@ -0,0 +1,264 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from utils.lazy import lazy_import
+
+mysql_connector = lazy_import('mysql.connector')
+
+
+def db_config() -> dict:
+    """
+    Connection settings of the investments database, overridable through the environment.
+    """
+    return {
+        'host': os.environ.get('DB_HOST', '127.0.0.1'),
+        'port': int(os.environ.get('DB_PORT', '3306')),
+        'user': os.environ.get('DB_USER', 'moberc'),
+        'password': os.environ.get('DB_PASSWORD', 'moberc'),
+        'database': os.environ.get('DB_NAME', 'investments'),
+        'auth_plugin': os.environ.get('DB_AUTH_PLUGIN', 'mysql_native_password'),
+    }
+
+
+def pool_settings() -> dict:
+    """
+    Pool size, checkout timeout (seconds) and connection recycle age (seconds) from the environment.
+    """
+    return {
+        'size': int(os.environ.get('DB_POOL_SIZE', '8')),
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '30')),
+        'recycle': float(os.environ.get('DB_POOL_RECYCLE', '3600')),
+    }
+
+
+def connect(**overrides):
+    """
+    Open a new, unpooled connection to the investments database.
+    """
+    return mysql_connector.connect(**{**db_config(), **overrides})
+
+
+# Prepared statements kept open per physical connection; the least recently used one is closed
+# beyond that, so queries with a varying number of placeholders cannot exhaust max_prepared_stmt_count
+MAX_PREPARED_STATEMENTS = 32
+
+
+class _PoolEntry:
+    """
+    A physical connection with its creation time and prepared statements, kept across checkouts.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created = time.monotonic()
+        self.statements = OrderedDict()
+
+    def close(self):
+        for cursor in self.statements.values():
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        self.statements.clear()
+        try:
+            self.raw.close()
+        except Exception:
+            pass
+
+
+class PooledConnection:
+    """
+    A connection checked out of a ConnectionPool. Behaves like the underlying
+    DB-API connection; `close` (or leaving a `with` block) returns it to the pool.
+    """
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+
+    def _checked_out(self):
+        if self._entry is None:
+            raise mysql_connector.errors.PoolError("Connection was returned to the pool")
+        return self._entry
+
+    def __getattr__(self, name):
+        return getattr(self._checked_out().raw, name)
+
+    def prepared(self, query):
+        """
+        Prepared cursor for a query, prepared once per physical connection and reused
+        by later checkouts while it is among the MAX_PREPARED_STATEMENTS most recently
+        used. The cursor belongs to the pool and must not be closed.
+        """
+        entry = self._checked_out()
+        cursor = entry.statements.get(query)
+        if cursor is not None:
+            entry.statements.move_to_end(query)
+            return cursor
+        cursor = entry.raw.cursor(prepared=True)
+        entry.statements[query] = cursor
+        while len(entry.statements) > MAX_PREPARED_STATEMENTS:
+            _, evicted = entry.statements.popitem(last=False)
+            try:
+                evicted.close()
+            except Exception:
+                pass
+        return cursor
+
+    def close(self):
+        if self._entry is not None:
+            entry, self._entry = self._entry, None
+            self._pool.release(entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of MySQL connections shared by the threads of one process.
+
+    At most `size` connections are checked out at a time; `acquire` waits up to
+    `timeout` seconds for one to be returned. Connections older than `recycle`
+    seconds are closed and replaced at checkout. Worker threads that need a
+    connection for their whole lifetime use `worker_connection`, which checks
+    out one connection per thread.
+    """
+
+    def __init__(self, size=None, timeout=None, recycle=None, connect=connect):
+        """
+        :param size: Maximum number of connections (default DB_POOL_SIZE)
+        :param timeout: Seconds to wait for a free connection (default DB_POOL_TIMEOUT)
+        :param recycle: Maximum connection age in seconds (default DB_POOL_RECYCLE)
+        :param connect: Function opening a new connection
+        """
+        settings = pool_settings()
+        self.size = size or settings['size']
+        self.timeout = timeout if timeout is not None else settings['timeout']
+        self.recycle = recycle if recycle is not None else settings['recycle']
+        self.connect = connect
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(self.size)
+        self.workers = threading.local()
+        self.opened = 0
+
+    def acquire(self) -> PooledConnection:
+        if not self.slots.acquire(timeout=self.timeout):
+            raise mysql_connector.errors.PoolError(f"No database connection available within {self.timeout} seconds")
+        try:
+            return PooledConnection(self, self._checkout())
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def _checkout(self):
+        while True:
+            try:
+                entry = self.idle.get_nowait()
+            except queue.Empty:
+                entry = _PoolEntry(self.connect())
+                self.opened += 1
+                return entry
+            if time.monotonic() - entry.created < self.recycle:
+                return entry
+            entry.close()
+
+    def release(self, entry):
+        try:
+            # Do not hand an open transaction to the next user
+            entry.raw.rollback()
+            self.idle.put(entry)
+        except Exception:
+            entry.close()
+        finally:
+            self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def worker_connection(self) -> PooledConnection:
+        """
+        The connection of the calling thread, checked out on first use.
+        """
+        connection = getattr(self.workers, 'connection', None)
+        if connection is None or connection._entry is None:
+            connection = self.acquire()
+            self.workers.connection = connection
+        return connection
+
+    def release_worker(self):
+        connection = getattr(self.workers, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.workers.connection = None
+
+    def close(self):
+        """
+        Close the idle connections; checked out connections are closed when returned.
+        """
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# Shared pool of this process; worker processes get their own
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ConnectionPool()
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def worker_connection() -> PooledConnection:
+    """
+    The calling thread's connection from the pool of this process, checked out on
+    first use. Worker processes use it as their connection factory, so each one holds
+    a connection of its own pool and keeps its prepared statements.
+    """
+    return get_pool().worker_connection()
+
+
+def fetch_all(connection, query, params=()):
+    """
+    Run a query and return all rows, through the connection's prepared statement
+    for the query when it is a pooled connection.
+    """
+    if isinstance(connection, PooledConnection):
+        cursor = connection.prepared(query)
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+def is_sqlite(connection) -> bool:
+    return isinstance(connection, sqlite3.Connection)
+
+
+def adapt_query(connection, query):
+    """
+    Queries are written with MySQL's %s placeholders; SQLite connections get ? placeholders.
+    """
+    return query.replace('%s', '?') if is_sqlite(connection) else query
@@ -0,0 +1,214 @@
+import numpy as np
+from utils.lazy import lazy_import
+
+pd = lazy_import('pandas')
+stats = lazy_import('scipy.stats')
+
+# Columns of the rows built by process_ticker
+EVENT_COLUMNS = ['symbol', 'trading_dt', 'min_score', 'max_score',
+    'price', 'price_change', 't1_price_change', 't2_price_change', 't3_price_change', 't4_price_change',
+    'tsx_price_change', 'tsx_t1_price_change', 'tsx_t2_price_change', 'tsx_t3_price_change', 'tsx_t4_price_change'
+]
+STOCK_CHANGES = ['price_change', 't1_price_change', 't2_price_change', 't3_price_change', 't4_price_change']
+INDEX_CHANGES = ['tsx_price_change', 'tsx_t1_price_change', 'tsx_t2_price_change', 'tsx_t3_price_change', 'tsx_t4_price_change']
+TERMS = ['min_score', 'max_score', 'tsx_price_change']
+
+# The news terms tested by the nested-model F-test; the reduced model keeps the index change only
+NEWS_TERMS = [0, 1]
+
+
+def event_frame(data):
+    """
+    Convert process_ticker rows to a DataFrame with numeric model columns and no missing values.
+    """
+    df = pd.DataFrame(data, columns=EVENT_COLUMNS)
+    numeric = ['min_score', 'max_score'] + STOCK_CHANGES + INDEX_CHANGES
+    df[numeric] = df[numeric].apply(pd.to_numeric, errors='coerce').astype(float)
+    return df.dropna(subset=numeric).reset_index(drop=True)
+
+
+def normal_equations(X, Y, W):
+    """
+    Weighted cross products of a batch of regressions.
+
+    :param X: Design matrices, shape (groups, rows, terms)
+    :param Y: Responses, shape (groups, rows)
+    :param W: Row weights (1 to use a row, 0 to skip padding or held-out rows), shape (groups, rows)
+    :return: (X'WX, X'Wy, y'Wy, number of rows) per group
+    """
+    XtX = np.einsum('gni,gn,gnj->gij', X, W, X)
+    Xty = np.einsum('gni,gn,gn->gi', X, W, Y)
+    yty = np.einsum('gn,gn,gn->g', Y, W, Y)
+    return XtX, Xty, yty, W.sum(axis=1)
+
+
+def solve_ols(XtX, Xty, yty, nobs, terms=None):
+    """
+    Solve a batch of OLS problems from their normal equations. `terms` selects a
+    subset of the columns, so nested models reuse the same cross products.
+
+    :return: dict of coef, std_err, t_value, p_value (groups x terms) and rss, df_resid (groups)
+    """
+    if terms is not None:
+        XtX = XtX[:, terms][:, :, terms]
+        Xty = Xty[:, terms]
+
+    k = XtX.shape[1]
+    inv = np.linalg.pinv(XtX)
+    coef = np.einsum('gij,gj->gi', inv, Xty)
+    rss = np.maximum(yty - np.einsum('gi,gi->g', coef, Xty), 0.0)
+    df_resid = nobs - k
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma2 = rss / df_resid
+        std_err = np.sqrt(sigma2[:, None] * np.diagonal(inv, axis1=1, axis2=2))
+        t_value = coef / std_err
+    p_value = 2 * stats.t.sf(np.abs(t_value), df_resid[:, None])
+    return {'coef': coef, 'std_err': std_err, 't_value': t_value, 'p_value': p_value,
+            'rss': rss, 'df_resid': df_resid}
+
+
+def f_test(full, reduced):
+    """
+    F-test of a full model against a nested reduced model, per group.
+    """
+    df_num = np.asarray(reduced['df_resid'] - full['df_resid'], dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f_stat = ((reduced['rss'] - full['rss']) / df_num) / (full['rss'] / full['df_resid'])
+    return f_stat, stats.f.sf(f_stat, df_num, full['df_resid'])
+
+
+def split_weights(group_sizes, width, test_size=0.2, random_state=42):
+    """
+    Train/test row weights per group, using the same split as train_test_split on each group.
+    """
+    # Importing sklearn takes over a second, so only do it when a split is needed
+    from sklearn.model_selection import train_test_split
+
+    train = np.zeros((len(group_sizes), width))
+    test = np.zeros((len(group_sizes), width))
+    for g, n in enumerate(group_sizes):
+        train_idx, test_idx = train_test_split(np.arange(n), test_size=test_size, random_state=random_state)
+        train[g, train_idx] = 1
+        test[g, test_idx] = 1
+    return train, test
+
+
+def out_of_sample_r2(X, Y, train, test):
+    """
+    R-squared on the held-out rows of models fitted on the training rows (as sklearn's r2_score).
+    """
+    coef = solve_ols(*normal_equations(X, Y, train))['coef']
+    residuals = Y - np.einsum('gni,gi->gn', X, coef)
+    test_mean = (Y * test).sum(axis=1) / test.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 1 - (test * residuals ** 2).sum(axis=1) / (test * (Y - test_mean[:, None]) ** 2).sum(axis=1)
+
+
+def stacked_design(frames, horizons=5, extra=None):
+    """
+    Stack the models of every frame and horizon into padded arrays.
+
+    :param frames: List of event frames, one group of models each
+    :param extra: Optional function returning additional design columns for a frame
+    :return: X (groups, rows, terms), Y (groups, rows), W (groups, rows), rows per group
+    """
+    width = max(len(df) for df in frames)
+    n_terms = len(TERMS) + (extra(frames[0]).shape[1] if extra else 0)
+    groups = len(frames) * horizons
+
+    X = np.zeros((groups, width, n_terms))
+    Y = np.zeros((groups, width))
+    W = np.zeros((groups, width))
+    sizes = []
+    for f, df in enumerate(frames):
+        n = len(df)
+        extra_columns = extra(df) if extra else None
+        for h in range(horizons):
+            g = f * horizons + h
+            X[g, :n, 0] = df['min_score']
+            X[g, :n, 1] = df['max_score']
+            X[g, :n, 2] = df[INDEX_CHANGES[h]]
+            if extra_columns is not None:
+                X[g, :n, len(TERMS):] = extra_columns
+            Y[g, :n] = df[STOCK_CHANGES[h]]
+            W[g, :n] = 1
+            sizes.append(n)
+    return X, Y, W, np.array(sizes)
+
+
+def tidy_results(model, labels, horizons, fit, r2, oos_r2, f_stat, f_pvalue, nobs):
+    rows = []
+    for g, (label, horizon) in enumerate((label, h) for label in labels for h in range(horizons)):
+        for i, term in enumerate(TERMS):
+            rows.append({
+                'model': model, 'symbol': label, 'horizon': horizon, 'term': term,
+                'coef': fit['coef'][g, i], 'std_err': fit['std_err'][g, i],
+                't_value': fit['t_value'][g, i], 'p_value': fit['p_value'][g, i],
+                'nobs': int(nobs[g]), 'r2': r2[g], 'oos_r2': oos_r2[g],
+                'f_stat': f_stat[g], 'f_pvalue': f_pvalue[g],
+            })
+    return rows
+
+
+def fit_event_regressions(data, horizons=5, pooled=True, min_nobs=10):
+    """
+    Regress the stock's t0..t4 price changes on the news scores and the index change,
+    for every ticker and horizon at once (no intercept, as in fit_OLS).
+
+    Coefficients, standard errors, R-squared and the F-test of the news scores come
+    from one set of normal equations per model; out-of-sample R-squared uses the
+    same 80/20 split as fit_OLS. With `pooled`, a panel model over all tickers with
+    ticker fixed effects is fitted as well.
+
+    :param data: Rows built by process_ticker (any number of tickers)
+    :param pooled: Also fit the panel model over all tickers
+    :param min_nobs: Tickers with fewer rows get no model of their own (they still enter the panel)
+    :return: Tidy DataFrame with one row per model, horizon and term
+    """
+    df = event_frame(data)
+    if df.empty:
+        return pd.DataFrame()
+    all_frames = [group.reset_index(drop=True) for _, group in df.groupby('symbol', sort=True)]
+    frames = [frame for frame in all_frames if len(frame) >= min_nobs]
+
+    rows = []
+    if frames:
+        labels = [frame['symbol'].iloc[0] for frame in frames]
+        X, Y, W, sizes = stacked_design(frames, horizons)
+        rows += _fit_models('ticker', labels, horizons, X, Y, W, sizes)
+
+    if pooled and len(all_frames) > 1 and len(df) >= min_nobs:
+        panel = pd.concat(all_frames, ignore_index=True)
+        symbols = [frame['symbol'].iloc[0] for frame in all_frames]
+        # Ticker fixed effects: one dummy per ticker, no common intercept
+        dummies = lambda frame: pd.get_dummies(frame['symbol']).reindex(columns=symbols, fill_value=0).to_numpy(float)
+        X, Y, W, sizes = stacked_design([panel], horizons, extra=dummies)
+        rows += _fit_models('pooled', ['ALL'], horizons, X, Y, W, sizes, centered=True)
+
+    return pd.DataFrame(rows)
+
+
+def _fit_models(model, labels, horizons, X, Y, W, sizes, centered=False):
+    """
+    :param centered: The model has an intercept or fixed effects, so R-squared is computed around
+                     the mean of y (statsmodels detects the implicit constant of the ticker dummies)
+    """
+    XtX, Xty, yty, nobs = normal_equations(X, Y, W)
+    fit = solve_ols(XtX, Xty, yty, nobs)
+
+    # Reduced model: everything except the news scores
+    reduced_terms = [i for i in range(X.shape[2]) if i not in NEWS_TERMS]
+    reduced = solve_ols(XtX, Xty, yty, nobs, reduced_terms)
+    f_stat, f_pvalue = f_test(fit, reduced)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if centered:
+            mean = (W * Y).sum(axis=1) / nobs
+            tss = (W * (Y - mean[:, None]) ** 2).sum(axis=1)
+        else:
+            tss = yty  # uncentered, as statsmodels reports without a constant
+        r2 = 1 - fit['rss'] / tss
+    train, test = split_weights(sizes, X.shape[1])
+    oos_r2 = out_of_sample_r2(X, Y, train, test)
+    return tidy_results(model, labels, horizons, fit, r2, oos_r2, f_stat, f_pvalue, nobs)
@@ -0,0 +1,186 @@
+import asyncio
+import json
+import queue
+import threading
+import urllib.error
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from utils.lazy import ensure_loaded, lazy_import
+
+feedparser = lazy_import('feedparser')
+
+USER_AGENT = "StockNewsSentimentAnalyzer/0.1"
+
+# Outcome of a single feed request; `feed` is only set for a 200 response
+FeedResult = namedtuple('FeedResult', ['key', 'status', 'feed', 'etag', 'modified', 'error'])
+
+
+class FeedCache:
+    """
+    Per-ticker ETag/Last-Modified validators used for conditional GET requests.
+
+    Validators are only recorded through `update`, so a feed whose articles were
+    never processed is fetched in full again on the next run.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.validators = {}
+        if self.path and self.path.exists():
+            try:
+                self.validators = json.loads(self.path.read_text())
+            except (OSError, ValueError) as e:
+                print(f"Error loading feed cache: {e}")
+
+    def get(self, key):
+        entry = self.validators.get(key, {})
+        return entry.get('etag'), entry.get('modified')
+
+    def update(self, key, etag, modified):
+        if etag or modified:
+            self.validators[key] = {'etag': etag, 'modified': modified}
+
+    def save(self):
+        if self.path is None:
+            return
+        try:
+            self.path.write_text(json.dumps(self.validators, indent=1, sort_keys=True))
+        except OSError as e:
+            print(f"Error saving feed cache: {e}")
+
+
+def batch_symbols(symbols, batch_size):
+    """
+    Group symbols into comma-separated keys of at most `batch_size` symbols.
+
+    :param symbols: List of ticker symbols
+    :param batch_size: Maximum number of symbols per feed request
+    :return: List of comma-separated symbol strings
+    """
+    batch_size = max(1, batch_size)
+    return [','.join(symbols[i:i + batch_size]) for i in range(0, len(symbols), batch_size)]
+
+
+def fan_out_entries(entries, symbols):
+    """
+    Deduplicate the entries of a multi-symbol feed by `entry.id` and assign each
+    unique entry to the symbols it applies to.
+
+    An entry applies to the symbols listed in its category tags; entries without
+    symbol tags apply to every symbol of the batch.
+
+    :param entries: Feed entries returned for the batch
+    :param symbols: Symbols requested in the batch
+    :return: Dict of symbol to list of entries, in feed order
+    """
+    by_symbol = {symbol: [] for symbol in symbols}
+    lookup = {symbol.upper(): symbol for symbol in symbols}
+    seen = set()
+
+    for entry in entries:
+        entry_id = entry.get('id')
+        if entry_id in seen:
+            continue
+        seen.add(entry_id)
+
+        tagged = [lookup[tag.get('term', '').upper()] for tag in entry.get('tags', [])
+                  if tag.get('term', '').upper() in lookup]
+        for symbol in tagged or symbols:
+            by_symbol[symbol].append(entry)
+
+    return by_symbol
+
+
+def fetch_feed(url, etag=None, modified=None, timeout=10):
+    """
+    Download a feed with an optional conditional GET.
+
+    :param url: Feed URL
+    :param etag: ETag returned by the previous response, if any
+    :param modified: Last-Modified header returned by the previous response, if any
+    :param timeout: Socket timeout in seconds
+    :return: Tuple of (status, parsed feed or None, etag, modified)
+    """
+    request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    if etag:
+        request.add_header('If-None-Match', etag)
+    if modified:
+        request.add_header('If-Modified-Since', modified)
+
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            headers = dict(response.headers.items())
+            body = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            # Feed has not changed - nothing to parse
+            return 304, None, etag, modified
+        raise
+
+    feed = feedparser.parse(body, response_headers=headers)
+    return status, feed, headers.get('ETag'), headers.get('Last-Modified')
+
+
+async def fetch_feeds_async(urls, cache=None, concurrency=8, timeout=10):
+    """
+    Fetch many feeds concurrently and yield each result as soon as it arrives.
+
+    :param urls: Mapping of key (e.g. ticker) to feed URL
+    :param cache: Optional FeedCache providing conditional GET validators
+    :param concurrency: Maximum number of requests in flight
+    :param timeout: Per-request timeout in seconds
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    # Load feedparser here, before the fetch threads race to use it
+    ensure_loaded(feedparser)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        async def fetch_one(key, url):
+            etag, modified = cache.get(key) if cache else (None, None)
+            async with semaphore:
+                try:
+                    status, feed, etag, modified = await asyncio.wait_for(
+                        loop.run_in_executor(executor, fetch_feed, url, etag, modified, timeout),
+                        timeout=timeout + 1)
+                except Exception as e:
+                    return FeedResult(key, None, None, None, None, e)
+            return FeedResult(key, status, feed, etag, modified, None)
+
+        tasks = [fetch_one(key, url) for key, url in urls.items()]
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+
+
+def iter_feeds(urls, cache=None, concurrency=8, timeout=10):
+    """
+    Synchronous wrapper around `fetch_feeds_async`.
+
+    The event loop runs in a background thread so the caller can process each
+    FeedResult while the remaining feeds are still downloading.
+    """
+    results = queue.Queue()
+    done = object()
+
+    async def produce():
+        async for result in fetch_feeds_async(urls, cache, concurrency, timeout):
+            results.put(result)
+
+    def run():
+        try:
+            asyncio.run(produce())
+        finally:
+            results.put(done)
+
+    threading.Thread(target=run, name="feed-fetcher", daemon=True).start()
+
+    while True:
+        result = results.get()
+        if result is done:
+            return
+        yield result
@@ -0,0 +1,137 @@
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from utils.lazy import ensure_loaded, lazy_import
+
+yf = lazy_import('yfinance')
+
+# Fields of yfinance's info payload stored in the fundamentals table
+FUNDAMENTAL_FIELDS = [
+    'trailingPE', 'forwardPE', 'priceToBook', 'debtToEquity', 'returnOnEquity', 'profitMargins',
+    'marketCap', 'beta', 'dividendYield', 'earningsQuarterlyGrowth',
+]
+
+FUNDAMENTALS_UPSERT = f"""
+    INSERT INTO fundamentals (symbol, close_dt, {', '.join(FUNDAMENTAL_FIELDS)})
+    VALUES ({', '.join(['%s'] * (len(FUNDAMENTAL_FIELDS) + 2))})
+    ON DUPLICATE KEY UPDATE
+        {', '.join(f'{field} = VALUES({field})' for field in FUNDAMENTAL_FIELDS)}
+"""
+
+
+def yahoo_info(symbol):
+    """
+    Default fetcher: the raw info payload of a symbol from Yahoo Finance.
+    """
+    return yf.Ticker(symbol).info
+
+
+class FundamentalsCache:
+    """
+    Raw info payloads on disk, one JSON file per (symbol, trading date).
+
+    A payload older than `ttl_hours` counts as a miss, so a re-run on the same
+    day reuses the payloads while a run after the TTL fetches them again.
+    """
+
+    def __init__(self, directory, ttl_hours=12):
+        self.directory = Path(directory)
+        self.ttl = ttl_hours * 3600
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, symbol, trading_date):
+        name = re.sub(r'[^A-Za-z0-9.-]', '_', symbol)
+        return self.directory / f"{name}_{trading_date}.json"
+
+    def get(self, symbol, trading_date):
+        """
+        :return: Cached payload as a dict, or None on a miss
+        """
+        path = self.path(symbol, trading_date)
+        info = None
+        try:
+            if time.time() - path.stat().st_mtime < self.ttl:
+                info = json.loads(path.read_text())
+        except (OSError, ValueError):
+            info = None
+        with self.lock:
+            if info is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return info
+
+    def put(self, symbol, trading_date, info):
+        path = self.path(symbol, trading_date)
+        try:
+            # Write to a temporary file first, so readers never see a partial payload
+            temporary = path.with_suffix(f".{threading.get_ident()}.tmp")
+            temporary.write_text(json.dumps(info, default=str))
+            temporary.replace(path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error caching fundamentals for {symbol}: {e}")
+
+
+def fundamentals_row(symbol, trading_date, info):
+    return (symbol, trading_date, *(info.get(field) for field in FUNDAMENTAL_FIELDS))
+
+
+def collect_fundamentals(symbols, trading_date, fetch=yahoo_info, cache=None, max_workers=8):
+    """
+    Fetch the info payloads of many symbols through a bounded thread pool.
+
+    :param symbols: Yahoo symbols
+    :param trading_date: Date the snapshot is stored for (part of the cache key)
+    :param fetch: Function returning the info dict of a symbol
+    :param cache: Optional FundamentalsCache consulted before fetching
+    :param max_workers: Maximum number of concurrent fetches
+    :return: dict of symbol to info, in the order of `symbols`; failed symbols are missing
+    """
+    def load(symbol):
+        info = cache.get(symbol, trading_date) if cache else None
+        if info is None:
+            info = fetch(symbol)
+            if cache and info:
+                cache.put(symbol, trading_date, info)
+        return info
+
+    if fetch is yahoo_info:
+        # Load yfinance before the fetch threads race to use it
+        ensure_loaded(yf)
+    payloads = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = [(symbol, executor.submit(load, symbol)) for symbol in symbols]
+        for symbol, future in futures:
+            try:
+                info = future.result()
+            except Exception as e:
+                print(f"Error fetching fundamentals for {symbol}: {e}")
+                continue
+            if info:
+                payloads[symbol] = info
+    return payloads
+
+
+def store_fundamentals(connection, trading_date, payloads) -> int:
+    """
+    Upsert the fundamentals of all symbols with one executemany call.
+
+    :return: Number of rows written
+    """
+    rows = [fundamentals_row(symbol, trading_date, info) for symbol, info in payloads.items()]
+    if not rows:
+        return 0
+    cursor = connection.cursor()
+    try:
+        cursor.executemany(FUNDAMENTALS_UPSERT, rows)
+        connection.commit()
+    finally:
+        cursor.close()
+    return len(rows)
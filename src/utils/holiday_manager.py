@@ -1,35 +1,204 @@
-import pandas as pd
-from datetime import datetime
+import csv
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from utils.holiday_rules import holiday_rules
 
-# Declare the holiday_cache as a global variable
-holiday_cache = set()
+data_dir = Path(__file__).parent.parent.parent / 'data'
 
-def load_holiday_dates_from_csv(csv_file_path):
+# Optional override file of each exchange: closures the rules do not produce (e.g. days of mourning)
+holiday_files = {
+    'TSX': data_dir / 'tsx_holidays.csv',
+    'NYSE': data_dir / 'nyse_holidays.csv',
+}
+
+# Precomputed holidays (rules plus overrides) of each exchange, see write_holiday_snapshot
+snapshot_files = {
+    'TSX': data_dir / 'tsx_holidays.bin',
+    'NYSE': data_dir / 'nyse_holidays.bin',
+}
+# The rules cover the closures of both exchanges from 1998, when the NYSE started closing on MLK Day
+SNAPSHOT_YEARS = (1998, 2060)
+
+# Snapshot layout: magic, first year, last year, CRC-32 of the override file and of the rules module
+# it was built from, followed by little-endian uint16 day numbers counted from 1970-01-01
+SNAPSHOT_HEADER = struct.Struct('<4sHHII')
+SNAPSHOT_MAGIC = b'HOL3'
+EPOCH = date(1970, 1, 1)
+rules_file = Path(__file__).parent / 'holiday_rules.py'
+
+# Holidays per (exchange, year) and override dates per exchange; values are frozensets
+_year_holidays = {}
+_overrides = {}
+_snapshots = {}
+_version = 0
+_lock = threading.Lock()
+
+def read_holiday_dates(csv_file_path):
     """
-    Reads a CSV file with holiday dates and loads them into a cache.
-    
+    Read the holiday dates of a CSV file with a holiday_date column.
+
     :param csv_file_path: Path to the CSV file
+    :return: frozenset of datetime.date objects
+    """
+    with open(csv_file_path, newline='') as csv_file:
+        return frozenset(date.fromisoformat(row['holiday_date'].strip()) for row in csv.DictReader(csv_file))
+
+def _file_digest(path):
+    try:
+        return zlib.crc32(Path(path).read_bytes())
+    except (OSError, TypeError):
+        return 0
+
+def _override_dates(exchange):
+    overrides = _overrides.get(exchange)
+    if overrides is None:
+        path = holiday_files.get(exchange)
+        overrides = read_holiday_dates(path) if path and Path(path).exists() else frozenset()
+        _overrides[exchange] = overrides
+    return overrides
+
+def _read_snapshot(path, exchange):
+    """
+    The (first year, last year, days) of a snapshot file, or None if it is unreadable,
+    truncated, or was built from a different override file or different rules.
     """
-    global holiday_cache  # Declare that we're modifying the global variable
-    
-    # Read the CSV file into a DataFrame
-    calendar_df = pd.read_csv(csv_file_path)
-    
-    # Convert holiday_date column to datetime.date objects
-    calendar_df['holiday_date'] = pd.to_datetime(calendar_df['holiday_date']).dt.date
-    
-    # Populate the global holiday_cache set with the holiday dates
-    holiday_cache = set(calendar_df['holiday_date'])
-    print(f"Loaded holidays: {len(holiday_cache)}")
+    data = Path(path).read_bytes()
+    try:
+        magic, first_year, last_year, csv_digest, rules_digest = SNAPSHOT_HEADER.unpack_from(data)
+    except struct.error:
+        return None
+    if (magic != SNAPSHOT_MAGIC or csv_digest != _file_digest(holiday_files.get(exchange))
+            or rules_digest != _file_digest(rules_file)):
+        return None
+    payload = data[SNAPSHOT_HEADER.size:]
+    if len(payload) % 2:
+        return None
+    days = array('H')
+    days.frombytes(payload)
+    if sys.byteorder == 'big':
+        days.byteswap()
+    start, end = (date(first_year, 1, 1) - EPOCH).days, (date(last_year + 1, 1, 1) - EPOCH).days
+    if not all(start <= day < end for day in days):
+        return None
+    return first_year, last_year, days
 
-def is_holiday(date):
+def _snapshot(exchange):
+    """
+    Load the binary snapshot of an exchange, or None if it is missing, damaged or outdated.
+    """
+    if exchange not in _snapshots:
+        snapshot = None
+        path = snapshot_files.get(exchange)
+        if path and Path(path).exists():
+            snapshot = _read_snapshot(path, exchange)
+            if snapshot is None:
+                print(f"Ignoring outdated or damaged holiday snapshot {path}")
+        _snapshots[exchange] = snapshot
+    return _snapshots[exchange]
+
+def year_holidays(exchange, year):
+    """
+    Holidays of an exchange for one year, computed once per year: taken from the
+    snapshot when it covers the year, otherwise generated by the holiday rules
+    and merged with the override file.
+
+    :param exchange: Exchange code, e.g. 'TSX' or 'NYSE'
+    :param year: Calendar year
+    :return: frozenset of datetime.date objects
+    """
+    key = (exchange, year)
+    holidays = _year_holidays.get(key)
+    if holidays is not None:
+        return holidays
+
+    with _lock:
+        holidays = _year_holidays.get(key)
+        if holidays is None:
+            snapshot = _snapshot(exchange)
+            if snapshot and snapshot[0] <= year <= snapshot[1]:
+                start, end = (date(year, 1, 1) - EPOCH).days, (date(year + 1, 1, 1) - EPOCH).days
+                holidays = frozenset(EPOCH + timedelta(days=day) for day in snapshot[2] if start <= day < end)
+            else:
+                holidays = holiday_rules[exchange](year) | {
+                    day for day in _override_dates(exchange) if day.year == year}
+            _year_holidays[key] = holidays
+    return holidays
+
+def holidays_between(exchange, start_year, end_year):
+    """
+    Holidays of an exchange for the years start_year to end_year, both inclusive.
+
+    :return: Sorted list of datetime.date objects
+    """
+    holidays = set()
+    for year in range(start_year, end_year + 1):
+        holidays |= year_holidays(exchange, year)
+    return sorted(holidays)
+
+def holidays_version():
+    """
+    Counter increased whenever holiday overrides are reloaded, so that derived
+    calendars know when to rebuild.
+    """
+    return _version
+
+def load_holiday_dates_from_csv(csv_file_path, exchange='TSX'):
+    """
+    Reads a CSV file with holiday dates and uses it as the overrides of the given exchange.
+
+    :param csv_file_path: Path to the CSV file
+    :param exchange: Exchange the holidays belong to
+    """
+    global _version
+    holidays = read_holiday_dates(csv_file_path)
+    with _lock:
+        holiday_files[exchange] = Path(csv_file_path)
+        _overrides[exchange] = holidays
+        _snapshots[exchange] = None
+        for key in [key for key in _year_holidays if key[0] == exchange]:
+            del _year_holidays[key]
+        _version += 1
+    print(f"Loaded holidays: {len(holidays)}")
+
+def write_holiday_snapshot(exchange, path=None, first_year=SNAPSHOT_YEARS[0], last_year=SNAPSHOT_YEARS[1]):
+    """
+    Write the rule-generated holidays plus overrides of an exchange to a binary snapshot.
+
+    :param exchange: Exchange code
+    :param path: Output file (defaults to the exchange's snapshot file)
+    """
+    path = Path(path or snapshot_files[exchange])
+    days = array('H')
+    for year in range(first_year, last_year + 1):
+        rules = holiday_rules[exchange](year) | {day for day in _override_dates(exchange) if day.year == year}
+        days.extend(sorted((day - EPOCH).days for day in rules))
+    if days.itemsize != 2:
+        raise ValueError("uint16 array type is required for the holiday snapshot")
+    if sys.byteorder == 'big':
+        days.byteswap()
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, first_year, last_year, _file_digest(holiday_files.get(exchange)),
+                                  _file_digest(rules_file))
+    path.write_bytes(header + days.tobytes())
+    print(f"Wrote {len(days)} {exchange} holidays for {first_year}-{last_year} to {path}")
+
+def is_holiday(date, exchange='TSX'):
     """
     Check if the given date is a holiday.
-    
+
     :param date: A datetime.date or datetime object.
+    :param exchange: Exchange code
     :return: True if the date is a holiday, False otherwise.
     """
     if isinstance(date, datetime):
         date = date.date()  # Extract the date if a datetime object is passed
-    
-    return date in holiday_cache
\ No newline at end of file
+
+    return date in year_holidays(exchange, date.year)
+
+if __name__ == "__main__":
+    for exchange in snapshot_files:
+        write_holiday_snapshot(exchange)
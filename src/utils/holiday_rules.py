@@ -0,0 +1,113 @@
+from datetime import date, timedelta
+from functools import lru_cache
+
+MONDAY, THURSDAY, FRIDAY, SATURDAY, SUNDAY = 0, 3, 4, 5, 6
+
+def easter_sunday(year):
+    """
+    Date of Easter Sunday in the Gregorian calendar (anonymous Gregorian algorithm).
+    """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+def nth_weekday(year, month, weekday, n):
+    """
+    The n-th given weekday of a month (n=1 is the first one).
+    """
+    first = date(year, month, 1)
+    return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+
+def last_weekday(year, month, weekday):
+    """
+    The last given weekday of a month.
+    """
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+def monday_observed(day):
+    """
+    Holidays falling on a weekend are observed the following Monday.
+    """
+    if day.weekday() >= SATURDAY:
+        return day + timedelta(days=7 - day.weekday())
+    return day
+
+def nearest_weekday_observed(day):
+    """
+    Saturday holidays are observed the Friday before, Sunday holidays the Monday after.
+    """
+    if day.weekday() == SATURDAY:
+        return day - timedelta(days=1)
+    if day.weekday() == SUNDAY:
+        return day + timedelta(days=1)
+    return day
+
+@lru_cache(maxsize=None)
+def tsx_holidays(year):
+    """
+    Toronto Stock Exchange holidays of a year.
+
+    :param year: Calendar year
+    :return: frozenset of datetime.date objects
+    """
+    holidays = {
+        monday_observed(date(year, 1, 1)),                          # New Year's Day
+        easter_sunday(year) - timedelta(days=2),                    # Good Friday
+        date(year, 5, 24) - timedelta(days=date(year, 5, 24).weekday()),  # Victoria Day
+        monday_observed(date(year, 7, 1)),                          # Canada Day
+        nth_weekday(year, 8, MONDAY, 1),                            # Civic Holiday
+        nth_weekday(year, 9, MONDAY, 1),                            # Labour Day
+        nth_weekday(year, 10, MONDAY, 2),                           # Thanksgiving Day
+    }
+
+    # Christmas and Boxing Day: weekend days move to the next free weekdays (in lieu)
+    christmas = monday_observed(date(year, 12, 25))
+    boxing_day = monday_observed(max(date(year, 12, 26), christmas + timedelta(days=1)))
+    holidays.update({christmas, boxing_day})
+    if year >= 2008:
+        holidays.add(nth_weekday(year, 2, MONDAY, 3))              # Family Day
+    return frozenset(holidays)
+
+@lru_cache(maxsize=None)
+def nyse_holidays(year):
+    """
+    New York Stock Exchange holidays of a year. One-off closures (e.g. national
+    days of mourning) are not covered by the rules and come from the holiday file.
+
+    :param year: Calendar year
+    :return: frozenset of datetime.date objects
+    """
+    holidays = {
+        nth_weekday(year, 2, MONDAY, 3),                            # Washington's Birthday
+        easter_sunday(year) - timedelta(days=2),                    # Good Friday
+        last_weekday(year, 5, MONDAY),                              # Memorial Day
+        nearest_weekday_observed(date(year, 7, 4)),                 # Independence Day
+        nth_weekday(year, 9, MONDAY, 1),                            # Labor Day
+        nth_weekday(year, 11, THURSDAY, 4),                         # Thanksgiving Day
+        nearest_weekday_observed(date(year, 12, 25)),               # Christmas Day
+    }
+
+    # New Year's Day on a Saturday is not observed on the Friday before
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != SATURDAY:
+        holidays.add(nearest_weekday_observed(new_year))
+    if year >= 1998:
+        holidays.add(nth_weekday(year, 1, MONDAY, 3))              # Martin Luther King Jr. Day
+    if year >= 2022:
+        holidays.add(nearest_weekday_observed(date(year, 6, 19)))  # Juneteenth
+    return frozenset(holidays)
+
+# Rule generator of each supported exchange
+holiday_rules = {
+    'TSX': tsx_holidays,
+    'NYSE': nyse_holidays,
+}
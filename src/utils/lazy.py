@@ -0,0 +1,48 @@
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """
+    Import a module lazily: the module object is returned right away and its code
+    only runs on first attribute access. Heavy dependencies (pandas, openai,
+    feedparser, mysql.connector) are imported this way, so commands and worker
+    processes that never touch them do not pay their import time.
+
+    :param name: Absolute module name
+    :return: The (possibly not yet executed) module
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+
+    # Make `import a.b` followed by `a.b.x` work as for an eagerly imported submodule
+    parent, _, child = name.rpartition('.')
+    if parent:
+        setattr(importlib.import_module(parent), child, module)
+    return module
+
+
+def ensure_loaded(module):
+    """
+    Run the code of a lazily imported module now, on the calling thread.
+
+    LazyLoader is not thread-safe before Python 3.12: when several threads touch a
+    module that is still loading, all but one see an empty module. Call this before
+    handing a lazily imported module to a thread pool.
+
+    :param module: Module returned by `lazy_import` (a loaded module is left as is)
+    :return: The loaded module
+    """
+    # Any attribute access on a _LazyModule executes the module
+    getattr(module, '__dict__')
+    return module
@@ -1,146 +1,287 @@
-import yfinance as yf
-import pandas as pd
-import mysql.connector
-from datetime import datetime, timedelta
-from decimal import Decimal
-from dateutil.relativedelta import relativedelta
-import trading_date_lookup as td
-
-def upload_stock_data_to_db(connection, symbol, start_date, end_date=None):
-    cursor = connection.cursor()
+import argparse
+import itertools
+import numpy as np
+import sys
+from collections import defaultdict
+from datetime import datetime
+import utils.trading_date_lookup as td
+from utils import db
+from pathlib import Path
+from utils.fundamentals_collector import FundamentalsCache, collect_fundamentals, store_fundamentals
+from utils.price_series_cache import price_cache
+from utils.shard_coordinator import ShardCoordinator, seed_registry
+from utils.lazy import lazy_import
+from utils.trading_calendar import exchange_for_symbol, get_calendar
+
+pd = lazy_import('pandas')
+yf = lazy_import('yfinance')
+
+# First close date loaded for symbols without stored prices, and on a full refresh
+PRICE_HISTORY_START = '2017-01-01'
+# Sessions before the last stored close that are downloaded again, to pick up adjusted close revisions
+OVERLAP_SESSIONS = 5
+# Symbols per yf.download call
+DOWNLOAD_BATCH_SIZE = 20
+
+# Concurrent info requests and on-disk cache of the raw payloads
+FUNDAMENTALS_WORKERS = 8
+FUNDAMENTALS_CACHE_DIR = Path(__file__).parent.parent.parent / 'data' / 'fundamentals_cache'
+FUNDAMENTALS_CACHE_TTL_HOURS = 12
+
+# Sharded runs: lease lifetime and the time workers started together wait for each other (seconds)
+SHARD_LEASE_SECONDS = 60
+SHARD_SETTLE_SECONDS = 10
+
+PRICE_COLUMNS = {
+    'Date': 'close_dt',
+    'Open': 'open_price',
+    'High': 'high',
+    'Low': 'low',
+    'Close': 'close_price',
+    'Adj Close': 'adj_close_price',
+    'Volume': 'volume'
+}
 
-    # Download stock data from yfinance
-    stock_data = yf.download(symbol, start=start_date, end=end_date, auto_adjust=False)
-    stock_data = stock_data.droplevel(level=1, axis=1)
-        
-    # Prepare the data for insertion
-    stock_data.reset_index(inplace=True)
+PRICE_FIELDS = ['open_price', 'high', 'low', 'close_price', 'adj_close_price']
+
+STOCK_PRICE_UPSERT = """
+    INSERT INTO stock_price (symbol, close_dt, open_price, high, low, close_price, adj_close_price, volume)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        open_price = VALUES(open_price),
+        high = VALUES(high),
+        low = VALUES(low),
+        close_price = VALUES(close_price),
+        adj_close_price = VALUES(adj_close_price),
+        volume = VALUES(volume)
+"""
+# Rows per executemany call (sent as one multi-row INSERT)
+UPSERT_CHUNK_SIZE = 1000
+
+def price_frame(stock_data, symbol):
+    """
+    Prepare yfinance data of one symbol for insertion into stock_price.
+    """
+    stock_data = stock_data.dropna(how='all').reset_index()
     stock_data['Symbol'] = symbol
-    stock_data.rename(columns={
-        'Date': 'close_dt',
-        'Open': 'open_price',
-        'High': 'high',
-        'Low': 'low',
-        'Close': 'close_price',
-        'Adj Close': 'adj_close_price',
-        'Volume': 'volume'
-    }, inplace=True)
-
-    # Convert price-related columns to Decimal and round to 2 decimal places
-    for col in ['open_price', 'high', 'low', 'close_price', 'adj_close_price']:
-        stock_data[col] = stock_data[col].apply(lambda x: round(Decimal(str(x)), 2))
-
-    # Insert each row into the database
-    for index, row in stock_data.iterrows():
-        try:
-            cursor.execute("""
-                INSERT INTO stock_price (symbol, close_dt, open_price, high, low, close_price, adj_close_price, volume)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                    open_price = VALUES(open_price),
-                    high = VALUES(high),
-                    low = VALUES(low),
-                    close_price = VALUES(close_price),
-                    adj_close_price = VALUES(adj_close_price),
-                    volume = VALUES(volume)
-                """, (
-                    row['Symbol'], 
-                    row['close_dt'], 
-                    row['open_price'], 
-                    row['high'], 
-                    row['low'], 
-                    row['close_price'], 
-                    row['adj_close_price'], 
-                    row['volume']
-                ))
-        except Exception as e:
-            print(f"Error inserting data for {symbol} on {row['close_dt']}: {e}")
+    stock_data.rename(columns=PRICE_COLUMNS, inplace=True)
 
-    # Commit the transaction and close the cursor
-    connection.commit()
-    cursor.close()
+    # Round all price columns to 2 decimal places at once
+    stock_data[PRICE_FIELDS] = np.round(stock_data[PRICE_FIELDS].to_numpy(dtype=float), 2)
+    return stock_data
+
+def price_rows(stock_data):
+    """
+    stock_price rows of a prepared frame, with missing values as None.
+    """
+    dates = pd.to_datetime(stock_data['close_dt']).dt.date.tolist()
+    prices = stock_data[PRICE_FIELDS].to_numpy(dtype=float).astype(object)
+    prices[pd.isna(prices)] = None
+    volumes = [None if pd.isna(volume) else int(volume) for volume in stock_data['volume']]
+    return [(symbol, close_dt, *row, volume)
+            for symbol, close_dt, row, volume in zip(stock_data['Symbol'], dates, prices.tolist(), volumes)]
+
+def stored_close_dates(cursor, symbol, first_dt, last_dt):
+    cursor.execute("""
+        SELECT close_dt
+        FROM stock_price
+        WHERE symbol = %s AND close_dt BETWEEN %s AND %s
+    """, (symbol, first_dt, last_dt))
+    return {row[0] for row in cursor.fetchall()}
+
+def store_stock_data(connection, symbol, stock_data, chunk_size=UPSERT_CHUNK_SIZE):
+    """
+    Upsert the prepared price rows of one symbol in chunks. Chunks that fail are
+    reported and skipped; the rows of the others are committed together.
+
+    :return: (rows inserted, existing rows whose values changed), counting committed rows only
+    """
+    rows = price_rows(stock_data)
+    if not rows:
+        return 0, 0
 
-def store_fundamentals_to_db(connection, symbol, trading_date):
     cursor = connection.cursor()
     try:
-        info = yf.Ticker(symbol).info
-        cursor.execute("""
-            INSERT INTO fundamentals (
-                symbol, close_dt, trailingPE, forwardPE, priceToBook,
-                debtToEquity, returnOnEquity, profitMargins, marketCap,
-                beta, dividendYield, earningsQuarterlyGrowth
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                trailingPE = VALUES(trailingPE),
-                forwardPE = VALUES(forwardPE),
-                priceToBook = VALUES(priceToBook),
-                debtToEquity = VALUES(debtToEquity),
-                returnOnEquity = VALUES(returnOnEquity),
-                profitMargins = VALUES(profitMargins),
-                marketCap = VALUES(marketCap),
-                beta = VALUES(beta),
-                dividendYield = VALUES(dividendYield),
-                earningsQuarterlyGrowth = VALUES(earningsQuarterlyGrowth)
-        """, (
-            symbol,
-            trading_date,
-            info.get("trailingPE"),
-            info.get("forwardPE"),
-            info.get("priceToBook"),
-            info.get("debtToEquity"),
-            info.get("returnOnEquity"),
-            info.get("profitMargins"),
-            info.get("marketCap"),
-            info.get("beta"),
-            info.get("dividendYield"),
-            info.get("earningsQuarterlyGrowth"),
-        ))
+        dates = [row[1] for row in rows]
+        stored = stored_close_dates(cursor, symbol, min(dates), max(dates))
+
+        inserted = updated = 0
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i:i + chunk_size]
+            try:
+                cursor.executemany(STOCK_PRICE_UPSERT, chunk)
+            except Exception as e:
+                print(f"Error inserting data for {symbol} from {chunk[0][1]}: {e}")
+                continue
+            # MySQL counts 1 per inserted row and 2 per changed row of an upsert
+            chunk_inserted = len({row[1] for row in chunk} - stored)
+            inserted += chunk_inserted
+            updated += max(max(cursor.rowcount, 0) - chunk_inserted, 0) // 2
+
+        connection.commit()
     except Exception as e:
-        print(f"Error inserting fundamentals for {symbol}: {e}")
-    connection.commit()
+        print(f"Error storing prices of {symbol}: {e}")
+        connection.rollback()
+        return 0, 0
+    finally:
+        cursor.close()
+
+    # Cached series of this symbol are outdated now
+    price_cache.invalidate(symbol)
+    return inserted, updated
+
+def last_close_dates(connection, symbols):
+    """
+    Last stored close date of each symbol, in one query.
+
+    :return: dict of symbol to date; symbols without prices are missing
+    """
+    if not symbols:
+        return {}
+    placeholders = ', '.join(['%s'] * len(symbols))
+    cursor = connection.cursor()
+    cursor.execute(f"""
+        SELECT symbol, MAX(close_dt)
+        FROM stock_price
+        WHERE symbol IN ({placeholders})
+        GROUP BY symbol
+    """, tuple(symbols))
+    rows = cursor.fetchall()
     cursor.close()
+    return {symbol: last_dt for symbol, last_dt in rows if last_dt is not None}
+
+def download_start(symbol, last_dt, full_refresh=False):
+    """
+    First date to download for a symbol: the start of the history when nothing is
+    stored (or on a full refresh), otherwise a few sessions before the last close.
+    """
+    if full_refresh or last_dt is None:
+        return PRICE_HISTORY_START
+    if isinstance(last_dt, datetime):
+        last_dt = last_dt.date()
+    return get_calendar(exchange_for_symbol(symbol)).offset(last_dt, -OVERLAP_SESSIONS).isoformat()
+
+def plan_downloads(symbols, last_dates, full_refresh=False, batch_size=DOWNLOAD_BATCH_SIZE):
+    """
+    Group symbols with the same download start into batches.
+
+    :return: List of (start date, symbols)
+    """
+    by_start = defaultdict(list)
+    for symbol in symbols:
+        by_start[download_start(symbol, last_dates.get(symbol), full_refresh)].append(symbol)
+
+    return [(start, batch[i:i + batch_size])
+            for start, batch in sorted(by_start.items())
+            for i in range(0, len(batch), batch_size)]
+
+def download_prices(symbols, start_date, end_date=None, download=None):
+    """
+    Download the prices of several symbols in one call.
+
+    :return: dict of symbol to the yfinance data of that symbol
+    """
+    data = (download or yf.download)(list(symbols), start=start_date, end=end_date, auto_adjust=False,
+                    group_by='ticker', progress=False)
+    if data is None or data.empty:
+        return {}
+    downloaded = set(data.columns.get_level_values(0))
+    return {symbol: data[symbol] for symbol in symbols if symbol in downloaded}
+
+def load_prices(connection, symbols, full_refresh=False, end_date=None, batch_size=DOWNLOAD_BATCH_SIZE,
+                download=None):
+    """
+    Load the prices of many symbols. By default only the missing tail (plus an
+    overlap of OVERLAP_SESSIONS) is downloaded; `full_refresh` reloads the whole history.
+
+    :return: (rows inserted, rows updated)
+    """
+    last_dates = {} if full_refresh else last_close_dates(connection, symbols)
+    inserted = updated = 0
+    for start_date, batch in plan_downloads(symbols, last_dates, full_refresh, batch_size):
+        print(f"Downloading {len(batch)} symbols from {start_date}")
+        try:
+            downloaded = download_prices(batch, start_date, end_date, download)
+        except Exception as e:
+            print(f"Error downloading {', '.join(batch)}: {e}")
+            continue
+
+        for symbol in batch:
+            if symbol not in downloaded:
+                print(f"No price data for {symbol}")
+                continue
+            symbol_inserted, symbol_updated = store_stock_data(connection, symbol, price_frame(downloaded[symbol], symbol))
+            inserted += symbol_inserted
+            updated += symbol_updated
+    return inserted, updated
+
+# Index symbols, loaded by every run and every shard worker (the upsert makes reloads harmless)
+INDEX_SYMBOLS = ['^GSPTSE']
+
+# List of stock tickers to load; registered in the ticker registry on every run
+TICKERS = ['ACO-X.TO', 'AEM.TO', 'ALA.TO', 'ALC.TO', 'ALS.TO', 'ARE.TO', 'AQN', 'ATD.TO', 'BCE', 'BDGI.TO', 'BMO', 'BN', 'BNS', 'CCO.TO', 'CEU.TO', 'CM',
+            'CNQ.TO', 'CNR.TO', 'CVE.TO', 'CP', 'CU.TO', 'EIF.TO', 'EMA.TO', 'ENB', 'FC.TO', 'FTS', 'GWO.TO', 'H.TO', 'HPS-A.TO', 'IMO.TO', 'IFC.TO', 'KEY.TO', 'L.TO', 'MFC',
+            'MKP.TO', 'MRU.TO', 'NA.TO', 'PAAS', 'POW.TO', 'PPL.TO', 'PXT.TO', 'QBR-B.TO', 'RCI-B.TO', 'RSI.TO', 'RY',
+            'SIA.TO', 'SLF.TO', 'SU', 'T.TO', 'TIH.TO', 'TD', 'TRI', 'TRP.TO', 'WCN.TO', 'WN.TO', 'WPM.TO', 'X.TO']
+
+def yahoo_symbol(symbol):
+    return f"{symbol}.TO" if not (symbol.endswith('.TO') or symbol.startswith('^')) else symbol
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load stock prices and fundamentals from Yahoo Finance")
+    parser.add_argument('--full-refresh', action='store_true',
+                        help=f"download the whole history since {PRICE_HISTORY_START} instead of the missing days")
+    parser.add_argument('--shards', action='store_true',
+                        help="split the registered tickers with the other workers started with --shards")
+    args = parser.parse_args(argv)
 
-def main():
-    # List of stock tickers to analyze
-    tickers = ['^GSPTSE', 
-                'ACO-X.TO', 'AEM.TO', 'ALA.TO', 'ALC.TO', 'ALS.TO', 'ARE.TO', 'AQN', 'ATD.TO', 'BCE', 'BDGI.TO', 'BMO', 'BN', 'BNS', 'CCO.TO', 'CEU.TO', 'CM',
-                'CNQ.TO', 'CNR.TO', 'CVE.TO', 'CP', 'CU.TO', 'EIF.TO', 'EMA.TO', 'ENB', 'FC.TO', 'FTS', 'GWO.TO', 'H.TO', 'HPS-A.TO', 'IMO.TO', 'IFC.TO', 'KEY.TO', 'L.TO', 'MFC',
-                'MKP.TO', 'MRU.TO', 'NA.TO', 'PAAS', 'POW.TO', 'PPL.TO', 'PXT.TO', 'QBR-B.TO', 'RCI-B.TO', 'RSI.TO', 'RY',
-                'SIA.TO', 'SLF.TO', 'SU', 'T.TO', 'TIH.TO', 'TD', 'TRI', 'TRP.TO', 'WCN.TO', 'WN.TO', 'WPM.TO', 'X.TO']
-    start_dates = ['2017-01-01', '2018-01-01', '2019-01-01', '2020-01-01', '2021-01-01', '2022-01-01', '2023-01-01', '2024-01-01', '2025-01-01', '2026-01-01']
-    
     try:
-        connection = mysql.connector.connect(
-            host="127.0.0.1",
-            user="moberc",
-            password="moberc",
-            database="investments"
-        )
+        connection = db.get_pool().acquire()
     except Exception as e:
         print("Error connecting to database:", e)
-        return
+        return 1
 
     trading_date = td.get_last_trading_date(datetime.now())
 
-    for symbol in tickers:
-        print(f"Processing {symbol}")
+    try:
+        tickers = seed_registry(connection, TICKERS)
+    except Exception as e:
+        print(f"Error reading the ticker registry: {e}")
+        tickers = TICKERS
 
-        to_symbol = f"{symbol}.TO" if not (symbol.endswith('.TO') or symbol.startswith('^')) else symbol
+    coordinator = None
+    rounds = [INDEX_SYMBOLS + tickers]
+    if args.shards:
+        coordinator = ShardCoordinator(db.get_pool().acquire(), lease_seconds=SHARD_LEASE_SECONDS)
+        shards = coordinator.join(SHARD_SETTLE_SECONDS)
+        print(f"Shards: {sorted(shards)}")
+        coordinator.start()
+        # Every worker loads the index; shards taken over during the run are loaded in further rounds
+        rounds = itertools.chain([INDEX_SYMBOLS], coordinator.symbol_rounds())
 
-        for start_date in start_dates:
-            # Adjust end_date to be inclusive
-            end_date = (datetime.strptime(start_date, "%Y-%m-%d") + relativedelta(years=1) - timedelta(days=1)).strftime("%Y-%m-%d")
-            upload_stock_data_to_db(connection, to_symbol, start_date, end_date)
-    
-        # Store fundamentals for end_date
-        if symbol.startswith('^'):
-            continue  
-        try:
-            store_fundamentals_to_db(connection, to_symbol, trading_date)
-        except Exception as e:
-            print(f"Error fetching fundamentals for {to_symbol}: {e}")
+    symbols = []
+    try:
+        for round_tickers in rounds:
+            round_symbols = [yahoo_symbol(symbol) for symbol in round_tickers]
+            inserted, updated = load_prices(connection, round_symbols, full_refresh=args.full_refresh)
+            print(f"Price rows inserted: {inserted}, updated: {updated}")
+            symbols += round_symbols
+    finally:
+        if coordinator is not None:
+            coordinator.stop()
+            coordinator.connection.close()
+
+    # Store fundamentals for the last trading date
+    cache = FundamentalsCache(FUNDAMENTALS_CACHE_DIR, FUNDAMENTALS_CACHE_TTL_HOURS)
+    payloads = collect_fundamentals([symbol for symbol in symbols if not symbol.startswith('^')], trading_date,
+                                    cache=cache, max_workers=FUNDAMENTALS_WORKERS)
+    try:
+        stored = store_fundamentals(connection, trading_date, payloads)
+        print(f"Stored fundamentals of {stored} symbols ({cache.hits} cached)")
+    except Exception as e:
+        print(f"Error inserting fundamentals: {e}")
 
     connection.close()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,65 @@
+from datetime import date, datetime
+from typing import Optional
+
+import pytz
+
+# RSS pubDate format, e.g. 'Thu, 28 Mar 2024 19:59:00 +0000'
+PUBLISHED_FORMAT = '%a, %d %b %Y %H:%M:%S %z'
+EXCHANGE_TZ = pytz.timezone('America/New_York')
+
+
+class NewsItem:
+    """
+    One feed article on its way from the feed to the ynews table.
+
+    A plain slotted record: much smaller than a pandas row, and the sentiment
+    fields set by the scoring stage stay on the item that is stored.
+    """
+
+    __slots__ = ('uuid', 'title', 'link', 'description', 'published', 'est_time', 'trading_dt',
+                 'score', 'type', 'comment')
+
+    def __init__(self, uuid: str, title: str, link: str, description: str, published: Optional[datetime] = None,
+                 est_time: Optional[datetime] = None, trading_dt: Optional[date] = None):
+        """
+        :param published: Publication time (timezone aware)
+        :param est_time: Publication time in exchange-local (New York) time, naive
+        :param trading_dt: Trading day the article counts for
+        """
+        self.uuid = uuid
+        self.title = title
+        self.link = link
+        self.description = description
+        self.published = published
+        self.est_time = est_time
+        self.trading_dt = trading_dt
+        self.score = None
+        self.type = None
+        self.comment = None
+
+    def set_sentiment(self, sentiment):
+        self.score = sentiment.score
+        self.type = sentiment.type
+        self.comment = sentiment.comment
+
+    def __repr__(self):
+        return f"NewsItem({self.uuid!r}, {self.title!r}, est_time={self.est_time})"
+
+
+def parse_published(value) -> Optional[datetime]:
+    """
+    Parse an RSS publication date; None if it is missing or malformed.
+    """
+    try:
+        return datetime.strptime(value, PUBLISHED_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_exchange_time(published: Optional[datetime]) -> Optional[datetime]:
+    """
+    Naive New York time of an aware timestamp.
+    """
+    if published is None:
+        return None
+    return published.astimezone(EXCHANGE_TZ).replace(tzinfo=None)
@@ -0,0 +1,153 @@
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, time as clock_time
+
+from utils.news_item import EXCHANGE_TZ
+from utils.trading_calendar import get_calendar
+
+# News published from 16:00 on counts for the next session (see TradingCalendar.trading_date),
+# so articles around the cutoff are polled most often
+CUTOFF_WINDOW = (clock_time(15, 0), clock_time(17, 0))
+# Regular session and the hours around it; outside of them is overnight
+ACTIVE_HOURS = (clock_time(7, 0), clock_time(20, 0))
+# Quarterly reporting seasons as ((month, day), (month, day)) ranges
+EARNINGS_SEASONS = [((1, 15), (2, 28)), ((4, 15), (5, 31)), ((7, 15), (8, 31)), ((10, 15), (11, 30))]
+
+# Interval multipliers of each market phase
+CUTOFF_FACTOR = 0.25
+EARNINGS_FACTOR = 0.5
+OVERNIGHT_FACTOR = 3.0
+CLOSED_FACTOR = 4.0
+
+
+def is_earnings_season(day) -> bool:
+    return any(start <= (day.month, day.day) <= end for start, end in EARNINGS_SEASONS)
+
+
+def market_factor(moment: datetime, exchange='TSX') -> float:
+    """
+    Multiplier of the polling interval at a New York time: below 1 around the
+    16:00 cutoff and in earnings season, above 1 overnight and on days without
+    a session (weekends and exchange holidays).
+    """
+    day = moment.date()
+    if not get_calendar(exchange).is_session(day):
+        return CLOSED_FACTOR
+    factor = EARNINGS_FACTOR if is_earnings_season(day) else 1.0
+    now = moment.time()
+    if CUTOFF_WINDOW[0] <= now < CUTOFF_WINDOW[1]:
+        factor *= CUTOFF_FACTOR
+    elif not ACTIVE_HOURS[0] <= now < ACTIVE_HOURS[1]:
+        factor *= OVERNIGHT_FACTOR
+    return factor
+
+
+class PollScheduler:
+    """
+    Priority queue of the next poll time of each ticker.
+
+    Each ticker keeps an exponentially weighted estimate of its news arrival
+    rate. After a poll the ticker is scheduled again after roughly the time one
+    new article takes to arrive, scaled by the market phase (market_factor) and
+    clamped to [min_interval, max_interval]. Thread-safe.
+    """
+
+    def __init__(self, symbols, min_interval=60.0, max_interval=3600.0, initial_interval=300.0,
+                 smoothing=0.3, exchange='TSX', clock=time.time):
+        """
+        :param symbols: Tickers to poll; all are due immediately
+        :param min_interval: Shortest interval between polls of a ticker (seconds)
+        :param max_interval: Longest interval between polls of a ticker (seconds)
+        :param initial_interval: Interval assumed before any arrival rate is known (seconds)
+        :param smoothing: Weight of the latest poll in the arrival rate estimate
+        :param exchange: Exchange whose calendar defines sessions and holidays
+        :param clock: Function returning the current epoch time
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.initial_interval = initial_interval
+        self.smoothing = smoothing
+        self.exchange = exchange
+        self.clock = clock
+        self.rates = {}        # symbol -> estimated new articles per second
+        self.last_polled = {}  # symbol -> epoch time of the last poll
+        self.heap = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.active = set()     # tickers to poll
+        self.scheduled = set()  # tickers with an entry on the heap
+        self.set_symbols(symbols)
+
+    def _push(self, due, symbol):
+        heapq.heappush(self.heap, (due, next(self.counter), symbol))
+        self.scheduled.add(symbol)
+
+    def set_symbols(self, symbols):
+        """
+        Poll exactly these tickers from now on: new tickers are due immediately,
+        the pending polls of dropped tickers are skipped.
+        """
+        symbols = list(dict.fromkeys(symbols))
+        now = self.clock()
+        with self.lock:
+            for symbol in symbols:
+                if symbol not in self.scheduled:
+                    self._push(now, symbol)
+            self.active = set(symbols)
+
+    def next_due(self):
+        """
+        :return: Epoch time of the earliest scheduled poll, or None if nothing is scheduled
+        """
+        with self.lock:
+            return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now=None):
+        """
+        Remove and return the tickers whose poll is due, earliest first.
+        """
+        now = self.clock() if now is None else now
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                symbol = heapq.heappop(self.heap)[2]
+                self.scheduled.discard(symbol)
+                if symbol in self.active:
+                    due.append(symbol)
+        return due
+
+    def interval(self, symbol, now=None) -> float:
+        """
+        Seconds until the next poll of a ticker, based on its arrival rate and the market phase.
+        """
+        now = self.clock() if now is None else now
+        rate = self.rates.get(symbol)
+        base = self.initial_interval if rate is None else 1.0 / max(rate, 1.0 / self.max_interval)
+        factor = market_factor(datetime.fromtimestamp(now, EXCHANGE_TZ), self.exchange)
+        return min(self.max_interval, max(self.min_interval, base * factor))
+
+    def record(self, symbol, new_articles, now=None) -> float:
+        """
+        Record the outcome of a poll and schedule the ticker's next poll.
+
+        :param new_articles: Number of articles the poll found that were not stored yet, or None
+                             if the poll failed: the arrival rate is left as it was, and the
+                             articles of the failed interval count towards the next poll
+        :return: Epoch time of the next poll, or None if the ticker is no longer polled
+        """
+        now = self.clock() if now is None else now
+        with self.lock:
+            if symbol not in self.active:
+                return None
+            if new_articles is not None:
+                last = self.last_polled.get(symbol)
+                if last is not None and now > last:
+                    observed = new_articles / (now - last)
+                    previous = self.rates.get(symbol, observed)
+                    self.rates[symbol] = self.smoothing * observed + (1 - self.smoothing) * previous
+                self.last_polled[symbol] = now
+            due = now + self.interval(symbol, now)
+            self._push(due, symbol)
+        return due
@@ -0,0 +1,163 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+import numpy as np
+
+from utils import db
+
+HORIZONS = 5
+
+
+class PriceSeries:
+    """
+    Adjusted close prices of one symbol with a precomputed forward log-return matrix.
+
+    `forward_returns[i, k]` is log(price[i + k + 1] / price[i]), NaN where the series
+    ends too early, so the price changes around any event date are one row lookup.
+    """
+
+    def __init__(self, dates, prices, horizons=HORIZONS):
+        """
+        :param dates: Close dates, sorted ascending
+        :param prices: Adjusted close prices (Decimals are kept for the reported price)
+        :param horizons: Number of forward closes per row
+        """
+        self.horizons = horizons
+        self.dates = np.array(dates, dtype='datetime64[D]')
+        self.prices = np.empty(len(self.dates), dtype=object)
+        self.prices[:] = list(prices)
+
+        values = self.prices.astype(float)
+        self.forward_returns = np.full((len(values), horizons), np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for k in range(1, horizons + 1):
+                if k < len(values):
+                    self.forward_returns[:-k, k - 1] = np.log(values[k:] / values[:-k])
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate memory held by the series, including the price objects.
+        """
+        price_size = sys.getsizeof(Decimal('100.000000')) if len(self.prices) else 0
+        return self.dates.nbytes + self.prices.nbytes + self.forward_returns.nbytes + len(self.prices) * price_size
+
+    def event_changes(self, event_dates):
+        """
+        Log price changes from the close before each event date to the next `horizons` closes.
+
+        :param event_dates: Event (trading) dates
+        :return: (valid mask, price at t0 as object array, changes as a len(event_dates) x horizons array)
+        """
+        event_dates = np.asarray(event_dates, dtype='datetime64[D]')
+        # index of the last close strictly before each event date
+        prev_idx = np.searchsorted(self.dates, event_dates, side='left') - 1
+        valid = (prev_idx >= 0) & (prev_idx + self.horizons < len(self.dates))
+
+        changes = np.full((len(event_dates), self.horizons), np.nan)
+        price = np.full(len(event_dates), None, dtype=object)
+        changes[valid] = self.forward_returns[prev_idx[valid]]
+        price[valid] = self.prices[prev_idx[valid] + 1]
+        return valid, price, changes
+
+
+def load_price_series(symbol, db_connection, horizons=HORIZONS) -> PriceSeries:
+    """
+    Load the full adjusted close price series of a symbol in one query.
+    """
+    query = """
+        SELECT close_dt, adj_close_price
+        FROM stock_price
+        WHERE symbol = %s
+        ORDER BY close_dt ASC
+    """
+
+    rows = db.fetch_all(db_connection, query, (symbol,))
+    return PriceSeries([row[0] for row in rows], [row[1] for row in rows], horizons)
+
+
+def price_signature(symbol, db_connection):
+    """
+    Cheap fingerprint of a symbol's stored prices: changes when rows are added or revised.
+    """
+    query = """
+        SELECT COUNT(*), MAX(close_dt), SUM(adj_close_price)
+        FROM stock_price
+        WHERE symbol = %s
+    """
+
+    rows = db.fetch_all(db_connection, query, (symbol,))
+    return tuple(rows[0]) if rows else ()
+
+
+class PriceSeriesCache:
+    """
+    Process-wide cache of PriceSeries shared by all tickers of an analysis run.
+
+    Least recently used series are dropped once the cache holds more than
+    `max_bytes`. A cached series is reloaded when `invalidate` is called for its
+    symbol (the price loader does this after an upload) or when the stored
+    prices' signature changed; the signature is checked at most every
+    `check_interval` seconds per symbol.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, check_interval=60.0, horizons=HORIZONS):
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self.horizons = horizons
+        self.entries = OrderedDict()  # symbol -> (series, signature, last check time)
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, symbol, db_connection) -> PriceSeries:
+        with self.lock:
+            entry = self.entries.get(symbol)
+            if entry is not None:
+                series, signature, checked = entry
+                if time.monotonic() - checked < self.check_interval:
+                    self.entries.move_to_end(symbol)
+                    self.hits += 1
+                    return series
+                if price_signature(symbol, db_connection) == signature:
+                    self.entries[symbol] = (series, signature, time.monotonic())
+                    self.entries.move_to_end(symbol)
+                    self.hits += 1
+                    return series
+                self._remove(symbol)
+
+            self.misses += 1
+            signature = price_signature(symbol, db_connection)
+            series = load_price_series(symbol, db_connection, self.horizons)
+            self.entries[symbol] = (series, signature, time.monotonic())
+            self.used_bytes += series.nbytes
+            self._evict(keep=symbol)
+            return series
+
+    def _remove(self, symbol):
+        series, signature, checked = self.entries.pop(symbol)
+        self.used_bytes -= series.nbytes
+
+    def _evict(self, keep):
+        while self.used_bytes > self.max_bytes and len(self.entries) > 1:
+            symbol = next(iter(self.entries))
+            if symbol == keep:
+                break
+            self._remove(symbol)
+
+    def invalidate(self, symbol=None):
+        """
+        Drop a symbol's cached series, or all series when no symbol is given.
+        """
+        with self.lock:
+            for cached in ([symbol] if symbol else list(self.entries)):
+                if cached in self.entries:
+                    self._remove(cached)
+
+
+# Shared cache of this process
+price_cache = PriceSeriesCache()
@@ -0,0 +1,162 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils.lazy import ensure_loaded, lazy_import
+
+openai = lazy_import('openai')
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount=1):
+        """
+        Take `amount` tokens and return how many seconds the caller must wait before using them.
+        """
+        with self.lock:
+            self._refill()
+            # A request larger than the bucket can never be satisfied otherwise
+            amount = min(amount, self.capacity)
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, amount=1):
+        delay = self.reserve(amount)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budgets for the OpenAI API.
+    """
+
+    def __init__(self, requests_per_minute=500, tokens_per_minute=200000):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    def acquire(self, tokens):
+        delay = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+        if delay > 0:
+            time.sleep(delay)
+
+
+def estimate_tokens(*texts) -> int:
+    """
+    Rough token estimate (about 4 characters per token) plus room for the answer.
+    """
+    return sum(len(str(text)) for text in texts if text) // 4 + 200
+
+
+def is_retryable(error) -> bool:
+    """
+    Rate limits, server errors, timeouts and connection failures are worth retrying.
+    """
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def backoff_delay(error, attempt, base_delay=1.0, max_delay=60.0) -> float:
+    """
+    Exponential backoff with full jitter, honouring a Retry-After header when present.
+    """
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            return min(max_delay, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class ScoringEngine:
+    """
+    Runs sentiment requests on a thread pool, keeping up to `max_workers` in flight.
+
+    Every request first takes its share of the rate limiter budgets. Retryable errors
+    are retried with exponential backoff and jitter; items that still fail are put on
+    `retry_queue` together with their error instead of being dropped.
+    """
+
+    def __init__(self, score_fn, max_workers=8, requests_per_minute=500, tokens_per_minute=200000,
+                 max_retries=5, base_delay=1.0, max_delay=60.0):
+        """
+        :param score_fn: Callable scoring one item; must raise on failure
+        :param max_workers: Maximum number of requests in flight
+        :param requests_per_minute: Request budget
+        :param tokens_per_minute: Token budget, charged with `estimate_tokens` of the item
+        :param max_retries: Retries per item for retryable errors
+        """
+        self.score_fn = score_fn
+        self.max_workers = max_workers
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_queue = []
+
+    def _score(self, args):
+        attempt = 0
+        while True:
+            self.limiter.acquire(estimate_tokens(*args))
+            try:
+                return self.score_fn(*args)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                time.sleep(backoff_delay(e, attempt, self.base_delay, self.max_delay))
+                attempt += 1
+
+    def score(self, items):
+        """
+        Score items concurrently and yield results as they complete.
+
+        :param items: Iterable of (key, args) where args are passed to `score_fn`
+        :return: Generator of (key, result); failed items go to `retry_queue`
+        """
+        # is_retryable uses openai on the pool threads; load it before they start
+        ensure_loaded(openai)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._score, args): (key, args) for key, args in items}
+            for future in as_completed(futures):
+                key, args = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error fetching sentiment analysis: {e}")
+                    self.retry_queue.append((key, args, e))
+                    continue
+                if result is None:
+                    self.retry_queue.append((key, args, None))
+                    continue
+                yield key, result
+
+    def retry_failed(self):
+        """
+        Score the items on the retry queue once more; items that fail again stay queued.
+        """
+        items = [(key, args) for key, args, error in self.retry_queue]
+        self.retry_queue = []
+        yield from self.score(items)
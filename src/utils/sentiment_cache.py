@@ -0,0 +1,105 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+def normalize_text(text) -> str:
+    """
+    Normalize text for cache keys: collapse whitespace and ignore case.
+    """
+    return " ".join(str(text or "").split()).casefold()
+
+
+def sentiment_cache_key(model, template_version, symbol, title, description) -> str:
+    """
+    Hash of everything that determines the model's answer for an article.
+    """
+    parts = [str(model), str(template_version), str(symbol).upper(), normalize_text(title), normalize_text(description)]
+    return hashlib.sha256("\x1f".join(parts).encode('utf-8')).hexdigest()
+
+
+class SentimentCache:
+    """
+    Persistent SQLite cache of sentiment answers with LRU and TTL eviction.
+
+    Entries older than `ttl_days` are treated as misses, and once the cache holds
+    more than `max_entries` the least recently used entries are removed. The cache
+    is safe to share between the scoring threads of one process.
+    """
+
+    def __init__(self, path, max_entries=200000, ttl_days=None):
+        """
+        :param path: SQLite database file (created if missing), or ':memory:'
+        :param max_entries: Maximum number of cached answers
+        :param ttl_days: Maximum age of a cached answer in days, or None to keep answers until evicted
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl_days * 86400 if ttl_days else None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS sentiment_cache(
+                key TEXT PRIMARY KEY,
+                answer TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS sentiment_cache_lru ON sentiment_cache (last_used)")
+        self.connection.commit()
+
+    def get(self, key):
+        """
+        :return: Cached answer as a dict, or None on a miss
+        """
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT answer, created FROM sentiment_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.ttl and now - row[1] > self.ttl):
+                self.misses += 1
+                return None
+            self.connection.execute("UPDATE sentiment_cache SET last_used = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, answer: dict):
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sentiment_cache (key, answer, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(answer), now, now))
+            self.connection.commit()
+
+    def evict(self) -> int:
+        """
+        Remove expired entries and the least recently used entries above `max_entries`.
+
+        :return: Number of removed entries
+        """
+        with self.lock:
+            removed = 0
+            if self.ttl:
+                removed += self.connection.execute(
+                    "DELETE FROM sentiment_cache WHERE created < ?", (time.time() - self.ttl,)).rowcount
+            count = self.connection.execute("SELECT COUNT(*) FROM sentiment_cache").fetchone()[0]
+            if count > self.max_entries:
+                removed += self.connection.execute("""
+                    DELETE FROM sentiment_cache WHERE key IN (
+                        SELECT key FROM sentiment_cache ORDER BY last_used ASC LIMIT ?)""",
+                    (count - self.max_entries,)).rowcount
+            self.connection.commit()
+        return removed
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
+    def close(self):
+        self.evict()
+        self.connection.close()
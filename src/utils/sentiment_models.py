@@ -0,0 +1,17 @@
+from typing import List
+
+from pydantic import BaseModel, Field
+
+
+# Pydantic model to structure sentiment response
+class SentimentAnswer(BaseModel):
+    score: int = Field(description="Sentiment score: negative=-1, neutral=0, positive=1")
+    type: str = Field(description="Type of article: story or fs (financial statement)")
+    comment: str = Field(description="Explanation for the sentiment score")
+
+# Pydantic models to structure a batched sentiment response, one item per article id
+class SentimentItem(SentimentAnswer):
+    id: str = Field(description="Id of the article the answer refers to")
+
+class BatchSentimentAnswer(BaseModel):
+    items: List[SentimentItem] = Field(description="One sentiment answer per article")
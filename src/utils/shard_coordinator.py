@@ -0,0 +1,301 @@
+import math
+import threading
+import time
+import zlib
+
+from utils import db
+from utils.trading_calendar import exchange_for_symbol
+from utils.work_queue import default_owner
+
+# Tickers are spread over a fixed number of shards; workers lease whole shards
+NUM_SHARDS = 16
+
+# Plain SQL that runs on MySQL and SQLite alike; times are epoch seconds of the workers' clocks
+REGISTRY_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS ticker_registry(
+        symbol VARCHAR(32) PRIMARY KEY,
+        exchange VARCHAR(8),
+        shard INT NOT NULL,
+        active INT NOT NULL DEFAULT 1
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS shard_lease(
+        shard INT PRIMARY KEY,
+        owner VARCHAR(128),
+        expires DOUBLE
+    )""",
+    """
+    CREATE TABLE IF NOT EXISTS shard_worker(
+        owner VARCHAR(128) PRIMARY KEY,
+        expires DOUBLE NOT NULL
+    )""",
+]
+
+
+def shard_of(symbol, num_shards=NUM_SHARDS) -> int:
+    """
+    Stable shard of a ticker, the same in every process.
+    """
+    return zlib.crc32(symbol.encode('utf-8')) % num_shards
+
+
+def _execute(connection, query, params=()):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(db.adapt_query(connection, query), params)
+        return cursor.fetchall() if cursor.description else cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def _insert_ignore(connection):
+    return "INSERT OR IGNORE" if db.is_sqlite(connection) else "INSERT IGNORE"
+
+
+def create_registry_tables(connection, num_shards=NUM_SHARDS):
+    """
+    Create the registry and lease tables and one lease row per shard.
+    """
+    for statement in REGISTRY_TABLES:
+        _execute(connection, statement)
+    for shard in range(num_shards):
+        _execute(connection, f"{_insert_ignore(connection)} INTO shard_lease (shard) VALUES (%s)", (shard,))
+    connection.commit()
+
+
+def register_tickers(connection, symbols, num_shards=NUM_SHARDS) -> int:
+    """
+    Add tickers to the registry; tickers already registered keep their row.
+
+    :return: Number of tickers added
+    """
+    added = 0
+    for symbol in symbols:
+        added += _execute(connection,
+                          f"{_insert_ignore(connection)} INTO ticker_registry (symbol, exchange, shard) "
+                          "VALUES (%s, %s, %s)",
+                          (symbol, exchange_for_symbol(symbol), shard_of(symbol, num_shards)))
+    connection.commit()
+    return added
+
+
+def registered_tickers(connection, shards=None) -> list:
+    """
+    Active tickers of the registry, optionally only those of some shards.
+    """
+    query = "SELECT symbol FROM ticker_registry WHERE active = 1"
+    params = ()
+    if shards is not None:
+        if not shards:
+            return []
+        query += f" AND shard IN ({', '.join(['%s'] * len(shards))})"
+        params = tuple(sorted(shards))
+    return [row[0] for row in _execute(connection, query + " ORDER BY symbol", params)]
+
+
+def seed_registry(connection, symbols, num_shards=NUM_SHARDS) -> list:
+    """
+    Create the registry if needed, register the configured tickers and return all active tickers.
+    """
+    create_registry_tables(connection, num_shards)
+    register_tickers(connection, symbols, num_shards)
+    return registered_tickers(connection)
+
+
+class ShardCoordinator:
+    """
+    Lease-based assignment of ticker shards to the workers sharing one database.
+
+    Every `heartbeat` renews the worker's membership and shard leases and moves it
+    towards its fair share of ceil(shards / live workers): a worker above its share
+    releases shards, a worker below it claims free shards and shards whose lease
+    expired because their owner died. Claims are compare-and-set updates, so two
+    workers never hold the same shard. Workers should heartbeat several times per
+    `lease_seconds` (see `start`), and their clocks must roughly agree.
+
+    The coordinator needs a connection of its own; its methods are thread-safe.
+    """
+
+    def __init__(self, connection, num_shards=NUM_SHARDS, lease_seconds=60.0, owner=None, clock=time.time):
+        """
+        :param connection: MySQL or SQLite connection used only by the coordinator
+        :param num_shards: Number of shards of the registry
+        :param lease_seconds: Lifetime of a lease without heartbeat
+        :param owner: Name of this worker; unique per process by default
+        :param clock: Function returning the current epoch time
+        """
+        self.connection = connection
+        self.num_shards = num_shards
+        self.lease_seconds = lease_seconds
+        self.owner = owner or default_owner()
+        self.clock = clock
+        self.shards = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _execute(self, query, params=()):
+        return _execute(self.connection, query, params)
+
+    def heartbeat(self) -> set:
+        """
+        Renew the leases of this worker and rebalance its shards. A failed heartbeat
+        is rolled back, so it holds no locks and leaves the shards owned as they were.
+
+        :return: Shards owned by this worker
+        """
+        with self.lock:
+            try:
+                owned = self._rebalance(self.clock())
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+            self.shards = owned
+        return set(owned)
+
+    def _rebalance(self, now) -> set:
+        expires = now + self.lease_seconds
+        if not self._execute("UPDATE shard_worker SET expires = %s WHERE owner = %s", (expires, self.owner)):
+            self._execute("INSERT INTO shard_worker (owner, expires) VALUES (%s, %s)", (self.owner, expires))
+        self._execute("DELETE FROM shard_worker WHERE expires < %s", (now - self.lease_seconds,))
+
+        # Leases that expired but were not taken over yet are still ours
+        self._execute("UPDATE shard_lease SET expires = %s WHERE owner = %s", (expires, self.owner))
+        owned = {row[0] for row in self._execute("SELECT shard FROM shard_lease WHERE owner = %s", (self.owner,))}
+        workers = self._execute("SELECT COUNT(*) FROM shard_worker WHERE expires >= %s", (now,))[0][0]
+        share = math.ceil(self.num_shards / max(1, workers))
+
+        for shard in sorted(owned, reverse=True)[:max(0, len(owned) - share)]:
+            self._execute("UPDATE shard_lease SET owner = NULL, expires = NULL WHERE shard = %s AND owner = %s",
+                          (shard, self.owner))
+            owned.discard(shard)
+
+        if len(owned) < share:
+            free = self._execute(
+                "SELECT shard FROM shard_lease WHERE owner IS NULL OR expires < %s ORDER BY shard", (now,))
+            for (shard,) in free:
+                if len(owned) >= share:
+                    break
+                if self._execute("""
+                        UPDATE shard_lease SET owner = %s, expires = %s
+                        WHERE shard = %s AND (owner IS NULL OR expires < %s)""",
+                        (self.owner, expires, shard, now)):
+                    owned.add(shard)
+        return owned
+
+    def join(self, settle=None, rounds=2, timeout=None) -> set:
+        """
+        Split the registry once for a one-shot run: heartbeat, give workers started at
+        about the same time `settle` seconds to announce themselves, and rebalance.
+        Workers that start later still change the split, so rebalancing goes on until
+        every shard is held by a live worker and no worker holds more than its share.
+
+        :param timeout: Longest time to wait for the split to settle (default two leases)
+        :return: Shards owned by this worker
+        """
+        settle = self.lease_seconds / 3 if settle is None else settle
+        timeout = 2 * self.lease_seconds if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        shards = self.heartbeat()
+        for _ in range(rounds):
+            if self.stop_event.wait(settle):
+                return shards
+            shards = self.heartbeat()
+        while not self.balanced():
+            if time.monotonic() >= deadline:
+                print(f"Shards still unassigned or unbalanced after {timeout:.0f}s; "
+                      "their tickers are picked up once a worker takes them over")
+                break
+            if self.stop_event.wait(settle):
+                break
+            shards = self.heartbeat()
+        return shards
+
+    def balanced(self) -> bool:
+        """
+        Whether every shard is held by a live worker and no worker holds more than
+        its share, so no worker gives up or claims shards at its next heartbeat.
+        """
+        with self.lock:
+            try:
+                now = self.clock()
+                held = [row[0] for row in self._execute(
+                    "SELECT COUNT(*) FROM shard_lease WHERE owner IS NOT NULL AND expires >= %s GROUP BY owner",
+                    (now,))]
+                workers = self._execute("SELECT COUNT(*) FROM shard_worker WHERE expires >= %s", (now,))[0][0]
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+        share = math.ceil(self.num_shards / max(1, workers))
+        return sum(held) == self.num_shards and max(held, default=0) <= share
+
+    def symbol_rounds(self):
+        """
+        Tickers of a one-shot run in rounds: first those of the held shards, then after
+        each round those of shards taken over since (from workers that died), until a
+        round brings no new tickers. Needs the heartbeat thread (`start`) to take shards over.
+        """
+        done = set()
+        while True:
+            symbols = [symbol for symbol in self.symbols() if symbol not in done]
+            if not symbols:
+                return
+            done.update(symbols)
+            yield symbols
+
+    def symbols(self) -> list:
+        """
+        Active tickers of the shards owned by this worker.
+        """
+        with self.lock:
+            try:
+                symbols = registered_tickers(self.connection, self.shards)
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+        return symbols
+
+    def release(self):
+        """
+        Give up all shards and leave, so other workers take the shards over at their next heartbeat.
+        """
+        with self.lock:
+            try:
+                self._execute("UPDATE shard_lease SET owner = NULL, expires = NULL WHERE owner = %s", (self.owner,))
+                self._execute("DELETE FROM shard_worker WHERE owner = %s", (self.owner,))
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+            self.shards = set()
+
+    def start(self, interval=None):
+        """
+        Heartbeat on a background thread every `interval` seconds (default a third of the lease).
+        """
+        interval = interval or self.lease_seconds / 3
+
+        def run():
+            while not self.stop_event.wait(interval):
+                try:
+                    self.heartbeat()
+                except Exception as e:
+                    print(f"Error renewing shard leases: {e}")
+
+        self.heartbeat()
+        self.thread = threading.Thread(target=run, name='shard-heartbeat', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the heartbeat thread and release the shards.
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.release()
@@ -0,0 +1,200 @@
+import threading
+from datetime import date, datetime
+from utils.holiday_manager import holidays_between, holidays_version, is_holiday
+from utils.lazy import lazy_import
+
+# numpy is loaded on first use, so importing the calendar (e.g. with the news fetcher) stays cheap
+np = lazy_import('numpy')
+
+def to_day(value):
+    """
+    Convert a date, datetime, string or numpy datetime64 to numpy datetime64[D].
+    """
+    if isinstance(value, datetime):
+        value = value.date()
+    return np.datetime64(value, 'D')
+
+
+class TradingCalendar:
+    """
+    Trading sessions of one exchange, held as a sorted numpy datetime64[D] array.
+
+    Lookups (next, previous, offset by n, sessions between) are binary searches or
+    index arithmetic on that array. The loaded range grows by whole years when a
+    date outside of it is requested; holidays come from the exchange's holiday
+    rules, so any year can be loaded. The session array is never modified in place,
+    only replaced under a lock, so a calendar can be shared between threads; it is
+    also picklable for use in worker processes.
+    """
+
+    def __init__(self, exchange='TSX', holidays=None, start_year=None, end_year=None):
+        """
+        :param exchange: Exchange code used to look up holidays, e.g. 'TSX' or 'NYSE'
+        :param holidays: Optional iterable of holiday dates overriding the exchange holidays
+        :param start_year: First year to load (defaults to last year)
+        :param end_year: Last year to load (defaults to next year)
+        """
+        this_year = date.today().year
+        self.exchange = exchange
+        self.custom_holidays = frozenset(holidays) if holidays is not None else None
+        self.version = holidays_version()
+        self.start_year = start_year or this_year - 1
+        self.end_year = end_year or this_year + 1
+        self._lock = threading.Lock()
+        self.sessions = self._build(self.start_year, self.end_year)
+
+    def _build(self, start_year, end_year):
+        if self.custom_holidays is not None:
+            holidays = sorted(self.custom_holidays)
+        else:
+            holidays = holidays_between(self.exchange, start_year, end_year)
+        days = np.arange(np.datetime64(f"{start_year}-01-01"), np.datetime64(f"{end_year + 1}-01-01"), dtype='datetime64[D]')
+        return days[np.is_busday(days, holidays=np.array(holidays, dtype='datetime64[D]'))]
+
+    def _ensure(self, first, last):
+        """
+        Make sure the loaded range covers [first, last] plus one year on each side,
+        so that next/previous lookups at the edges always find a session.
+        """
+        first_year = first.astype(object).year - 1
+        last_year = last.astype(object).year + 1
+        if first_year >= self.start_year and last_year <= self.end_year:
+            return
+        with self._lock:
+            start_year = min(self.start_year, first_year)
+            end_year = max(self.end_year, last_year)
+            if start_year < self.start_year or end_year > self.end_year:
+                self.sessions = self._build(start_year, end_year)
+                self.start_year, self.end_year = start_year, end_year
+
+    def _sessions_for(self, *days):
+        self._ensure(min(days), max(days))
+        return self.sessions
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def is_session(self, day) -> bool:
+        day = to_day(day)
+        sessions = self._sessions_for(day)
+        i = np.searchsorted(sessions, day)
+        return i < len(sessions) and sessions[i] == day
+
+    def is_holiday(self, day) -> bool:
+        day = to_day(day).astype(object)
+        if self.custom_holidays is not None:
+            return day in self.custom_holidays
+        return is_holiday(day, self.exchange)
+
+    def roll_forward(self, day) -> date:
+        """
+        The given day if it is a session, otherwise the next session.
+        """
+        day = to_day(day)
+        sessions = self._sessions_for(day)
+        return sessions[np.searchsorted(sessions, day, side='left')].astype(object)
+
+    def roll_back(self, day) -> date:
+        """
+        The given day if it is a session, otherwise the previous session.
+        """
+        day = to_day(day)
+        sessions = self._sessions_for(day)
+        return sessions[np.searchsorted(sessions, day, side='right') - 1].astype(object)
+
+    def next_session(self, day) -> date:
+        """
+        First session strictly after the given day.
+        """
+        day = to_day(day)
+        sessions = self._sessions_for(day)
+        return sessions[np.searchsorted(sessions, day, side='right')].astype(object)
+
+    def previous_session(self, day) -> date:
+        """
+        Last session strictly before the given day.
+        """
+        day = to_day(day)
+        sessions = self._sessions_for(day)
+        return sessions[np.searchsorted(sessions, day, side='left') - 1].astype(object)
+
+    def offset(self, day, n) -> date:
+        """
+        Session `n` sessions after (or before, for negative n) the given day,
+        which is first rolled forward to a session.
+        """
+        day = to_day(day)
+        # Roughly 7 calendar days per 5 sessions, plus margin, bounds the search
+        span = np.timedelta64(abs(int(n)) * 7 // 5 + 10, 'D')
+        sessions = self._sessions_for(day - span, day + span)
+        return sessions[np.searchsorted(sessions, day, side='left') + n].astype(object)
+
+    def sessions_between(self, start, end):
+        """
+        Sessions from start to end, both inclusive, as a datetime64[D] array.
+        """
+        start, end = to_day(start), to_day(end)
+        sessions = self._sessions_for(start, end)
+        return sessions[np.searchsorted(sessions, start, side='left'):np.searchsorted(sessions, end, side='right')]
+
+    def count_sessions(self, start, end) -> int:
+        return len(self.sessions_between(start, end))
+
+    def trading_date(self, timestamp) -> date:
+        """
+        Trading day a timestamp in exchange-local time belongs to: news at or after
+        4pm, on weekends or on holidays counts for the next session.
+        """
+        day = to_day(timestamp)
+        if isinstance(timestamp, datetime) and (timestamp.hour, timestamp.minute, timestamp.second,
+                                                timestamp.microsecond) >= (16, 0, 0, 0):
+            day += np.timedelta64(1, 'D')
+        return self.roll_forward(day)
+
+    def trading_dates(self, timestamps):
+        """
+        Vectorized trading_date for an array of naive exchange-local timestamps.
+
+        :return: numpy datetime64[D] array (NaT where the timestamp is missing)
+        """
+        values = np.asarray(timestamps, dtype='datetime64[ns]')
+        days = values.astype('datetime64[D]')
+        days = np.where((values - days) >= np.timedelta64(16, 'h'), days + np.timedelta64(1, 'D'), days)
+
+        valid = ~np.isnat(days)
+        result = np.full(days.shape, np.datetime64('NaT'), dtype='datetime64[D]')
+        if valid.any():
+            sessions = self._sessions_for(days[valid].min(), days[valid].max())
+            result[valid] = sessions[np.searchsorted(sessions, days[valid], side='left')]
+        return result
+
+
+# Shared calendars per exchange
+_calendars = {}
+_calendars_lock = threading.Lock()
+
+def get_calendar(exchange='TSX') -> TradingCalendar:
+    """
+    Return the shared calendar of an exchange, rebuilt if its holidays were reloaded.
+    """
+    calendar = _calendars.get(exchange)
+    if calendar is None or calendar.version != holidays_version():
+        with _calendars_lock:
+            calendar = _calendars.get(exchange)
+            if calendar is None or calendar.version != holidays_version():
+                calendar = TradingCalendar(exchange)
+                _calendars[exchange] = calendar
+    return calendar
+
+def exchange_for_symbol(symbol: str) -> str:
+    """
+    Exchange whose calendar applies to a Yahoo symbol: TSX listings end in .TO
+    (the index is ^GSPTSE); other symbols are treated as NYSE listings.
+    """
+    return 'TSX' if symbol.endswith('.TO') or symbol == '^GSPTSE' else 'NYSE'
@@ -1,44 +1,37 @@
-from datetime import datetime, timedelta
-from utils.holiday_manager import load_holiday_dates_from_csv, is_holiday
+from utils.trading_calendar import get_calendar
 
-def get_next_trading_day(current_date):
+def get_next_trading_day(current_date, exchange='TSX'):
     """
     Get the next trading day excluding weekends and holidays.
-    
+
     :param current_date: The current date
+    :param exchange: Exchange whose calendar is used
     :return: The next valid trading day as a datetime.date object
     """
-    next_date = current_date + timedelta(days=1)
-    while next_date.weekday() >= 5 or is_holiday(next_date):  # Skip weekends and holidays
-        next_date += timedelta(days=1)
-    
-    return next_date
+    return get_calendar(exchange).next_session(current_date)
 
-def get_trading_date(timestamp_est):
+def get_trading_date(timestamp_est, exchange='TSX'):
     """
     Get the correct trading day for a given timestamp.
-    
+
     :param timestamp_est: A datetime object in EST
+    :param exchange: Exchange whose calendar is used
     :return: The next valid trading day as a datetime.date object
     """
-    four_pm_est = timestamp_est.replace(hour=16, minute=0, second=0, microsecond=0)
-    
-    if timestamp_est < four_pm_est:
-        trading_date = timestamp_est.date()  # Use current date
-    else:
-        trading_date = timestamp_est.date() + timedelta(days=1)  # Use next day
-    
-    # Check if the computed date is a valid trading day
-    if trading_date.weekday() >= 5 or is_holiday(trading_date):  # Weekend or holiday
-        return get_next_trading_day(trading_date)
-    
-    return trading_date
+    return get_calendar(exchange).trading_date(timestamp_est)
+
+def get_trading_dates(timestamps_est, exchange='TSX'):
+    """
+    Vectorized version of get_trading_date for a whole column of timestamps.
+
+    :param timestamps_est: Naive EST timestamps (pandas Series, DatetimeIndex or datetime64 array)
+    :param exchange: Exchange whose calendar is used
+    :return: numpy datetime64[D] array of trading days (NaT where the timestamp is missing)
+    """
+    return get_calendar(exchange).trading_dates(timestamps_est)
 
-def get_last_trading_date(timestamp_est):
+def get_last_trading_date(timestamp_est, exchange='TSX'):
     """
     Get the last trading day excluding weekends and holidays.
     """
-    trading_date = timestamp_est.date() 
-    while trading_date.weekday() >= 5 or is_holiday(trading_date):  # Skip weekends and holidays
-        trading_date -= timedelta(days=1)
-    return trading_date
+    return get_calendar(exchange).roll_back(timestamp_est)
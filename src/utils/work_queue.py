@@ -0,0 +1,342 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid as uuid_lib
+from datetime import date, datetime
+
+from utils.news_item import NewsItem
+
+# Article states, in order. Items that keep failing end up in FAILED instead of STORED.
+FETCHED = 'fetched'
+SCORING = 'scoring'
+SCORED = 'scored'
+STORED = 'stored'
+FAILED = 'failed'
+STATES = (FETCHED, SCORING, SCORED, STORED, FAILED)
+
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid_lib.uuid4().hex[:8]}"
+
+
+def owner_alive(owner) -> bool:
+    """
+    Whether the worker that took a lease may still be running: owners on other hosts
+    are assumed alive, owners on this host are alive while their process exists.
+    """
+    try:
+        host, pid, _ = owner.rsplit(':', 2)
+        pid = int(pid)
+    except ValueError:
+        return True
+    if host != socket.gethostname() or pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def _datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _date(value):
+    return date.fromisoformat(value) if value else None
+
+
+class WorkQueue:
+    """
+    Durable SQLite (WAL) queue of the articles of a run, one row per (symbol, uuid).
+
+    Articles move through fetched -> scoring -> scored -> stored. Scoring and
+    storing are done under a lease: a worker claims rows for `lease_seconds`, and
+    rows of a worker that died are claimed again by others once the lease has
+    expired, or at once after `reclaim` found that it died. Failed scoring attempts
+    are counted and retried with exponential backoff until `max_attempts`, after
+    which the article is marked failed until `requeue_failed` gives it another round.
+
+    Claims run in IMMEDIATE transactions, so several processes can drain the same
+    queue file without claiming a row twice. Each process opens its own queue; one
+    queue may be shared by the threads of a process.
+    """
+
+    def __init__(self, path, lease_seconds=600, max_attempts=5, retry_delay=30.0, owner=None, clock=time.time):
+        """
+        :param path: SQLite database file (created if missing)
+        :param lease_seconds: How long a claim is held before other workers may take the rows over
+        :param max_attempts: Scoring attempts before an article is marked failed
+        :param retry_delay: Delay before the first retry of a failed article (seconds), doubled per attempt
+        :param owner: Name of this worker in the leases; unique per process by default
+        :param clock: Function returning the current epoch time
+        """
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.owner = owner or default_owner()
+        self.clock = clock
+        self.lock = threading.Lock()
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+        self.connection = sqlite3.connect(str(path), timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS work_queue(
+                symbol TEXT NOT NULL,
+                uuid TEXT NOT NULL,
+                title TEXT,
+                link TEXT,
+                description TEXT,
+                published TEXT,
+                est_time TEXT,
+                trading_dt TEXT,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires REAL,
+                score INTEGER,
+                news_type TEXT,
+                comment TEXT,
+                error TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (symbol, uuid)
+            )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS work_queue_state ON work_queue (state, lease_expires)")
+
+    def _transaction(self, work):
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self.connection)
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+        return result
+
+    def enqueue(self, symbol, items) -> int:
+        """
+        Add fetched articles. Articles already in the queue, in any state, are ignored.
+
+        :return: Number of articles added
+        """
+        now = self.clock()
+        rows = [(symbol, item.uuid, item.title, item.link, item.description, _isoformat(item.published),
+                 _isoformat(item.est_time), _isoformat(item.trading_dt), FETCHED, now) for item in items]
+        if not rows:
+            return 0
+
+        def insert(connection):
+            before = connection.total_changes
+            connection.executemany("""
+                INSERT OR IGNORE INTO work_queue
+                    (symbol, uuid, title, link, description, published, est_time, trading_dt, state, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+            return connection.total_changes - before
+        return self._transaction(insert)
+
+    def reclaim(self) -> int:
+        """
+        Give back the rows leased by workers that are gone: leases that expired, and
+        leases of processes on this host that no longer run. Articles whose scoring
+        was interrupted after their last attempt are marked failed.
+
+        :return: Number of articles reclaimed
+        """
+        now = self.clock()
+
+        def reclaim(connection):
+            rows = connection.execute("""
+                SELECT symbol, uuid, lease_owner, lease_expires FROM work_queue
+                WHERE state IN (?, ?) AND lease_owner IS NOT NULL""", (SCORING, SCORED)).fetchall()
+            alive = {}
+            keys = []
+            for symbol, uuid, owner, expires in rows:
+                if owner not in alive:
+                    alive[owner] = owner_alive(owner)
+                if (expires or 0) <= now or not alive[owner]:
+                    keys.append((symbol, uuid))
+            connection.executemany("""
+                UPDATE work_queue
+                SET state = CASE WHEN state = ? THEN CASE WHEN attempts >= ? THEN ? ELSE ? END ELSE state END,
+                    lease_owner = NULL, lease_expires = NULL, updated = ?
+                WHERE symbol = ? AND uuid = ?""",
+                [(SCORING, self.max_attempts, FAILED, FETCHED, now, symbol, uuid) for symbol, uuid in keys])
+            return len(keys)
+        return self._transaction(reclaim)
+
+    def _claim(self, states, new_state, limit, count_attempt):
+        now = self.clock()
+        placeholders = ', '.join('?' * len(states))
+
+        def claim(connection):
+            rows = connection.execute(f"""
+                SELECT symbol, uuid, title, link, description, published, est_time, trading_dt,
+                       score, news_type, comment
+                FROM work_queue
+                WHERE state IN ({placeholders}) AND COALESCE(lease_expires, 0) <= ?
+                ORDER BY updated, symbol, uuid
+                LIMIT ?""", (*states, now, limit)).fetchall()
+            connection.executemany("""
+                UPDATE work_queue
+                SET state = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + ?, updated = ?
+                WHERE symbol = ? AND uuid = ?""",
+                [(new_state, self.owner, now + self.lease_seconds, int(count_attempt), now, row[0], row[1])
+                 for row in rows])
+            return rows
+
+        claimed = []
+        for symbol, uuid, title, link, description, published, est_time, trading_dt, score, news_type, comment \
+                in self._transaction(claim):
+            item = NewsItem(uuid, title, link, description, _datetime(published), _datetime(est_time),
+                            _date(trading_dt))
+            item.score, item.type, item.comment = score, news_type, comment
+            claimed.append((symbol, item))
+        return claimed
+
+    def claim_scoring(self, limit=64):
+        """
+        Claim fetched articles for scoring, including those whose previous scoring lease expired.
+
+        :return: List of (symbol, NewsItem)
+        """
+        self.fail_exhausted()
+        return self._claim((FETCHED, SCORING), SCORING, limit, count_attempt=True)
+
+    def claim_scored(self, limit=500):
+        """
+        Claim scored articles for storing; the items carry their sentiment.
+
+        :return: List of (symbol, NewsItem)
+        """
+        return self._claim((SCORED,), SCORED, limit, count_attempt=False)
+
+    def mark_scored(self, symbol, answers: dict) -> int:
+        """
+        Record the answers of claimed articles.
+
+        :param answers: dict of uuid to an object with score, type and comment
+        :return: Number of articles updated; rows whose lease was taken over are skipped
+        """
+        now = self.clock()
+        rows = [(SCORED, answer.score, answer.type, answer.comment, now, symbol, uuid, SCORING, self.owner)
+                for uuid, answer in answers.items()]
+        return self._update("""
+            UPDATE work_queue
+            SET state = ?, score = ?, news_type = ?, comment = ?, error = NULL,
+                lease_owner = NULL, lease_expires = NULL, updated = ?
+            WHERE symbol = ? AND uuid = ? AND state = ? AND lease_owner = ?""", rows)
+
+    def release(self, symbol, uuids, error=None) -> int:
+        """
+        Give claimed articles back after a failed scoring attempt. They are retried after a
+        backoff, or marked failed once they used up their attempts.
+
+        :return: Number of articles released
+        """
+        now = self.clock()
+
+        def release(connection):
+            released = 0
+            for uuid in uuids:
+                row = connection.execute(
+                    "SELECT attempts FROM work_queue WHERE symbol = ? AND uuid = ? AND state = ? AND lease_owner = ?",
+                    (symbol, uuid, SCORING, self.owner)).fetchone()
+                if row is None:
+                    continue
+                attempts = row[0]
+                state = FAILED if attempts >= self.max_attempts else FETCHED
+                retry_at = now + self.retry_delay * 2 ** (attempts - 1)
+                connection.execute("""
+                    UPDATE work_queue
+                    SET state = ?, error = ?, lease_owner = NULL, lease_expires = ?, updated = ?
+                    WHERE symbol = ? AND uuid = ?""",
+                    (state, str(error) if error is not None else None, retry_at, now, symbol, uuid))
+                released += 1
+            return released
+        return self._transaction(release)
+
+    def mark_stored(self, keys) -> int:
+        """
+        :param keys: Iterable of (symbol, uuid) claimed with claim_scored and written to ynews
+        :return: Number of articles updated
+        """
+        now = self.clock()
+        rows = [(STORED, now, symbol, uuid, SCORED, self.owner) for symbol, uuid in keys]
+        return self._update("""
+            UPDATE work_queue
+            SET state = ?, lease_owner = NULL, lease_expires = NULL, updated = ?
+            WHERE symbol = ? AND uuid = ? AND state = ? AND lease_owner = ?""", rows)
+
+    def _update(self, query, rows) -> int:
+        if not rows:
+            return 0
+
+        def update(connection):
+            before = connection.total_changes
+            connection.executemany(query, rows)
+            return connection.total_changes - before
+        return self._transaction(update)
+
+    def fail_exhausted(self) -> int:
+        """
+        Mark articles failed whose scoring lease expired after their last attempt.
+        """
+        now = self.clock()
+        return self._update("""
+            UPDATE work_queue SET state = ?, lease_owner = NULL, lease_expires = NULL, updated = ?
+            WHERE state = ? AND attempts >= ? AND lease_expires <= ?""",
+            [(FAILED, now, SCORING, self.max_attempts, now)])
+
+    def requeue_failed(self, symbols=None) -> int:
+        """
+        Give failed articles a new round of `max_attempts` scoring attempts.
+
+        :param symbols: Only requeue the articles of these symbols; all by default
+        :return: Number of articles requeued
+        """
+        now = self.clock()
+        query = """
+            UPDATE work_queue SET state = ?, attempts = 0, error = NULL, lease_owner = NULL,
+                lease_expires = NULL, updated = ?
+            WHERE state = ?"""
+        if symbols is None:
+            return self._update(query, [(FETCHED, now, FAILED)])
+        return self._update(query + " AND symbol = ?", [(FETCHED, now, FAILED, symbol) for symbol in symbols])
+
+    def counts(self) -> dict:
+        """
+        :return: dict of state to number of articles
+        """
+        with self.lock:
+            rows = self.connection.execute("SELECT state, COUNT(*) FROM work_queue GROUP BY state").fetchall()
+        return {state: dict(rows).get(state, 0) for state in STATES}
+
+    def pending(self) -> int:
+        """
+        Number of articles that are neither stored nor failed.
+        """
+        counts = self.counts()
+        return counts[FETCHED] + counts[SCORING] + counts[SCORED]
+
+    def purge(self, max_age_days) -> int:
+        """
+        Remove stored and failed articles last updated more than `max_age_days` ago. Stored
+        uuids are in ynews by then; failed articles are fetched and queued again if their
+        feed still lists them.
+        """
+        cutoff = self.clock() - max_age_days * 86400
+        return self._update("DELETE FROM work_queue WHERE state = ? AND updated < ?",
+                            [(STORED, cutoff), (FAILED, cutoff)])
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,181 @@
+import argparse
+import sys
+
+from utils import db
+
+# Per (symbol, trading day) aggregate of the scored ynews rows. Scores, means and the
+# positive/negative counts cover stories only; financial statement ('fs') rows are counted apart.
+YNEWS_DAILY_TABLE = """
+    CREATE TABLE IF NOT EXISTS ynews_daily(
+        symbol VARCHAR(32) NOT NULL,
+        trading_dt DATE NOT NULL,
+        news_count INT NOT NULL,
+        fs_count INT NOT NULL,
+        min_score INT,
+        max_score INT,
+        mean_score DOUBLE,
+        positive_count INT NOT NULL,
+        negative_count INT NOT NULL,
+        PRIMARY KEY (symbol, trading_dt)
+    )
+"""
+
+YNEWS_DAILY_FIELDS = ['news_count', 'fs_count', 'min_score', 'max_score', 'mean_score', 'positive_count',
+                      'negative_count']
+
+# Aggregate ynews rows matching {where} into ynews_daily, replacing the aggregates of the same days
+YNEWS_DAILY_REFRESH = f"""
+    INSERT INTO ynews_daily (symbol, trading_dt, {', '.join(YNEWS_DAILY_FIELDS)})
+    SELECT symbol, trading_dt,
+        COALESCE(SUM(news_type <> 'fs'), 0),
+        COALESCE(SUM(news_type = 'fs'), 0),
+        MIN(CASE WHEN news_type <> 'fs' THEN sentiment_score END),
+        MAX(CASE WHEN news_type <> 'fs' THEN sentiment_score END),
+        AVG(CASE WHEN news_type <> 'fs' THEN sentiment_score END),
+        COALESCE(SUM(news_type <> 'fs' AND sentiment_score > 0), 0),
+        COALESCE(SUM(news_type <> 'fs' AND sentiment_score < 0), 0)
+    FROM ynews
+    WHERE trading_dt IS NOT NULL AND {{where}}
+    GROUP BY symbol, trading_dt
+    ON DUPLICATE KEY UPDATE
+        {', '.join(f'{field} = VALUES({field})' for field in YNEWS_DAILY_FIELDS)}
+"""
+
+# Days refreshed per statement
+REFRESH_CHUNK_SIZE = 500
+
+REBUILD_HINT = "run `python src/main_sentiment_analyzer.py rebuild-daily` once to aggregate the stored news"
+
+
+class StaleAggregateError(RuntimeError):
+    """
+    ynews holds stories that are missing from ynews_daily, e.g. because the aggregate
+    was added to an existing database and never rebuilt.
+    """
+
+
+def touched_days(records) -> list:
+    """
+    Distinct (symbol, trading_dt) keys of ynews rows, as built by ynews_record; rows without a trading day are skipped.
+    """
+    return list(dict.fromkeys((record[1], record[3]) for record in records if record[3] is not None))
+
+
+def stored_days(cursor, uuids, chunk_size=REFRESH_CHUNK_SIZE) -> list:
+    """
+    Distinct (symbol, trading_dt) keys under which articles are stored, whichever ticker wrote them.
+    """
+    uuids = list(dict.fromkeys(uuids))
+    days = []
+    for start in range(0, len(uuids), chunk_size):
+        chunk = uuids[start:start + chunk_size]
+        cursor.execute(f"""
+            SELECT DISTINCT symbol, trading_dt FROM ynews
+            WHERE trading_dt IS NOT NULL AND uuid IN ({', '.join(['%s'] * len(chunk))})""", tuple(chunk))
+        days.extend(cursor.fetchall())
+    return list(dict.fromkeys(tuple(day) for day in days))
+
+
+def refresh_days(cursor, days, chunk_size=REFRESH_CHUNK_SIZE) -> int:
+    """
+    Recompute the aggregates of some days from ynews, inside the caller's transaction.
+
+    Recomputing instead of adding to the stored counts keeps the aggregate right when
+    an upsert rewrites the score of an article that was already counted.
+
+    :param days: (symbol, trading_dt) keys
+    :return: Number of days refreshed
+    """
+    days = list(days)
+    for start in range(0, len(days), chunk_size):
+        chunk = days[start:start + chunk_size]
+        where = f"(symbol, trading_dt) IN ({', '.join(['(%s, %s)'] * len(chunk))})"
+        cursor.execute(YNEWS_DAILY_REFRESH.format(where=where), tuple(value for day in chunk for value in day))
+    return len(days)
+
+
+def daily_table_exists(connection) -> bool:
+    rows = db.fetch_all(connection, """
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = 'ynews_daily'""")
+    return bool(rows[0][0])
+
+
+def create_ynews_daily(connection) -> bool:
+    """
+    Create the aggregate if it is missing, filled from the articles stored so far.
+
+    :return: True if the table was created
+    """
+    if daily_table_exists(connection):
+        return False
+    print(f"Aggregated news days: {rebuild_ynews_daily(connection)}")
+    return True
+
+
+def symbols_missing_daily(connection, symbols=None) -> list:
+    """
+    Symbols whose story days in ynews do not match their days in ynews_daily: the aggregate
+    was never built for them, or only partly (e.g. an interrupted rebuild, or days stored
+    before the writer maintained it).
+
+    :param symbols: Symbols to check; all symbols by default
+    """
+    params = tuple(symbols or ())
+    where = f"AND symbol IN ({', '.join(['%s'] * len(params))})" if params else ""
+    rows = db.fetch_all(connection, f"""
+        SELECT news.symbol
+        FROM (SELECT symbol, COUNT(DISTINCT trading_dt) AS days FROM ynews
+              WHERE trading_dt IS NOT NULL AND news_type <> 'fs' {where}
+              GROUP BY symbol) news
+        LEFT JOIN (SELECT symbol, COUNT(*) AS days FROM ynews_daily
+                   WHERE news_count > 0 {where}
+                   GROUP BY symbol) daily ON daily.symbol = news.symbol
+        WHERE COALESCE(daily.days, 0) <> news.days
+        ORDER BY news.symbol""", params * 2)
+    return [row[0] for row in rows]
+
+
+def rebuild_ynews_daily(connection, symbols=None) -> int:
+    """
+    Rebuild the aggregate from the full ynews history, e.g. after a backfill rescored articles.
+
+    :param symbols: Only rebuild these symbols; all symbols by default
+    :return: Number of days aggregated
+    """
+    params = tuple(symbols or ())
+    where = f"symbol IN ({', '.join(['%s'] * len(params))})" if params else "1 = 1"
+    cursor = connection.cursor()
+    try:
+        cursor.execute(YNEWS_DAILY_TABLE)
+        cursor.execute(f"DELETE FROM ynews_daily WHERE {where}", params)
+        cursor.execute(YNEWS_DAILY_REFRESH.format(where=where), params)
+        connection.commit()
+        cursor.execute(f"SELECT COUNT(*) FROM ynews_daily WHERE {where}", params)
+        return cursor.fetchone()[0]
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the ynews_daily aggregate from the ynews table")
+    parser.add_argument('symbols', nargs='*', help="symbols to rebuild (default: all)")
+    args = parser.parse_args(argv)
+
+    try:
+        connection = db.get_pool().acquire()
+    except Exception as e:
+        print("Error connecting to database:", e)
+        return 1
+
+    try:
+        print(f"Aggregated news days: {rebuild_ynews_daily(connection, args.symbols)}")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
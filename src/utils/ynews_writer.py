@@ -0,0 +1,125 @@
+import time
+
+from utils.ynews_daily import refresh_days, stored_days
+
+# Idempotent upsert: re-running a flush after a failure rewrites the same rows.
+# An article fanned out to several tickers stays with the ticker that stored it first.
+# Its score was asked for that ticker, so a write for another ticker leaves the row alone.
+YNEWS_UPSERT = """
+    INSERT INTO ynews(uuid, symbol, news_ts, trading_dt, title, link, description, news_type, sentiment_score, comment,
+                      sentiment_model)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        news_type = IF(symbol = VALUES(symbol), VALUES(news_type), news_type),
+        sentiment_score = IF(symbol = VALUES(symbol), VALUES(sentiment_score), sentiment_score),
+        comment = IF(symbol = VALUES(symbol), VALUES(comment), comment),
+        sentiment_model = IF(symbol = VALUES(symbol), VALUES(sentiment_model), sentiment_model)
+"""
+
+SENTIMENT_MODEL_COLUMN = """
+    SELECT COUNT(*)
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'ynews' AND COLUMN_NAME = 'sentiment_model'
+"""
+
+
+def add_sentiment_model_column(connection) -> bool:
+    """
+    Add the sentiment_model column to a ynews table created before it existed.
+
+    :return: True if the column was added, False if it was already there
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(SENTIMENT_MODEL_COLUMN)
+        if cursor.fetchone()[0]:
+            return False
+        cursor.execute("ALTER TABLE ynews ADD COLUMN sentiment_model VARCHAR(128)")
+        connection.commit()
+        return True
+    finally:
+        cursor.close()
+
+
+class YnewsWriter:
+    """
+    Buffers scored ynews rows and writes them with `executemany`, one commit per flush.
+
+    The buffer is flushed when it reaches `max_rows`, when `max_interval` seconds
+    have passed since the last flush, when `flush` is called explicitly (e.g. after
+    each ticker) and on `close`. Rows are only removed from the buffer after a
+    successful commit, so a crash loses at most the rows of one buffer and a failed
+    flush is retried with the same rows on the next flush.
+
+    The ynews_daily aggregates of the days touched by a flush are refreshed in the
+    same transaction, so the aggregate never disagrees with the committed rows.
+    """
+
+    def __init__(self, connection, max_rows=100, max_interval=30.0, daily=True):
+        """
+        :param connection: Open DB-API connection to the investments database
+        :param max_rows: Flush once this many rows are buffered
+        :param max_interval: Flush once this many seconds have passed since the last flush
+        :param daily: Keep the ynews_daily aggregate up to date
+        """
+        self.connection = connection
+        self.daily = daily
+        self.max_rows = max_rows
+        self.max_interval = max_interval
+        self.buffer = []
+        self.rows_written = 0
+        self.last_flush = time.monotonic()
+
+    def add(self, record):
+        """
+        Queue one ynews row, flushing if the row or time limit is reached.
+
+        :param record: Tuple of (uuid, symbol, news_ts, trading_dt, title, link,
+                       description, news_type, sentiment_score, comment, sentiment_model)
+        """
+        self.buffer.append(record)
+        if len(self.buffer) >= self.max_rows or time.monotonic() - self.last_flush >= self.max_interval:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Write all buffered rows in a single transaction.
+
+        :return: Number of rows written
+        """
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return 0
+
+        rows = list(self.buffer)
+        cursor = self.connection.cursor()
+        try:
+            cursor.executemany(YNEWS_UPSERT, rows)
+            if self.daily:
+                refresh_days(cursor, stored_days(cursor, [row[0] for row in rows]))
+            self.connection.commit()
+        except Exception as e:
+            print(f"Error writing {len(rows)} news rows: {e}")
+            self.connection.rollback()
+            return 0
+        finally:
+            cursor.close()
+
+        del self.buffer[:len(rows)]
+        self.rows_written += len(rows)
+        return len(rows)
+
+    def close(self):
+        """
+        Flush the remaining rows. Rows that still cannot be written are reported.
+        """
+        self.flush()
+        if self.buffer:
+            print(f"Discarding {len(self.buffer)} unwritten news rows")
+            self.buffer.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
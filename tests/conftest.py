@@ -0,0 +1,18 @@
+import pytest
+
+
+class FakeClock:
+    """
+    Epoch time source for the `clock` arguments of the queue and the coordinator; advance it by changing `now`.
+    """
+
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
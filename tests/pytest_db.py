@@ -0,0 +1,150 @@
+import threading
+
+import pytest
+from mysql.connector.errors import PoolError
+
+from utils import db
+
+
+class FakeCursor:
+    def __init__(self, prepared=False):
+        self.prepared = prepared
+        self.executed = []
+        self.closed = False
+
+    def execute(self, query, params=()):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        return [(1,)]
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class FakeRawConnection:
+    def __init__(self):
+        self.cursors = []
+        self.rollbacks = 0
+        self.closed = False
+
+    def cursor(self, prepared=False):
+        cursor = FakeCursor(prepared)
+        self.cursors.append(cursor)
+        return cursor
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+def test_db_config_from_environment(monkeypatch):
+    monkeypatch.setenv('DB_HOST', 'db.example')
+    monkeypatch.setenv('DB_POOL_SIZE', '3')
+    assert db.db_config()['host'] == 'db.example'
+    assert db.db_config()['database'] == 'investments'
+    assert db.ConnectionPool(connect=FakeRawConnection).size == 3
+
+
+def test_checkout_reuses_connections_and_times_out():
+    pool = db.ConnectionPool(size=2, timeout=0.05, recycle=3600, connect=FakeRawConnection)
+    first = pool.acquire()
+    raw = first._entry.raw
+    with pool.connection():
+        with pytest.raises(PoolError):
+            pool.acquire()
+    first.close()
+    first.close()  # returning twice is harmless
+
+    with pool.connection() as connection:
+        assert connection._entry.raw is raw
+        assert connection.rollbacks == 1
+    assert pool.opened == 2
+    with pytest.raises(PoolError):
+        first.cursor()
+    with pytest.raises(PoolError):
+        first.prepared("SELECT 1")
+
+
+def test_old_connections_are_recycled():
+    pool = db.ConnectionPool(size=1, timeout=1, recycle=0, connect=FakeRawConnection)
+    with pool.connection() as connection:
+        raw = connection._entry.raw
+    with pool.connection() as connection:
+        assert connection._entry.raw is not raw
+    assert raw.closed
+
+
+def test_prepared_statements_survive_checkouts():
+    pool = db.ConnectionPool(size=1, timeout=1, recycle=3600, connect=FakeRawConnection)
+    query = "SELECT 1 FROM ynews WHERE uuid = %s"
+    with pool.connection() as connection:
+        assert db.fetch_all(connection, query, ('a',)) == [(1,)]
+        cursor = connection.prepared(query)
+    with pool.connection() as connection:
+        db.fetch_all(connection, query, ('b',))
+        assert connection.prepared(query) is cursor
+    assert cursor.prepared and not cursor.closed
+    assert cursor.executed == [(query, ('a',)), (query, ('b',))]
+
+    # Plain connections get a short-lived cursor
+    raw = FakeRawConnection()
+    db.fetch_all(raw, query, ('c',))
+    assert raw.cursors[0].closed and not raw.cursors[0].prepared
+
+
+def test_prepared_statements_are_bounded(monkeypatch):
+    monkeypatch.setattr(db, 'MAX_PREPARED_STATEMENTS', 2)
+    pool = db.ConnectionPool(size=1, timeout=1, recycle=3600, connect=FakeRawConnection)
+    # IN lists of different lengths are different query texts
+    queries = [f"SELECT 1 FROM ynews WHERE symbol IN ({', '.join(['%s'] * n)})" for n in range(1, 4)]
+    with pool.connection() as connection:
+        first = connection.prepared(queries[0])
+        second = connection.prepared(queries[1])
+        assert connection.prepared(queries[0]) is first  # now the most recently used
+        third = connection.prepared(queries[2])
+
+        assert second.closed and not first.closed and not third.closed
+        assert list(connection._entry.statements) == [queries[0], queries[2]]
+
+
+def test_worker_connection_per_thread():
+    pool = db.ConnectionPool(size=4, timeout=1, recycle=3600, connect=FakeRawConnection)
+    seen = {}
+
+    def worker(name):
+        connection = pool.worker_connection()
+        assert pool.worker_connection() is connection
+        seen[name] = connection._entry.raw
+        pool.release_worker()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(seen) == 3
+    assert pool.idle.qsize() == pool.opened
+    pool.close()
+    assert all(raw.closed for raw in seen.values())
+
+
+def test_worker_connection_comes_from_the_process_pool(monkeypatch):
+    pool = db.ConnectionPool(size=2, timeout=1, recycle=3600, connect=FakeRawConnection)
+    monkeypatch.setattr(db, 'get_pool', lambda: pool)
+
+    connection = db.worker_connection()
+    assert db.worker_connection() is connection
+    # Leaving a with block returns it; the next call checks out again
+    with connection:
+        pass
+    assert db.worker_connection() is not connection
+    assert pool.opened == 1
@@ -0,0 +1,79 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+import statsmodels.api as sm
+from sklearn.metrics import r2_score
+from sklearn.model_selection import train_test_split
+
+from utils.event_regression import event_frame, fit_event_regressions
+
+
+def make_rows(symbol, n, seed):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n):
+        min_score = -float(rng.integers(0, 10))
+        max_score = float(rng.integers(0, 10))
+        index_changes = rng.normal(0, 0.01, 5)
+        changes = 0.002 * max_score + 0.001 * min_score + 0.8 * index_changes + rng.normal(0, 0.01, 5)
+        rows.append([symbol, date(2024, 1, 1) + timedelta(days=i), min_score, max_score, 10.0,
+                     *changes, *index_changes])
+    return rows
+
+
+def test_ticker_models_match_statsmodels():
+    data = make_rows('AAA', 60, 1) + make_rows('BBB', 45, 2)
+    results = fit_event_regressions(data, pooled=False)
+    assert len(results) == 2 * 5 * 3
+
+    df = event_frame(data)
+    for symbol in ['AAA', 'BBB']:
+        ticker = df[df['symbol'] == symbol].reset_index(drop=True)
+        for h, (stock, index) in enumerate([('price_change', 'tsx_price_change'),
+                                            ('t3_price_change', 'tsx_t3_price_change')]):
+            horizon = 0 if h == 0 else 3
+            X = ticker[['min_score', 'max_score', index]]
+            y = ticker[stock]
+            full = sm.OLS(y, X).fit()
+            reduced = sm.OLS(y, ticker[index]).fit()
+            f_stat, f_pvalue, _ = full.compare_f_test(reduced)
+
+            X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+            oos_r2 = r2_score(y_test, sm.OLS(y_train, X_train).fit().predict(X_test))
+
+            rows = results[(results['symbol'] == symbol) & (results['horizon'] == horizon)]
+            assert rows['coef'].to_numpy() == pytest.approx(full.params.to_numpy())
+            assert rows['std_err'].to_numpy() == pytest.approx(full.bse.to_numpy())
+            assert rows['p_value'].to_numpy() == pytest.approx(full.pvalues.to_numpy())
+            assert rows['r2'].iloc[0] == pytest.approx(full.rsquared)
+            assert rows['f_stat'].iloc[0] == pytest.approx(f_stat)
+            assert rows['f_pvalue'].iloc[0] == pytest.approx(f_pvalue)
+            assert rows['oos_r2'].iloc[0] == pytest.approx(oos_r2)
+            assert rows['nobs'].iloc[0] == len(ticker)
+
+
+def test_pooled_model_with_ticker_fixed_effects():
+    data = make_rows('AAA', 60, 1) + make_rows('BBB', 45, 2) + make_rows('CCC', 8, 3)
+    results = fit_event_regressions(data)
+    pooled = results[results['model'] == 'pooled']
+    # CCC has too few rows for its own model but still enters the panel
+    assert set(results.loc[results['model'] == 'ticker', 'symbol']) == {'AAA', 'BBB'}
+    assert len(pooled) == 5 * 3
+
+    df = event_frame(data)
+    dummies = df['symbol'].str.get_dummies()
+    X = np.column_stack([df[['min_score', 'max_score', 'tsx_t1_price_change']], dummies])
+    model = sm.OLS(df['t1_price_change'].to_numpy(), X).fit()
+
+    rows = pooled[pooled['horizon'] == 1]
+    assert rows['coef'].to_numpy() == pytest.approx(model.params[:3])
+    assert rows['std_err'].to_numpy() == pytest.approx(model.bse[:3])
+    # The dummies are an implicit constant, so R-squared is centered
+    assert model.k_constant == 1
+    assert rows['r2'].iloc[0] == pytest.approx(model.rsquared)
+    assert rows['nobs'].iloc[0] == len(df)
+
+
+def test_empty_input():
+    assert fit_event_regressions([]).empty
@@ -0,0 +1,102 @@
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+import pytest
+
+from utils.feed_fetcher import FeedCache, batch_symbols, fan_out_entries, fetch_feed, iter_feeds
+
+RSS = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>t</title>
+<item><guid>abc-1</guid><title>News Title</title><link>http://link.com</link>
+<pubDate>Mon, 01 Jan 2023 12:00:00 +0000</pubDate><description>Sample</description></item>
+</channel></rss>"""
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/rss+xml')
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write(RSS)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def feed_server():
+    server = HTTPServer(('127.0.0.1', 0), FeedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/rss"
+    server.shutdown()
+
+
+def test_fetch_feed_parses_and_returns_validators(feed_server):
+    status, feed, etag, modified = fetch_feed(feed_server)
+    assert status == 200
+    assert feed.entries[0].id == 'abc-1'
+    assert etag == '"v1"'
+
+
+def test_fetch_feed_not_modified(feed_server):
+    status, feed, etag, modified = fetch_feed(feed_server, etag='"v1"')
+    assert status == 304
+    assert feed is None
+
+
+def test_iter_feeds_uses_cache(feed_server, tmp_path):
+    cache = FeedCache(tmp_path / 'feed_cache.json')
+    urls = {symbol: f"{feed_server}?s={symbol}" for symbol in ['RY', 'TD', 'BMO']}
+
+    results = list(iter_feeds(urls, cache, concurrency=2, timeout=5))
+    assert sorted(r.key for r in results) == ['BMO', 'RY', 'TD']
+    assert all(r.status == 200 for r in results)
+
+    for r in results:
+        cache.update(r.key, r.etag, r.modified)
+    cache.save()
+
+    results = list(iter_feeds(urls, FeedCache(tmp_path / 'feed_cache.json'), concurrency=2, timeout=5))
+    assert all(r.status == 304 and r.feed is None for r in results)
+
+
+def test_iter_feeds_loads_feedparser_before_the_threads_use_it(feed_server):
+    # A fresh interpreter, so feedparser is still an unloaded lazy module when the threads start
+    code = ("from utils.feed_fetcher import iter_feeds; "
+            f"urls = {{str(i): '{feed_server}?s=' + str(i) for i in range(8)}}; "
+            "results = list(iter_feeds(urls, concurrency=8, timeout=5)); "
+            "print(sorted(repr(r.error) for r in results if r.error)); "
+            "print(sum(r.status == 200 for r in results))")
+    src_dir = Path(__file__).parent.parent / 'src'
+    result = subprocess.run([sys.executable, '-c', code], cwd=src_dir, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split('\n')[:2] == ['[]', '8']
+
+
+def test_iter_feeds_reports_errors():
+    results = list(iter_feeds({'RY': 'http://127.0.0.1:1/rss'}, timeout=1))
+    assert results[0].error is not None
+
+
+def test_batch_symbols():
+    assert batch_symbols(['RY', 'TD', 'BMO'], 2) == ['RY,TD', 'BMO']
+    assert batch_symbols(['RY', 'TD'], 1) == ['RY', 'TD']
+
+
+def test_fan_out_entries_dedups_and_uses_tags():
+    shared = {'id': '1', 'tags': [{'term': 'RY'}, {'term': 'TD'}]}
+    bmo_only = {'id': '2', 'tags': [{'term': 'bmo'}]}
+    untagged = {'id': '3'}
+
+    by_symbol = fan_out_entries([shared, bmo_only, dict(shared), untagged], ['RY', 'TD', 'BMO'])
+    assert [e['id'] for e in by_symbol['RY']] == ['1', '3']
+    assert [e['id'] for e in by_symbol['TD']] == ['1', '3']
+    assert [e['id'] for e in by_symbol['BMO']] == ['2', '3']
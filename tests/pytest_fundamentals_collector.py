@@ -0,0 +1,92 @@
+import threading
+import time
+from datetime import date
+
+from utils.fundamentals_collector import (FUNDAMENTAL_FIELDS, FundamentalsCache, collect_fundamentals,
+                                          store_fundamentals)
+
+
+class LocalInfo:
+    """
+    Stand-in for Yahoo Finance: slow info responses and a count of concurrent calls.
+    """
+
+    def __init__(self, delay=0.05, failing=()):
+        self.delay = delay
+        self.failing = set(failing)
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, symbol):
+        with self.lock:
+            self.calls.append(symbol)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if symbol in self.failing:
+                raise ConnectionError("no response")
+            return {'trailingPE': 12.5, 'marketCap': 1000, 'beta': 0.9, 'longName': symbol}
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def executemany(self, query, rows):
+        self.connection.calls.append((query, rows))
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.calls = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_collect_in_parallel_and_store_in_one_batch():
+    symbols = [f"S{i}.TO" for i in range(12)]
+    fetch = LocalInfo(failing={'S3.TO'})
+    start = time.monotonic()
+    payloads = collect_fundamentals(symbols, date(2024, 3, 1), fetch=fetch, max_workers=4)
+
+    assert time.monotonic() - start < 12 * fetch.delay
+    assert 1 < fetch.max_active <= 4
+    assert list(payloads) == [symbol for symbol in symbols if symbol != 'S3.TO']
+
+    connection = FakeConnection()
+    assert store_fundamentals(connection, date(2024, 3, 1), payloads) == 11
+    assert len(connection.calls) == 1 and connection.commits == 1
+    query, rows = connection.calls[0]
+    assert 'ON DUPLICATE KEY UPDATE' in query
+    assert rows[0] == ('S0.TO', date(2024, 3, 1), 12.5, None, None, None, None, None, 1000, 0.9, None, None)
+    assert all(len(row) == len(FUNDAMENTAL_FIELDS) + 2 for row in rows)
+
+
+def test_cache_reuses_payloads_of_the_same_trading_date(tmp_path):
+    cache = FundamentalsCache(tmp_path)
+    fetch = LocalInfo(delay=0)
+    collect_fundamentals(['RY.TO', 'TD.TO'], date(2024, 3, 1), fetch=fetch, cache=cache)
+    second = collect_fundamentals(['RY.TO', 'TD.TO'], date(2024, 3, 1), fetch=fetch, cache=cache)
+    assert sorted(fetch.calls) == ['RY.TO', 'TD.TO']
+    assert second['RY.TO']['longName'] == 'RY.TO'
+    assert cache.hits == 2
+
+    # A new trading date and an expired payload are fetched again
+    collect_fundamentals(['RY.TO'], date(2024, 3, 4), fetch=fetch, cache=cache)
+    expired = FundamentalsCache(tmp_path, ttl_hours=0)
+    collect_fundamentals(['TD.TO'], date(2024, 3, 1), fetch=fetch, cache=expired)
+    assert len(fetch.calls) == 4
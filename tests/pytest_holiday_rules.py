@@ -0,0 +1,123 @@
+from datetime import date
+from pathlib import Path
+
+import utils.holiday_manager as hm
+from utils.holiday_rules import easter_sunday, nyse_holidays, tsx_holidays
+
+data_dir = Path(__file__).parent.parent / 'data'
+
+
+def test_easter_sunday():
+    assert easter_sunday(2019) == date(2019, 4, 21)
+    assert easter_sunday(2024) == date(2024, 3, 31)
+    assert easter_sunday(2038) == date(2038, 4, 25)
+
+
+def test_rules_match_published_calendars():
+    for rules, csv_file, exceptions in [(tsx_holidays, 'tsx_holidays.csv', set()),
+                                        (nyse_holidays, 'nyse_holidays.csv', {date(2025, 1, 9)})]:
+        years = (2024, 2025, 2026)
+        generated = set().union(*(rules(year) for year in years))
+        published = {day for day in hm.read_holiday_dates(data_dir / csv_file) if day.year in years}
+        assert generated == published - exceptions
+
+
+def test_tsx_observed_and_in_lieu_days():
+    # Christmas on Saturday, Boxing Day on Sunday
+    assert {date(2021, 12, 27), date(2021, 12, 28)} <= tsx_holidays(2021)
+    # New Year's Day on Saturday and Canada Day on Saturday move to Monday
+    assert date(2022, 1, 3) in tsx_holidays(2022)
+    assert date(2023, 7, 3) in tsx_holidays(2023)
+    assert date(2017, 8, 7) in tsx_holidays(2017)  # Civic Holiday
+
+
+def test_snapshot_round_trip(tmp_path, monkeypatch):
+    path = tmp_path / 'tsx.bin'
+    hm.write_holiday_snapshot('TSX', path, 2017, 2030)
+    assert path.stat().st_size < 400
+
+    monkeypatch.setattr(hm, 'snapshot_files', {'TSX': path})
+    monkeypatch.setattr(hm, '_snapshots', {})
+    monkeypatch.setattr(hm, '_year_holidays', {})
+    assert hm.year_holidays('TSX', 2021) == tsx_holidays(2021)
+    assert hm._snapshots['TSX'][:2] == (2017, 2030)
+    # years outside the snapshot fall back to the rules
+    assert hm.year_holidays('TSX', 2035) == tsx_holidays(2035)
+
+
+def test_outdated_snapshot_is_ignored(tmp_path, monkeypatch):
+    path = tmp_path / 'tsx.bin'
+    hm.write_holiday_snapshot('TSX', path, 2017, 2030)
+    overrides = tmp_path / 'overrides.csv'
+    overrides.write_text("holiday_name,holiday_date\nSpecial Closure,2027-06-15\n")
+
+    monkeypatch.setattr(hm, 'snapshot_files', {'TSX': path})
+    monkeypatch.setattr(hm, 'holiday_files', {'TSX': overrides})
+    monkeypatch.setattr(hm, '_snapshots', {})
+    monkeypatch.setattr(hm, '_overrides', {})
+    monkeypatch.setattr(hm, '_year_holidays', {})
+    assert hm.is_holiday(date(2027, 6, 15))
+    assert hm._snapshots['TSX'] is None
+
+
+def test_holidays_start_when_introduced():
+    assert date(2007, 2, 19) not in tsx_holidays(2007)  # Family Day from 2008
+    assert date(2008, 2, 18) in tsx_holidays(2008)
+    assert date(1997, 1, 20) not in nyse_holidays(1997)  # MLK Day from 1998
+    assert date(1998, 1, 19) in nyse_holidays(1998)
+
+
+def test_snapshot_notices_same_size_edit(tmp_path, monkeypatch):
+    overrides = tmp_path / 'overrides.csv'
+    overrides.write_text("holiday_name,holiday_date\nSpecial Closure,2027-06-15\n")
+    monkeypatch.setattr(hm, 'holiday_files', {'TSX': overrides})
+    monkeypatch.setattr(hm, '_overrides', {})
+    path = tmp_path / 'tsx.bin'
+    hm.write_holiday_snapshot('TSX', path, 2017, 2030)
+
+    overrides.write_text("holiday_name,holiday_date\nSpecial Closure,2027-06-16\n")
+    monkeypatch.setattr(hm, 'snapshot_files', {'TSX': path})
+    monkeypatch.setattr(hm, '_snapshots', {})
+    monkeypatch.setattr(hm, '_overrides', {})
+    monkeypatch.setattr(hm, '_year_holidays', {})
+    assert hm.is_holiday(date(2027, 6, 16))
+    assert not hm.is_holiday(date(2027, 6, 15))
+    assert hm._snapshots['TSX'] is None
+
+
+def use_snapshot(monkeypatch, path):
+    monkeypatch.setattr(hm, 'snapshot_files', {'TSX': path})
+    monkeypatch.setattr(hm, '_snapshots', {})
+    monkeypatch.setattr(hm, '_year_holidays', {})
+
+
+def test_snapshot_of_other_rules_is_ignored(tmp_path, monkeypatch):
+    rules = tmp_path / 'holiday_rules.py'
+    rules.write_bytes(hm.rules_file.read_bytes())
+    monkeypatch.setattr(hm, 'rules_file', rules)
+    path = tmp_path / 'tsx.bin'
+    hm.write_holiday_snapshot('TSX', path, 2017, 2030)
+
+    rules.write_bytes(rules.read_bytes() + b'\n# changed rule\n')
+    use_snapshot(monkeypatch, path)
+    assert hm.year_holidays('TSX', 2021) == tsx_holidays(2021)
+    assert hm._snapshots['TSX'] is None
+
+
+def test_damaged_snapshot_falls_back_to_the_rules(tmp_path, monkeypatch):
+    path = tmp_path / 'tsx.bin'
+    hm.write_holiday_snapshot('TSX', path, 2017, 2030)
+    data = path.read_bytes()
+
+    for damaged in (data[:5], data[:-1], data[:hm.SNAPSHOT_HEADER.size] + b'\xff\xff' * 3):
+        path.write_bytes(damaged)
+        use_snapshot(monkeypatch, path)
+        assert hm.year_holidays('TSX', 2021) == tsx_holidays(2021)
+        assert hm._snapshots['TSX'] is None
+
+
+def test_nyse_one_off_closures():
+    closures = [date(2001, 9, 11), date(2001, 9, 14), date(2004, 6, 11), date(2007, 1, 2),
+                date(2012, 10, 29), date(2012, 10, 30), date(2018, 12, 5), date(2025, 1, 9)]
+    assert all(hm.is_holiday(day, 'NYSE') for day in closures)
+    assert not hm.is_holiday(date(2001, 9, 10), 'NYSE')
@@ -0,0 +1,167 @@
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+
+import utils.load_stock_prices as lsp
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = []
+
+    def execute(self, query, params):
+        self.connection.queries.append(query)
+        if 'MAX(close_dt)' in query:
+            self.result = [(symbol, last_dt) for symbol, last_dt in self.connection.last_dates.items()
+                           if symbol in params]
+        else:
+            symbol, first_dt, last_dt = params
+            self.result = [(close_dt,) for (row_symbol, close_dt) in self.connection.stored
+                           if row_symbol == symbol and first_dt <= close_dt <= last_dt]
+
+    def executemany(self, query, rows):
+        self.connection.queries.append(query)
+        self.connection.batches.append(len(rows))
+        if len(self.connection.batches) in self.connection.failing_batches:
+            raise RuntimeError("Lost connection")
+        # MySQL upsert row counts: 1 per insert, 2 per changed row, 0 per unchanged row
+        self.rowcount = 0
+        for row in rows:
+            key = row[:2]
+            if key not in self.connection.stored:
+                self.rowcount += 1
+            elif self.connection.stored[key] != row[2:]:
+                self.rowcount += 2
+            self.connection.stored[key] = row[2:]
+            self.connection.rows.append(row)
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, last_dates):
+        self.last_dates = last_dates
+        self.queries = []
+        self.rows = []
+        self.batches = []
+        self.stored = {}
+        self.failing_batches = set()  # 1-based numbers of the executemany calls that fail
+        self.commit_error = None
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        if self.commit_error:
+            raise self.commit_error
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def fake_download(calls):
+    def download(symbols, start=None, end=None, **kwargs):
+        calls.append((list(symbols), start))
+        dates = pd.bdate_range(start, '2024-03-08', name='Date')
+        frames = {}
+        for symbol in symbols:
+            if symbol == 'GONE.TO':
+                continue
+            values = np.arange(len(dates), dtype=float) + 10
+            frames[symbol] = pd.DataFrame({'Open': values, 'High': values, 'Low': values, 'Close': values,
+                                           'Adj Close': values, 'Volume': 1000}, index=dates)
+        return pd.concat(frames, axis=1)
+    return download
+
+
+def test_incremental_load_downloads_tail_in_batches():
+    connection = FakeConnection({'RY.TO': date(2024, 3, 1), 'TD.TO': date(2024, 3, 1), 'BMO.TO': date(2024, 2, 23)})
+    calls = []
+    symbols = ['RY.TO', 'TD.TO', 'BMO.TO', 'NEW.TO', 'GONE.TO']
+    inserted, updated = lsp.load_prices(connection, symbols, batch_size=2, download=fake_download(calls))
+
+    # One MAX(close_dt) query for all symbols
+    assert sum('MAX(close_dt)' in query for query in connection.queries) == 1
+    assert calls == [
+        (['NEW.TO', 'GONE.TO'], lsp.PRICE_HISTORY_START),
+        (['BMO.TO'], '2024-02-15'),  # Family Day 2024-02-19 is skipped
+        (['RY.TO', 'TD.TO'], '2024-02-23'),
+    ]
+    assert inserted == len(connection.rows)
+    assert updated == 0
+    assert {row[0] for row in connection.rows} == {'RY.TO', 'TD.TO', 'BMO.TO', 'NEW.TO'}
+
+
+def test_full_refresh_skips_last_dates():
+    connection = FakeConnection({'RY.TO': date(2024, 3, 1)})
+    calls = []
+    lsp.load_prices(connection, ['RY.TO'], full_refresh=True, download=fake_download(calls))
+    assert calls == [(['RY.TO'], lsp.PRICE_HISTORY_START)]
+    assert not any('MAX(close_dt)' in query for query in connection.queries)
+
+
+def test_download_start_uses_exchange_sessions():
+    # Good Friday 2024-03-29 is a TSX holiday
+    assert lsp.download_start('RY.TO', date(2024, 4, 5)) == '2024-03-28'
+    assert lsp.download_start('^GSPTSE', None) == lsp.PRICE_HISTORY_START
+
+
+def test_store_stock_data_counts_inserts_and_updates():
+    dates = pd.bdate_range('2024-01-01', periods=5, name='Date')
+    data = pd.DataFrame({'Open': [10.004, 10.006, np.nan, 11.0, 12.0], 'High': 12.0, 'Low': 9.0,
+                         'Close': 10.5, 'Adj Close': 10.25, 'Volume': [100, 200, np.nan, 400, 500]}, index=dates)
+    connection = FakeConnection({})
+
+    assert lsp.store_stock_data(connection, 'RY.TO', lsp.price_frame(data, 'RY.TO'), chunk_size=2) == (5, 0)
+    assert connection.batches == [2, 2, 1]
+    first = connection.rows[0]
+    assert first[:3] == ('RY.TO', date(2024, 1, 1), 10.0)
+    assert connection.rows[1][2] == 10.01
+    assert connection.rows[2][2] is None and connection.rows[2][7] is None
+    assert isinstance(first[7], int)
+
+    # Two revised closes and one new day
+    revised = pd.concat([data, pd.DataFrame(data.iloc[-1:].to_numpy(), columns=data.columns,
+                                            index=pd.DatetimeIndex(['2024-01-08'], name='Date'))])
+    revised.loc[revised.index[:2], 'Adj Close'] = 10.3
+    assert lsp.store_stock_data(connection, 'RY.TO', lsp.price_frame(revised, 'RY.TO')) == (1, 2)
+
+
+def test_store_stock_data_counts_committed_rows_only():
+    dates = pd.bdate_range('2024-01-01', periods=5, name='Date')
+    data = pd.DataFrame({'Open': 10.0, 'High': 12.0, 'Low': 9.0, 'Close': 10.5, 'Adj Close': 10.25,
+                         'Volume': 100}, index=dates)
+    connection = FakeConnection({})
+    connection.failing_batches = {2}
+    assert lsp.store_stock_data(connection, 'RY.TO', lsp.price_frame(data, 'RY.TO'), chunk_size=2) == (3, 0)
+
+    connection = FakeConnection({})
+    connection.commit_error = RuntimeError("Deadlock found")
+    assert lsp.store_stock_data(connection, 'RY.TO', lsp.price_frame(data, 'RY.TO')) == (0, 0)
+    assert connection.rollbacks == 1
+
+
+def test_every_shard_worker_loads_the_index():
+    coordinator = MagicMock()
+    coordinator.join.return_value = {3}
+    coordinator.symbol_rounds.return_value = iter([['RY'], ['TD']])
+    with patch.object(lsp.db, 'get_pool'), \
+            patch.object(lsp, 'seed_registry', return_value=['RY', 'TD']), \
+            patch.object(lsp, 'ShardCoordinator', return_value=coordinator), \
+            patch.object(lsp, 'load_prices', return_value=(0, 0)) as load_prices, \
+            patch.object(lsp, 'collect_fundamentals', return_value={}) as collect, \
+            patch.object(lsp, 'store_fundamentals', return_value=0):
+        lsp.main(['--shards'])
+
+    # The index first, then the held shards and those taken over during the run
+    assert [call.args[1] for call in load_prices.call_args_list] == [['^GSPTSE'], ['RY.TO'], ['TD.TO']]
+    assert collect.call_args[0][0] == ['RY.TO', 'TD.TO']
+    coordinator.stop.assert_called_once()
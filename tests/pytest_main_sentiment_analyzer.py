@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import main_sentiment_analyzer as cli
+
+src_dir = Path(__file__).parent.parent / 'src'
+
+
+def test_analyzer_import_is_lazy_and_needs_no_api_key():
+    env = {key: value for key, value in os.environ.items() if key != 'OPENAI_API_KEY'}
+    # type() does not trigger loading; a lazily imported module that was used is a plain module
+    code = ("import sys, stock_news_sentiment_analyzer; "
+            "print([type(sys.modules[name]).__name__ for name in ('pandas', 'openai', 'feedparser', 'mysql.connector') "
+            "if name in sys.modules])")
+    result = subprocess.run([sys.executable, '-c', code], cwd=src_dir, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == str(['_LazyModule'] * 3)
+
+
+def test_lazy_module_loads_on_first_use():
+    code = ("from utils.lazy import lazy_import; csv = lazy_import('csv'); "
+            "print(type(csv).__name__, csv.QUOTE_ALL, type(csv).__name__)")
+    result = subprocess.run([sys.executable, '-c', code], cwd=src_dir, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['_LazyModule', '1', 'module']
+
+
+def test_commands_dispatch_remaining_arguments(monkeypatch):
+    calls = []
+    monkeypatch.setattr(cli, 'load_command', lambda name: lambda argv: calls.append((name, argv)))
+    cli.main(['analyze', '--workers', '2', '--all'])
+    cli.main(['fetch'])
+    assert calls == [('analyze', ['--workers', '2', '--all']), ('fetch', [])]
+
+
+def test_every_command_has_a_main():
+    for name, (module_name, _) in cli.COMMANDS.items():
+        assert callable(cli.load_command(name))
+
+
+def test_pydantic_and_numpy_load_on_first_use():
+    code = ("import sys, stock_news_sentiment_analyzer as analyzer; "
+            "print(type(sys.modules['numpy']).__name__, 'pydantic' in sys.modules, "
+            "analyzer.SentimentAnswer.__name__, 'pydantic' in sys.modules)")
+    result = subprocess.run([sys.executable, '-c', code], cwd=src_dir, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['_LazyModule', 'False', 'SentimentAnswer', 'True']
+
+
+def test_commands_fail_without_database(monkeypatch):
+    import mysql.connector
+    from utils import db
+
+    def unavailable():
+        raise mysql.connector.Error("Can't connect to MySQL server")
+    monkeypatch.setattr(db, 'get_pool', unavailable)
+    for name in ('fetch', 'score', 'load-prices', 'analyze', 'rebuild-daily'):
+        assert cli.main([name]) == 1, name
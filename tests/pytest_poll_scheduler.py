@@ -0,0 +1,81 @@
+from datetime import datetime
+
+import pytest
+
+from utils.poll_scheduler import (CLOSED_FACTOR, CUTOFF_FACTOR, EARNINGS_FACTOR, EXCHANGE_TZ, OVERNIGHT_FACTOR,
+                                  PollScheduler, market_factor)
+
+
+def at(*args):
+    return EXCHANGE_TZ.localize(datetime(*args))
+
+
+def test_market_factor_by_phase():
+    assert market_factor(at(2024, 3, 26, 11, 0)) == 1.0
+    assert market_factor(at(2024, 3, 26, 15, 30)) == CUTOFF_FACTOR
+    assert market_factor(at(2024, 3, 26, 2, 0)) == OVERNIGHT_FACTOR
+    assert market_factor(at(2024, 3, 29, 11, 0)) == CLOSED_FACTOR  # Good Friday
+    assert market_factor(at(2024, 3, 30, 11, 0)) == CLOSED_FACTOR  # Saturday
+    assert market_factor(at(2024, 5, 7, 15, 30)) == EARNINGS_FACTOR * CUTOFF_FACTOR
+
+
+def test_interval_follows_market_phase():
+    scheduler = PollScheduler([], min_interval=60, max_interval=3600, initial_interval=400)
+    assert scheduler.interval('RY', at(2024, 3, 26, 11, 0).timestamp()) == 400
+    assert scheduler.interval('RY', at(2024, 3, 26, 15, 30).timestamp()) == 100
+    assert scheduler.interval('RY', at(2024, 3, 26, 2, 0).timestamp()) == 1200
+    assert scheduler.interval('RY', at(2024, 3, 29, 11, 0).timestamp()) == 1600
+    # Clamped to the bounds
+    assert scheduler.interval('RY', at(2024, 5, 7, 15, 30).timestamp()) == 60
+
+
+def test_pop_due_in_time_order():
+    now = at(2024, 3, 26, 11, 0).timestamp()
+    scheduler = PollScheduler(['RY', 'TD'], clock=lambda: now)
+    assert scheduler.pop_due() == ['RY', 'TD']
+    assert scheduler.next_due() is None
+
+    scheduler.record('TD', 0, now)
+    scheduler.record('RY', 0, now + 10)
+    assert scheduler.pop_due(now + 299) == []
+    assert scheduler.pop_due(now + 310) == ['TD', 'RY']
+
+
+def test_busy_tickers_are_polled_more_often():
+    start = at(2024, 3, 26, 10, 0).timestamp()
+    scheduler = PollScheduler(['RY', 'TD'], min_interval=60, max_interval=3600, clock=lambda: start)
+    scheduler.pop_due()
+    for symbol in ['RY', 'TD']:
+        scheduler.record(symbol, 0, start)
+
+    # RY gets an article a minute, TD none at all
+    now = start
+    for _ in range(5):
+        now += 600
+        scheduler.record('RY', 10, now)
+        scheduler.record('TD', 0, now)
+    assert scheduler.rates['RY'] == pytest.approx(10 / 600)
+    assert scheduler.interval('RY', now) == 60
+    assert scheduler.interval('TD', now) == 3600
+
+
+def test_set_symbols_adds_and_drops_tickers():
+    now = at(2024, 3, 26, 11, 0).timestamp()
+    scheduler = PollScheduler(['RY', 'TD'], clock=lambda: now)
+    scheduler.set_symbols(['TD', 'BMO'])
+    assert scheduler.pop_due() == ['TD', 'BMO']
+    assert scheduler.record('RY', 0) is None
+
+
+def test_failed_poll_keeps_the_arrival_rate():
+    start = at(2024, 3, 26, 10, 0).timestamp()
+    scheduler = PollScheduler(['RY'], min_interval=60, max_interval=3600, clock=lambda: start)
+    scheduler.pop_due()
+    scheduler.record('RY', 0, start)
+    scheduler.record('RY', 10, start + 600)
+    rate = scheduler.rates['RY']
+
+    due = scheduler.record('RY', None, start + 1200)
+    assert scheduler.rates['RY'] == rate
+    assert scheduler.last_polled['RY'] == start + 600
+    assert due == start + 1200 + scheduler.interval('RY', start + 1200)
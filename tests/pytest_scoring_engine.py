@@ -0,0 +1,95 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from functools import partial
+
+import openai
+import pytest
+
+import stock_news_sentiment_analyzer as analyzer
+from utils.scoring_engine import ScoringEngine, TokenBucket, is_retryable
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI-compatible chat completions endpoint.
+    Titles starting with 'busy' get one 429 first, 'bad' always gets a 400.
+    """
+    seen = set()
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        prompt = body['messages'][-1]['content']
+        title = prompt.split('Title: ')[1].split('\n')[0]
+
+        with self.lock:
+            first_time = title not in self.seen
+            self.seen.add(title)
+
+        if title.startswith('bad'):
+            return self.reply(400, {'error': {'message': 'bad request', 'type': 'invalid_request_error'}})
+        if title.startswith('busy') and first_time:
+            return self.reply(429, {'error': {'message': 'rate limited', 'type': 'rate_limit'}}, {'retry-after': '0'})
+
+        answer = {'score': 1, 'type': 'story', 'comment': title}
+        self.reply(200, {
+            'id': 'chatcmpl-1', 'object': 'chat.completion', 'created': 0, 'model': body['model'],
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': json.dumps(answer)}}],
+        })
+
+    def reply(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_client():
+    FakeOpenAIHandler.seen = set()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield openai.OpenAI(api_key='test', base_url=f"http://127.0.0.1:{server.server_port}/v1", max_retries=0)
+    server.shutdown()
+
+
+def test_engine_scores_concurrently_and_retries(fake_client):
+    engine = ScoringEngine(partial(analyzer.request_sentiment, openai_client=fake_client),
+                           max_workers=4, base_delay=0.01)
+    items = [(i, ('RY', title, 'Article')) for i, title in enumerate(['a', 'busy-b', 'c', 'bad-d'])]
+
+    results = dict(engine.score(items))
+    assert sorted(results) == [0, 1, 2]
+    assert results[1].comment == 'busy-b'
+
+    assert len(engine.retry_queue) == 1
+    key, args, error = engine.retry_queue[0]
+    assert key == 3
+    assert isinstance(error, openai.BadRequestError)
+
+
+def test_retry_failed_keeps_items_that_fail_again(fake_client):
+    engine = ScoringEngine(partial(analyzer.request_sentiment, openai_client=fake_client), max_workers=2)
+    list(engine.score([('x', ('RY', 'bad-x', 'Article'))]))
+
+    assert list(engine.retry_failed()) == []
+    assert [key for key, args, error in engine.retry_queue] == ['x']
+
+
+def test_token_bucket_reserve():
+    bucket = TokenBucket(60)
+    assert bucket.reserve(60) == 0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.1)
+
+
+def test_is_retryable():
+    assert not is_retryable(ValueError("parse error"))
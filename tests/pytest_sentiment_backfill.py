@@ -0,0 +1,76 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import sentiment_backfill as backfill
+
+
+def make_connection(rows):
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value
+    mock_cursor.fetchmany.side_effect = [rows, []]
+    return mock_conn, mock_cursor
+
+
+def respond(body):
+    prompt = body['messages'][-1]['content']
+    if 'Title: broken' in prompt:
+        return "not json"
+    return json.dumps({'score': 1 if 'beats' in prompt else 0, 'type': 'story', 'comment': 'ok'})
+
+
+def test_write_batch_files_splits_requests(tmp_path):
+    articles = [(str(i), 'RY', f'Title {i}', 'Article') for i in range(5)]
+    files = backfill.write_batch_files(articles, 'new-model', tmp_path, max_requests=2)
+
+    assert [f.name for f in files] == ['batch_0000.jsonl', 'batch_0001.jsonl', 'batch_0002.jsonl']
+    request = json.loads(files[0].read_text().splitlines()[0])
+    assert request['custom_id'] == '0'
+    assert request['body']['model'] == 'new-model'
+    assert request['body']['response_format']['json_schema']['strict'] is True
+
+
+def test_backfill_offline(tmp_path):
+    rows = [('u1', 'RY', 'RY beats estimates', 'Article'), ('u2', 'TD', 'TD update', 'Article'),
+            ('u3', 'BMO', 'broken', 'Article')]
+    mock_conn, mock_cursor = make_connection(rows)
+
+    applied = backfill.backfill(mock_conn, backfill.LocalBatchClient(respond), 'new-model', tmp_path,
+                                poll_interval=0)
+
+    assert applied == 2
+    query, params = mock_cursor.executemany.call_args[0]
+    assert 'sentiment_model' in query
+    assert params == [(1, 'story', 'ok', 'new-model', 'u1'), (0, 'story', 'ok', 'new-model', 'u2')]
+    run_dirs = list(tmp_path.iterdir())
+    assert len(run_dirs) == 1
+    assert backfill.read_run(run_dirs[0])[0] == 'new-model'
+    assert backfill.new_run_dir(tmp_path) != run_dirs[0]
+
+
+def test_backfill_nothing_stale(tmp_path):
+    mock_conn, mock_cursor = make_connection([])
+    assert backfill.backfill(mock_conn, backfill.LocalBatchClient(respond), 'new-model', tmp_path) == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_resume_tags_results_with_the_submitted_model(tmp_path):
+    client = backfill.LocalBatchClient(respond)
+    files = backfill.write_batch_files([('u1', 'RY', 'RY beats estimates', 'Article')], 'old-model', tmp_path)
+    backfill.write_run(tmp_path, 'old-model', backfill.submit_batches(client, files))
+    mock_conn, mock_cursor = make_connection([])
+
+    assert backfill.resume(mock_conn, client, tmp_path, 'new-model', poll_interval=0) == 1
+    assert mock_cursor.executemany.call_args[0][1] == [(1, 'story', 'ok', 'old-model', 'u1')]
+
+
+def test_collect_results_of_expired_batches(tmp_path):
+    client = backfill.LocalBatchClient(respond)
+    files = backfill.write_batch_files([('u1', 'RY', 'RY beats estimates', 'Article')], 'new-model', tmp_path)
+    batch = client.batches.retrieve(backfill.submit_batches(client, files)[0])
+    batch.status = 'expired'
+    mock_conn, mock_cursor = make_connection([])
+
+    assert backfill.collect_results(client, mock_conn, [batch], 'new-model') == 1
+    expired = SimpleNamespace(id='batch-x', status='expired', output_file_id=None)
+    assert backfill.collect_results(client, mock_conn, [expired], 'new-model') == 0
@@ -0,0 +1,45 @@
+from unittest.mock import patch
+
+from utils.sentiment_cache import SentimentCache, sentiment_cache_key
+
+
+def test_key_ignores_case_and_whitespace():
+    key = sentiment_cache_key('model', 1, 'RY', 'Bank  beats\nestimates', 'Text')
+    assert key == sentiment_cache_key('model', 1, 'ry', 'bank beats estimates', ' text ')
+    assert key != sentiment_cache_key('other-model', 1, 'RY', 'Bank beats estimates', 'Text')
+    assert key != sentiment_cache_key('model', 2, 'RY', 'Bank beats estimates', 'Text')
+
+
+def test_get_put_counts_hits_and_misses(tmp_path):
+    cache = SentimentCache(tmp_path / 'cache.db')
+    assert cache.get('k') is None
+    cache.put('k', {'score': 1, 'type': 'story', 'comment': 'Positive'})
+    assert cache.get('k')['score'] == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+    cache.close()
+
+    # answers survive a restart
+    assert SentimentCache(tmp_path / 'cache.db').get('k')['comment'] == 'Positive'
+
+
+def test_ttl_expiry(tmp_path):
+    cache = SentimentCache(tmp_path / 'cache.db', ttl_days=1)
+    with patch('utils.sentiment_cache.time.time', return_value=1000.0):
+        cache.put('k', {'score': 0})
+    with patch('utils.sentiment_cache.time.time', return_value=1000.0 + 2 * 86400):
+        assert cache.get('k') is None
+        assert cache.evict() == 1
+
+
+def test_lru_eviction(tmp_path):
+    cache = SentimentCache(tmp_path / 'cache.db', max_entries=2)
+    for i, key in enumerate(['a', 'b', 'c']):
+        with patch('utils.sentiment_cache.time.time', return_value=float(i)):
+            cache.put(key, {'score': i})
+    with patch('utils.sentiment_cache.time.time', return_value=10.0):
+        cache.get('a')
+
+    assert cache.evict() == 1
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
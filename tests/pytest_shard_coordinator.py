@@ -0,0 +1,181 @@
+import multiprocessing
+import sqlite3
+import time
+
+import pytest
+
+import utils.shard_coordinator as shard_coordinator
+from utils.shard_coordinator import (ShardCoordinator, create_registry_tables, register_tickers, registered_tickers,
+                                     seed_registry, shard_of)
+
+SYMBOLS = [f"T{i}.TO" for i in range(40)]
+
+
+def connect(path):
+    return sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+
+
+def test_registry_assigns_stable_shards(tmp_path):
+    connection = connect(tmp_path / 'registry.db')
+    assert seed_registry(connection, ['RY', 'TD']) == ['RY', 'TD']
+    assert register_tickers(connection, ['TD', 'BMO']) == 1
+    assert registered_tickers(connection) == ['BMO', 'RY', 'TD']
+    assert 'RY' in registered_tickers(connection, {shard_of('RY')})
+    assert shard_of('RY') == shard_of('RY', 16) < 16
+    assert registered_tickers(connection, set()) == []
+    assert connection.execute("SELECT COUNT(*) FROM shard_lease").fetchone()[0] == 16
+
+
+def test_workers_split_shards_and_take_over(tmp_path, clock):
+    path = tmp_path / 'registry.db'
+    seed_registry(connect(path), SYMBOLS)
+    first = ShardCoordinator(connect(path), num_shards=16, lease_seconds=30, owner='first', clock=clock)
+    second = ShardCoordinator(connect(path), num_shards=16, lease_seconds=30, owner='second', clock=clock)
+
+    assert len(first.heartbeat()) == 16
+    assert second.heartbeat() == set()  # nothing free yet
+    clock.now += 10
+    assert len(first.heartbeat()) == 8  # gives up the shards above its share
+    assert len(second.heartbeat()) == 8
+    assert first.shards.isdisjoint(second.shards)
+    assert sorted(first.symbols() + second.symbols()) == sorted(SYMBOLS)
+
+    # The second worker dies: its shards are taken over once its leases expired
+    clock.now += 20
+    assert len(first.heartbeat()) == 8
+    clock.now += 11
+    assert len(first.heartbeat()) == 16
+
+
+def test_release_hands_shards_over(tmp_path, clock):
+    path = tmp_path / 'registry.db'
+    create_registry_tables(connect(path), num_shards=4)
+    first = ShardCoordinator(connect(path), num_shards=4, owner='first', clock=clock)
+    second = ShardCoordinator(connect(path), num_shards=4, owner='second', clock=clock)
+    first.heartbeat()
+    first.release()
+    assert first.shards == set()
+    assert second.heartbeat() == {0, 1, 2, 3}
+
+
+def test_failed_heartbeat_rolls_back(tmp_path, monkeypatch, clock):
+    path = tmp_path / 'registry.db'
+    create_registry_tables(connect(path), num_shards=4)
+    first = ShardCoordinator(connect(path), num_shards=4, owner='first', clock=clock)
+    second = ShardCoordinator(sqlite3.connect(str(path), timeout=0.1), num_shards=4, owner='second', clock=clock)
+
+    execute = shard_coordinator._execute
+
+    def failing_claim(connection, query, params=()):
+        if 'SET owner = %s' in query:
+            raise sqlite3.OperationalError("connection lost")
+        return execute(connection, query, params)
+
+    monkeypatch.setattr(shard_coordinator, '_execute', failing_claim)
+    with pytest.raises(sqlite3.OperationalError):
+        first.heartbeat()
+    monkeypatch.undo()
+
+    # The worker row written before the failure is gone and the database is not left locked
+    assert not first.connection.in_transaction
+    assert first.shards == set()
+    assert second.heartbeat() == {0, 1, 2, 3}
+    assert first.heartbeat() == set()
+
+
+def test_join_waits_for_late_workers(tmp_path, clock):
+    path = tmp_path / 'registry.db'
+    seed_registry(connect(path), SYMBOLS, num_shards=4)
+    first = ShardCoordinator(connect(path), num_shards=4, owner='first', clock=clock)
+    second = ShardCoordinator(connect(path), num_shards=4, owner='second', clock=clock)
+    assert first.join(settle=0, rounds=0) == {0, 1, 2, 3}
+
+    # The second worker starts after the first one read its shards: it registers, but all
+    # shards are held, so it keeps rebalancing until the first worker hands half of them over
+    heartbeats = []
+    second.stop_event.wait = lambda timeout: heartbeats.append(first.heartbeat()) and False
+    assert second.join(settle=0, rounds=0) == {2, 3}
+    assert heartbeats == [{0, 1}]
+    assert first.balanced() and second.balanced()
+
+
+def test_join_gives_up_on_unassigned_shards(tmp_path, clock, capsys):
+    path = tmp_path / 'registry.db'
+    seed_registry(connect(path), SYMBOLS, num_shards=4)
+    first = ShardCoordinator(connect(path), num_shards=4, owner='first', clock=clock)
+    first.heartbeat()
+    # A second worker registered but never claims its share
+    lonely = ShardCoordinator(connect(path), num_shards=4, owner='lonely', clock=clock)
+    assert lonely.join(settle=0, rounds=0, timeout=0) == set()
+    assert not lonely.balanced()
+    assert "unassigned or unbalanced" in capsys.readouterr().out
+
+
+def test_symbol_rounds_pick_up_shards_taken_over(tmp_path, clock):
+    path = tmp_path / 'registry.db'
+    seed_registry(connect(path), SYMBOLS, num_shards=4)
+    first = ShardCoordinator(connect(path), num_shards=4, lease_seconds=30, owner='first', clock=clock)
+    second = ShardCoordinator(connect(path), num_shards=4, lease_seconds=30, owner='second', clock=clock)
+    first.heartbeat()
+    clock.now += 10
+    second.heartbeat()
+    first.heartbeat()
+    second.heartbeat()
+
+    rounds = first.symbol_rounds()
+    assert next(rounds) == registered_tickers(first.connection, {0, 1})
+    # The second worker dies; the first takes its shards over before the next round
+    clock.now += 61
+    first.heartbeat()
+    assert next(rounds) == registered_tickers(first.connection, {2, 3})
+    assert list(rounds) == []
+
+
+def shard_worker(path, stop_file):
+    coordinator = ShardCoordinator(connect(path), num_shards=12, lease_seconds=1.0)
+    coordinator.start(interval=0.1)
+    # A file rather than an Event: killing a process waiting on an Event breaks the Event
+    wait_for(stop_file.exists, timeout=60)
+    coordinator.stop()
+
+
+def current_owners(path):
+    rows = connect(path).execute("SELECT shard, owner FROM shard_lease WHERE expires >= ?", (time.time(),)).fetchall()
+    return {shard: owner for shard, owner in rows}
+
+
+def wait_for(condition, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_processes_share_and_recover_shards(tmp_path):
+    path = tmp_path / 'registry.db'
+    seed_registry(connect(path), SYMBOLS, num_shards=12)
+
+    stop_file = tmp_path / 'stop'
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=shard_worker, args=(path, stop_file)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    try:
+        def balanced(count):
+            owners = current_owners(path)
+            shares = [list(owners.values()).count(owner) for owner in set(owners.values())]
+            return len(owners) == 12 and len(shares) == count and max(shares) == 12 // count
+
+        assert wait_for(lambda: balanced(3))
+
+        # A killed worker never releases its shards; the others take them over after the lease
+        workers[0].kill()
+        workers[0].join()
+        assert wait_for(lambda: balanced(2))
+    finally:
+        stop_file.touch()
+        for worker in workers[1:]:
+            worker.join(30)
+    assert current_owners(path) == {}
@@ -5,6 +5,8 @@ from datetime import datetime
 import pytz
 
 import stock_news_sentiment_analyzer as analyzer
+from utils.feed_fetcher import FeedResult
+from utils.news_item import NewsItem
 
 
 def test_utc_to_est_valid():
@@ -24,10 +26,10 @@ def test_get_news_success(mock_parse):
         Mock(id='1', title='News Title', link='http://link.com', published='Mon, 01 Jan 2023 12:00:00 +0000', description='Sample description')
     ])
 
-    df = analyzer.get_news('AAPL')
-    assert isinstance(df, pd.DataFrame)
-    assert not df.empty
-    assert 'uuid' in df.columns
+    items = analyzer.get_news('AAPL')
+    assert len(items) == 1
+    assert items[0].uuid == '1'
+    assert items[0].est_time == datetime(2023, 1, 1, 7, 0)
 
 
 @patch('stock_news_sentiment_analyzer.feedparser.parse')
@@ -60,24 +62,21 @@ def test_insert_ynews(mock_get_trading_date):
     mock_cursor = Mock()
     mock_conn.cursor.return_value = mock_cursor
 
-    row = pd.Series({
-        'uuid': '1234',
-        'title': 'Test Title',
-        'description': 'Test Description',
-        'link': 'http://test.com',
-        'est_time': datetime(2023, 1, 1),
-        'type': 'story',
-        'score': 1,
-        'comment': 'Positive news'
-    })
-
-    analyzer.insert_ynews(row, mock_conn, 'AAPL')
+    item = NewsItem('1234', 'Test Title', 'http://test.com', 'Test Description', est_time=datetime(2023, 1, 1))
+    item.set_sentiment(analyzer.SentimentAnswer(score=1, type='story', comment='Positive news'))
+
+    analyzer.insert_ynews(item, mock_conn, 'AAPL')
     assert mock_cursor.execute.called
+    assert mock_cursor.execute.call_args_list[0][0][1][2:4] == (datetime(2023, 1, 1), '2023-01-01')
+    # The day's aggregate is refreshed in the same transaction
+    assert 'ynews_daily' in mock_cursor.execute.call_args_list[1][0][0]
+    assert mock_cursor.execute.call_args_list[1][0][1] == ('AAPL', '2023-01-01')
     assert mock_conn.commit.called
 
 
-@patch('stock_news_sentiment_analyzer.client.beta.chat.completions.parse')
-def test_get_sentiment_analysis_success(mock_parse):
+@patch('stock_news_sentiment_analyzer.get_client')
+def test_get_sentiment_analysis_success(mock_get_client):
+    mock_parse = mock_get_client.return_value.beta.chat.completions.parse
     mock_response = Mock()
     mock_response.choices = [Mock(message=Mock(parsed=Mock(score=1, type='story', comment='Positive')))]
     mock_parse.return_value = mock_response
@@ -88,7 +87,242 @@ def test_get_sentiment_analysis_success(mock_parse):
     assert result.comment == "Positive"
 
 
-@patch('stock_news_sentiment_analyzer.client.beta.chat.completions.parse', side_effect=Exception("API error"))
-def test_get_sentiment_analysis_failure(mock_parse):
+@patch('stock_news_sentiment_analyzer.get_client')
+def test_get_sentiment_analysis_failure(mock_get_client):
+    mock_get_client.return_value.beta.chat.completions.parse.side_effect = Exception("API error")
     result = analyzer.get_sentiment_analysis("AAPL", "Title", "Body")
     assert result is None
+
+
+def test_filter_new_articles_single_query():
+    mock_conn = MagicMock()
+    mock_cursor = MagicMock()
+    mock_cursor.fetchall.return_value = [('b',)]
+    mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+
+    with patch.object(analyzer, 'known_uuids', {'a'}):
+        assert analyzer.filter_new_articles(mock_conn, ['a', 'b', 'c', 'c']) == ['c']
+        assert 'b' in analyzer.known_uuids
+
+    mock_cursor.execute.assert_called_once()
+    assert mock_cursor.execute.call_args[0][1] == ('b', 'c')
+
+
+def test_filter_new_articles_all_known():
+    mock_conn = Mock()
+
+    with patch.object(analyzer, 'known_uuids', {'a', 'b'}):
+        assert analyzer.filter_new_articles(mock_conn, ['a', 'b']) == []
+
+    mock_conn.cursor.assert_not_called()
+
+
+@patch('stock_news_sentiment_analyzer.request_sentiment')
+@patch('stock_news_sentiment_analyzer.get_client')
+def test_score_articles_batch_leaves_out_malformed_answers(mock_get_client, mock_single):
+    mock_parse = mock_get_client.return_value.beta.chat.completions.parse
+    parsed = analyzer.BatchSentimentAnswer(items=[
+        analyzer.SentimentItem(id='a', score=1, type='story', comment='Positive'),
+        analyzer.SentimentItem(id='b', score=5, type='story', comment='Malformed'),
+        analyzer.SentimentItem(id='x', score=0, type='story', comment='Unknown id'),
+    ])
+    mock_parse.return_value = Mock(choices=[Mock(message=Mock(parsed=parsed))])
+
+    items = [('a', 'RY', 'T1', 'A1'), ('b', 'RY', 'T2', 'A2'), ('c', 'TD', 'T3', 'A3')]
+    answers = analyzer.score_articles(items)
+
+    assert mock_parse.call_count == 1
+    assert list(answers) == ['a'] and answers['a'].score == 1
+    # The single-article fallback is left to score_batches, which goes through the engine
+    mock_single.assert_not_called()
+
+
+def test_fallback_requests_go_through_the_engine():
+    single = analyzer.SentimentAnswer(score=-1, type='fs', comment='Single')
+    batch_sizes, rate_limited = [], set()
+
+    def score_fn(batch):
+        batch_sizes.append(len(batch))
+        if len(batch) > 1:
+            return {batch[0][0]: analyzer.SentimentAnswer(score=1, type='story', comment='Batched')}
+        if batch[0][2] == 'busy' and 'busy' not in rate_limited:
+            rate_limited.add('busy')
+            raise analyzer.openai.RateLimitError('rate limited', response=Mock(status_code=429, headers={}),
+                                                 body=None)
+        return {batch[0][0]: single}
+
+    engine = analyzer.ScoringEngine(score_fn, max_workers=2, base_delay=0, max_delay=0)
+    engine.limiter.acquire = Mock(wraps=engine.limiter.acquire)
+    items = [NewsItem('a', 'T1', 'l', 'd'), NewsItem('b', 'busy', 'l', 'd'), NewsItem('c', 'T3', 'l', 'd')]
+
+    results = list(analyzer.score_batches(engine, engine.score(analyzer.article_batches(items, 'RY'))))
+
+    answered = {item.uuid: answers[item.uuid].comment for (_, batch_items), answers in results
+                for item in batch_items}
+    assert answered == {'a': 'Batched', 'b': 'Single', 'c': 'Single'}
+    # One batched request, two single ones and the retry of the rate-limited one, each charged to the limiter
+    assert sorted(batch_sizes) == [1, 1, 1, 3]
+    assert engine.limiter.acquire.call_count == 4
+    assert engine.retry_queue == []
+
+
+def test_batch_articles_respects_token_budget():
+    items = [(str(i), 'RY', 'Title', 'x' * 400) for i in range(5)]
+    assert [len(b) for b in analyzer.batch_articles(items, max_items=4, max_tokens=10000)] == [4, 1]
+    assert [len(b) for b in analyzer.batch_articles(items, max_items=4, max_tokens=700)] == [2, 2, 1]
+
+
+@patch('stock_news_sentiment_analyzer.request_articles')
+def test_score_articles_uses_cache(mock_request):
+    answer = analyzer.SentimentAnswer(score=1, type='story', comment='Positive')
+    mock_request.return_value = {'a': answer}
+
+    with patch.object(analyzer, 'sentiment_cache', analyzer.SentimentCache(':memory:')):
+        assert analyzer.score_articles([('a', 'RY', 'Title', 'Article')])['a'] == answer
+        # same content under a new uuid is served from the cache
+        items = [NewsItem('b', 'Title ', 'l', 'Article'), NewsItem('c', 'Other', 'l', 'Article')]
+        cached, misses = analyzer.split_cached(items, 'RY')
+        assert cached == {'b': answer}
+        assert misses == [items[1]]
+
+    assert mock_request.call_count == 1
+
+
+@patch('stock_news_sentiment_analyzer.new_articles', side_effect=lambda items, connection: iter(items))
+def test_cache_hits_bypass_the_engine(mock_new):
+    answer = analyzer.SentimentAnswer(score=1, type='story', comment='Positive')
+    engine = Mock()
+    engine.score.side_effect = lambda batches: iter([])
+    writer = Mock()
+    items = [NewsItem('a', 'Title', 'l', 'Article'), NewsItem('b', 'Other', 'l', 'Article')]
+
+    with patch.object(analyzer, 'sentiment_cache', analyzer.SentimentCache(':memory:')):
+        analyzer.cache_sentiment('RY', 'Title', 'Article', answer)
+        with patch.object(analyzer, 'store_news') as mock_store:
+            analyzer.process_news(items, Mock(), 'RY', writer, engine)
+
+    mock_store.assert_called_once_with(items[0], answer, mock_store.call_args.args[2], 'RY', writer)
+    batches = list(engine.score.call_args.args[0])
+    assert [[item.uuid for item in batch_items] for (_, batch_items), _ in batches] == [['b']]
+
+
+def test_news_items_trading_times():
+    with patch.object(analyzer.td, 'get_trading_dates', wraps=analyzer.td.get_trading_dates) as lookup:
+        items = analyzer.news_from_entries([
+            Mock(id='1', title='T', link='l', published='Thu, 28 Mar 2024 19:59:00 +0000', description='d'),
+            Mock(id='2', title='T', link='l', published='Thu, 28 Mar 2024 20:00:00 +0000', description='d'),
+            Mock(id='3', title='T', link='l', published='not a date', description='d'),
+        ])
+    # One array lookup for the whole feed
+    lookup.assert_called_once()
+
+    assert [str(item.est_time) for item in items] == ['2024-03-28 15:59:00', '2024-03-28 16:00:00', 'None']
+    assert [str(item.trading_dt) for item in items] == ['2024-03-28', '2024-04-01', 'None']
+    assert analyzer.ynews_record(items[2], 'RY')[2:4] == (None, None)
+
+
+def test_process_news_stores_scored_items():
+    entries = [Mock(id=str(i), title=f'T{i}', link='l', published='Thu, 28 Mar 2024 19:59:00 +0000',
+                    description='d') for i in range(3)]
+    writer = Mock(buffer=[])
+    engine = Mock(retry_queue=[])
+    answer = analyzer.SentimentAnswer(score=1, type='story', comment='Positive')
+    engine.score.side_effect = lambda batches: [(key, {args[0][0][0]: answer}) for key, args in batches]
+
+    with patch.object(analyzer, 'known_uuids', {'0'}), \
+            patch.object(analyzer, 'filter_new_articles', side_effect=lambda connection, uuids: uuids[1:]):
+        analyzer.process_news(analyzer.news_items(entries), Mock(), 'RY', writer, engine)
+
+    records = [call.args[0] for call in writer.add.call_args_list]
+    assert [record[0] for record in records] == ['1', '2']
+    assert records[0][7:10] == ('story', 1, 'Positive')
+    # The unanswered article of the batch is sent to the engine again on its own
+    (key, args), = engine.score.call_args_list[1].args[0]
+    assert key[1][0].uuid == '2' and args == ([('2', 'RY', 'T2', 'd')],)
+
+
+def test_run_daemon_polls_until_stopped():
+    scheduler = analyzer.PollScheduler(['RY', 'TD'], min_interval=0.01, max_interval=0.01)
+    stop = analyzer.threading.Event()
+    polls = []
+
+    def fetch(urls, feed_cache, concurrency, timeout):
+        polls.append(list(urls))
+        if len(polls) == 3:
+            stop.set()
+        feed = Mock(bozo=False, entries=[])
+        return [FeedResult(key, 200, feed, None, None, None) for key in urls]
+
+    with patch.object(analyzer, 'news_from_entries', return_value=[]), \
+            patch.object(analyzer, 'process_news', return_value=2):
+        analyzer.run_daemon(Mock(), Mock(), Mock(buffer=[]), Mock(retry_queue=[]), stop, scheduler, fetch)
+
+    # The cycle in progress when the stop was requested completes, then the daemon returns
+    assert len(polls) == 3 and polls[0] == ['RY', 'TD']
+    assert scheduler.last_polled.keys() == {'RY', 'TD'}
+    assert scheduler.rates['RY'] > 0
+
+
+def test_run_daemon_survives_failed_cycles():
+    scheduler = analyzer.PollScheduler(['RY', 'TD'], min_interval=0.01, max_interval=0.01)
+    stop = analyzer.threading.Event()
+    polls = []
+
+    def fetch(urls, feed_cache, concurrency, timeout):
+        polls.append(list(urls))
+        if len(polls) == 1:
+            raise ConnectionError("network down")
+        if len(polls) == 3:
+            stop.set()
+        feed = Mock(bozo=False, entries=[])
+        return [FeedResult('RY', 200, feed, None, None, None), FeedResult('TD', None, None, None, None, OSError())]
+
+    with patch.object(analyzer, 'news_from_entries', return_value=[]), \
+            patch.object(analyzer, 'process_news', return_value=0), \
+            patch.object(scheduler, 'record', wraps=scheduler.record) as record:
+        analyzer.run_daemon(Mock(), Mock(), Mock(buffer=[]), Mock(retry_queue=[]), stop, scheduler, fetch)
+
+    assert len(polls) == 3
+    # Failed polls are rescheduled without a count, so they do not lower the arrival rate
+    assert [call.args for call in record.call_args_list[:2]] == [('RY', None), ('TD', None)]
+    assert ('TD', None) in [call.args for call in record.call_args_list[2:]]
+    assert ('RY', 0) in [call.args for call in record.call_args_list[2:]]
+    assert 'TD' not in scheduler.last_polled
+
+
+def test_process_news_through_work_queue(tmp_path):
+    entries = [Mock(id=str(i), title=f'T{i}', link='l', published='Thu, 28 Mar 2024 19:59:00 +0000',
+                    description='d') for i in range(3)]
+    queue = analyzer.WorkQueue(tmp_path / 'queue.db')
+    writer = Mock(buffer=[])
+    engine = Mock(retry_queue=[])
+    answer = analyzer.SentimentAnswer(score=1, type='story', comment='Positive')
+    # The batch answers the first two articles only, and the single request for the third fails
+    engine.score.side_effect = lambda batches: [(key, {item.uuid: answer for item in key[1][:2] if len(key[1]) > 1})
+                                                for key, args in batches]
+
+    with patch.object(analyzer, 'known_uuids', set()), \
+            patch.object(analyzer, 'filter_new_articles', side_effect=lambda connection, uuids: uuids):
+        assert analyzer.process_news(analyzer.news_items(entries), Mock(), 'RY', writer, engine, queue) == 3
+
+        assert [call.args[0][0] for call in writer.add.call_args_list] == ['0', '1']
+        counts = queue.counts()
+        assert counts['stored'] == 2 and counts['fetched'] == 1
+
+        # Only articles the queue did not hold yet count as new arrivals
+        entries.append(Mock(id='3', title='T3', link='l', published='Thu, 28 Mar 2024 19:59:00 +0000',
+                            description='d'))
+        assert analyzer.process_news(analyzer.news_items(entries), Mock(), 'RY', writer, engine, queue) == 1
+
+
+def test_main_stops_when_the_sentiment_model_column_is_missing(capsys):
+    mock_conn = MagicMock()
+    mock_conn.cursor.return_value.execute.side_effect = analyzer.mysql_connector.Error("ALTER command denied")
+    with patch.object(analyzer.db, 'get_pool') as get_pool, \
+            patch.object(analyzer, 'load_known_uuids') as load_known_uuids:
+        get_pool.return_value.acquire.return_value = mock_conn
+        assert analyzer.main([]) == 1
+
+    assert "ALTER TABLE ynews ADD COLUMN sentiment_model" in capsys.readouterr().out
+    load_known_uuids.assert_not_called()
+    mock_conn.close.assert_called_once()
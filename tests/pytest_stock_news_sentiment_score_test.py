@@ -0,0 +1,216 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+import stock_news_sentiment_score_test as score_test
+from utils.price_series_cache import PriceSeries, PriceSeriesCache
+from utils.ynews_daily import StaleAggregateError
+
+
+class FakeCursor:
+    """
+    Answers the stock_price and ynews queries of the score test from in-memory data.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        self.connection.queries += 1
+        if 'DISTINCT symbol' in query:
+            self.result = [(symbol,) for symbol in sorted({row[0] for row in self.connection.daily})]
+            return
+        symbol = params[0]
+        series = self.connection.prices.get(symbol, [])
+        if 'COUNT(DISTINCT trading_dt)' in query:
+            days = lambda rows, symbol: len({row[1] for row in rows if row[0] == symbol})
+            self.result = [(symbol,) for symbol in sorted(set(params))
+                           if days(self.connection.news, symbol) != days(self.connection.daily, symbol)]
+        elif 'FROM ynews_daily' in query:
+            self.result = [row for row in self.connection.daily if row[0] == symbol]
+        elif 'FROM ynews' in query:
+            self.result = [row for row in self.connection.news if row[0] == symbol]
+        elif 'SUM(adj_close_price)' in query:
+            self.result = [(len(series), max(d for d, p in series) if series else None, sum(p for d, p in series))]
+        else:
+            self.result = list(series)
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    def __init__(self, prices, news, daily=None):
+        self.prices = prices
+        self.news = news
+        # ynews_daily rows; an up-to-date aggregate by default
+        self.daily = news if daily is None else daily
+        self.queries = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def make_series(start, days, seed):
+    rng = np.random.default_rng(seed)
+    dates = [start + timedelta(days=i) for i in range(days) if (start + timedelta(days=i)).weekday() < 5]
+    return [(d, Decimal(str(round(50 + rng.normal(0, 1) + i * 0.01, 2)))) for i, d in enumerate(dates)]
+
+
+def per_day_price_changes(series, trading_dt):
+    """
+    Reference for process_ticker, as the analysis used to query it per news day: the
+    log changes of the five closes from the news day on against the last close before it.
+    """
+    before = [d for d, p in series if d < trading_dt]
+    if not before:
+        return None
+    closes = [p for d, p in series if d >= max(before)][:6]
+    if len(closes) < 6:
+        return None
+    return closes, [np.log(float(closes[i] / closes[0])) for i in range(1, 6)]
+
+
+def test_process_ticker_matches_per_day_queries():
+    prices = {'RY.TO': make_series(date(2024, 1, 1), 90, 1), '^GSPTSE': make_series(date(2023, 12, 20), 120, 2)}
+    news_days = [date(2023, 12, 15), date(2024, 1, 1), date(2024, 1, 3), date(2024, 2, 10), date(2024, 3, 28),
+                 date(2024, 4, 5)]
+    news = [('RY', d, -1 if i % 2 else 0, 1) for i, d in enumerate(news_days)]
+    connection = FakeConnection(prices, news)
+
+    expected = []
+    for symbol, trading_dt, min_score, max_score in news:
+        result = per_day_price_changes(prices['RY.TO'], trading_dt)
+        tsx_result = per_day_price_changes(prices['^GSPTSE'], trading_dt)
+        if result is None or tsx_result is None:
+            continue
+        expected.append([symbol, trading_dt, min_score, max_score, result[0][1], *result[1], *tsx_result[1]])
+
+    connection.queries = 0
+    cache = PriceSeriesCache()
+    data = score_test.process_ticker('RY', connection, '^GSPTSE', cache)
+
+    # news query plus signature and series query per symbol
+    assert connection.queries == 5
+    assert len(data) == len(expected) == 2
+    for row, expected_row in zip(data, expected):
+        assert len(row) == 15
+        assert row[:5] == expected_row[:5]
+        assert np.allclose(row[5:], expected_row[5:], rtol=1e-12)
+
+
+def test_process_ticker_without_news():
+    connection = FakeConnection({}, [])
+    assert score_test.process_ticker('RY', connection, '^GSPTSE', PriceSeriesCache()) == []
+
+
+def test_process_ticker_refuses_missing_aggregate():
+    connection = FakeConnection({}, [('RY', date(2024, 1, 3), -1, 1)], daily=[])
+    with pytest.raises(StaleAggregateError, match='rebuild-daily'):
+        score_test.process_ticker('RY', connection, '^GSPTSE', PriceSeriesCache())
+
+
+def test_index_series_shared_across_tickers():
+    prices = {'RY.TO': make_series(date(2024, 1, 1), 60, 1), 'TD.TO': make_series(date(2024, 1, 1), 60, 3),
+              '^GSPTSE': make_series(date(2024, 1, 1), 60, 2)}
+    news = [('RY', date(2024, 1, 10), 0, 1), ('TD', date(2024, 1, 10), -1, 0)]
+    connection = FakeConnection(prices, news)
+    cache = PriceSeriesCache()
+
+    assert len(score_test.process_ticker('RY', connection, '^GSPTSE', cache)) == 1
+    assert len(score_test.process_ticker('TD', connection, '^GSPTSE', cache)) == 1
+    assert cache.misses == 3
+    assert cache.hits == 1
+
+
+def test_cache_reloads_changed_series():
+    prices = {'^GSPTSE': make_series(date(2024, 1, 1), 30, 2)}
+    connection = FakeConnection(prices, [])
+    cache = PriceSeriesCache(check_interval=0)
+
+    first = cache.get('^GSPTSE', connection)
+    assert cache.get('^GSPTSE', connection) is first
+
+    prices['^GSPTSE'].append((date(2024, 2, 1), Decimal('51.00')))
+    assert len(cache.get('^GSPTSE', connection).dates) == len(first.dates) + 1
+
+    cache.invalidate('^GSPTSE')
+    assert cache.entries == {}
+
+
+def test_cache_memory_budget():
+    prices = {symbol: make_series(date(2024, 1, 1), 300, i) for i, symbol in enumerate(['A', 'B', 'C'])}
+    connection = FakeConnection(prices, [])
+    budget = PriceSeriesCache().get('A', connection).nbytes * 2
+    cache = PriceSeriesCache(max_bytes=budget)
+
+    for symbol in ['A', 'B', 'C']:
+        cache.get(symbol, connection)
+    assert list(cache.entries) == ['B', 'C']
+    assert cache.used_bytes <= budget
+
+
+def test_forward_returns_matrix():
+    series = PriceSeries([date(2024, 1, d) for d in (2, 3, 4)], [Decimal('10'), Decimal('11'), Decimal('12.1')],
+                                    horizons=2)
+    assert np.allclose(series.forward_returns[0], [np.log(1.1), np.log(1.21)])
+    assert np.isnan(series.forward_returns[1, 1])
+
+
+def universe_connection():
+    symbols = ['RY', 'TD', 'BMO', 'CM']
+    prices = {f"{symbol}.TO": make_series(date(2024, 1, 1), 90, i) for i, symbol in enumerate(symbols)}
+    prices['^GSPTSE'] = make_series(date(2024, 1, 1), 90, 10)
+    news = [(symbol, date(2024, 1, 1) + timedelta(days=d), -(d % 3), d % 4)
+            for symbol in symbols for d in range(2, 70, 5)]
+    return FakeConnection(prices, news)
+
+
+def test_analyze_tickers_parallel_matches_serial():
+    tickers = ['TD', 'RY', 'CM', 'BMO']
+    serial = score_test.analyze_tickers(tickers, workers=1, connect=universe_connection)
+    parallel = score_test.analyze_tickers(tickers, workers=3, connect=universe_connection)
+
+    assert [row[0] for row in serial] == sorted((row[0] for row in serial), key=tickers.index)
+    assert len(parallel) == len(serial) > 0
+    for row, serial_row in zip(parallel, serial):
+        assert row[:5] == serial_row[:5]
+        assert np.allclose(row[5:], serial_row[5:])
+
+
+def test_workers_use_the_index_series_of_the_parent(monkeypatch):
+    index_series = PriceSeriesCache().get('^GSPTSE', universe_connection())
+    monkeypatch.setattr(score_test, 'price_cache', PriceSeriesCache())
+    score_test.init_worker(universe_connection, index_series)
+
+    rows = score_test.process_ticker_in_worker('RY', '^GSPTSE')
+    assert len(rows) > 0
+    assert list(score_test.price_cache.entries) == ['RY.TO']
+
+
+def test_news_symbols():
+    assert score_test.news_symbols(universe_connection()) == ['BMO', 'CM', 'RY', 'TD']
+    # Symbols are read from the aggregate, not the raw articles
+    connection = FakeConnection({}, [('RY', date(2024, 1, 3), -1, 1)], daily=[('TD', date(2024, 1, 3), -1, 1)])
+    assert score_test.news_symbols(connection) == ['TD']
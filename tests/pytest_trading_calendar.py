@@ -0,0 +1,60 @@
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+import numpy as np
+
+from utils.trading_calendar import TradingCalendar, exchange_for_symbol, get_calendar
+
+
+def test_next_and_previous_session_skip_holidays():
+    tsx = get_calendar('TSX')
+    assert tsx.next_session(date(2024, 3, 28)) == date(2024, 4, 1)  # Good Friday + weekend
+    assert tsx.previous_session(date(2024, 4, 1)) == date(2024, 3, 28)
+    assert tsx.roll_forward(date(2024, 3, 29)) == date(2024, 4, 1)
+    assert tsx.roll_back(date(2024, 3, 31)) == date(2024, 3, 28)
+    assert tsx.is_session(date(2024, 3, 28))
+    assert not tsx.is_session(date(2024, 3, 29))
+
+
+def test_exchanges_have_their_own_holidays():
+    # Civic Holiday is a TSX holiday only, Juneteenth an NYSE holiday only
+    assert not get_calendar('TSX').is_session(date(2025, 8, 4))
+    assert get_calendar('NYSE').is_session(date(2025, 8, 4))
+    assert get_calendar('TSX').is_session(date(2025, 6, 19))
+    assert not get_calendar('NYSE').is_session(date(2025, 6, 19))
+    assert exchange_for_symbol('RY.TO') == 'TSX'
+    assert exchange_for_symbol('RY') == 'NYSE'
+
+
+def test_offset_and_sessions_between():
+    tsx = get_calendar('TSX')
+    assert tsx.offset(date(2024, 12, 24), 1) == date(2024, 12, 27)
+    assert tsx.offset(date(2024, 12, 27), -1) == date(2024, 12, 24)
+    assert tsx.offset(date(2024, 12, 28), 0) == date(2024, 12, 30)
+    assert tsx.count_sessions(date(2024, 12, 23), date(2024, 12, 31)) == 5
+
+
+def test_trading_date_after_close():
+    tsx = get_calendar('TSX')
+    assert tsx.trading_date(datetime(2024, 3, 28, 15, 59)) == date(2024, 3, 28)
+    assert tsx.trading_date(datetime(2024, 3, 28, 16, 0)) == date(2024, 4, 1)
+
+
+def test_range_extends_lazily():
+    calendar = TradingCalendar('TSX', start_year=2024, end_year=2024)
+    assert calendar.next_session(date(2031, 6, 10)) == date(2031, 6, 11)
+    assert calendar.previous_session(date(2017, 6, 7)) == date(2017, 6, 6)
+    assert calendar.start_year <= 2016 and calendar.end_year >= 2032
+
+
+def test_shared_between_threads_and_processes():
+    calendar = TradingCalendar('TSX', start_year=2024, end_year=2024)
+    days = [date(2010 + i, 6, 1) for i in range(20)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(calendar.roll_forward, days))
+    assert results == [TradingCalendar('TSX', start_year=2008, end_year=2032).roll_forward(d) for d in days]
+
+    copy = pickle.loads(pickle.dumps(calendar))
+    assert np.array_equal(copy.sessions, calendar.sessions)
+    assert copy.next_session(date(2024, 3, 28)) == date(2024, 4, 1)
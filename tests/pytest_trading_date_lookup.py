@@ -0,0 +1,31 @@
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import utils.trading_date_lookup as td
+from utils.holiday_manager import load_holiday_dates_from_csv
+
+load_holiday_dates_from_csv(Path(__file__).parent.parent / 'data' / 'tsx_holidays.csv')
+
+
+def test_get_trading_date_rules():
+    assert td.get_trading_date(datetime(2024, 3, 27, 15, 59)) == datetime(2024, 3, 27).date()
+    # after 4pm on Thursday before Good Friday rolls over the long weekend
+    assert td.get_trading_date(datetime(2024, 3, 28, 16, 0)) == datetime(2024, 4, 1).date()
+
+
+def test_get_trading_dates_matches_scalar_version():
+    timestamps = pd.Series(pd.date_range('2024-03-20', '2025-01-10', freq='97min'))
+    expected = [td.get_trading_date(ts.to_pydatetime()) for ts in timestamps]
+
+    result = td.get_trading_dates(timestamps)
+    assert result.dtype == np.dtype('datetime64[D]')
+    assert list(result.astype(object)) == expected
+
+
+def test_get_trading_dates_keeps_missing_values():
+    result = td.get_trading_dates(pd.Series([pd.NaT, pd.Timestamp('2024-12-24 17:00')]))
+    assert np.isnat(result[0])
+    assert result[1] == np.datetime64('2024-12-27')
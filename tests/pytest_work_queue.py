@@ -0,0 +1,141 @@
+import multiprocessing
+import socket
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+
+from utils.news_item import NewsItem
+from utils.work_queue import FAILED, FETCHED, SCORED, SCORING, STORED, WorkQueue
+
+
+def make_items(count):
+    return [NewsItem(f"uuid-{i}", f"Title {i}", f"https://example.com/{i}", "Description",
+                     datetime(2024, 3, 28, 19, 59, tzinfo=timezone.utc), datetime(2024, 3, 28, 15, 59),
+                     date(2024, 3, 28)) for i in range(count)]
+
+
+ANSWER = SimpleNamespace(score=1, type='story', comment='Positive')
+
+
+def test_articles_move_through_states(tmp_path):
+    queue = WorkQueue(tmp_path / 'queue.db')
+    assert queue.enqueue('RY', make_items(3)) == 3
+    assert queue.enqueue('RY', make_items(4)) == 1  # known articles are ignored
+
+    claimed = queue.claim_scoring(limit=10)
+    assert [item.uuid for _, item in claimed] == ['uuid-0', 'uuid-1', 'uuid-2', 'uuid-3']
+    symbol, item = claimed[0]
+    assert symbol == 'RY' and item.est_time == datetime(2024, 3, 28, 15, 59)
+    assert item.trading_dt == date(2024, 3, 28) and item.published.tzinfo is not None
+    assert queue.claim_scoring() == []  # leased
+
+    assert queue.mark_scored('RY', {item.uuid: ANSWER for _, item in claimed}) == 4
+    scored = queue.claim_scored()
+    assert [(item.score, item.type, item.comment) for _, item in scored] == [(1, 'story', 'Positive')] * 4
+    assert queue.mark_stored((symbol, item.uuid) for symbol, item in scored) == 4
+    assert queue.counts() == {FETCHED: 0, SCORING: 0, SCORED: 0, STORED: 4, FAILED: 0}
+    assert queue.pending() == 0
+
+
+def test_expired_lease_is_taken_over(tmp_path, clock):
+    dead = WorkQueue(tmp_path / 'queue.db', lease_seconds=60, owner='dead', clock=clock)
+    dead.enqueue('RY', make_items(2))
+    assert len(dead.claim_scoring()) == 2
+
+    alive = WorkQueue(tmp_path / 'queue.db', lease_seconds=60, owner='alive', clock=clock)
+    assert alive.claim_scoring() == []
+    clock.now += 61
+    assert len(alive.claim_scoring()) == 2
+    # The old owner lost its lease and can no longer complete the articles
+    assert dead.mark_scored('RY', {'uuid-0': ANSWER}) == 0
+    assert alive.mark_scored('RY', {'uuid-0': ANSWER}) == 1
+
+
+def test_failed_articles_back_off_then_fail(tmp_path, clock):
+    queue = WorkQueue(tmp_path / 'queue.db', max_attempts=2, retry_delay=10, clock=clock)
+    queue.enqueue('RY', make_items(1))
+
+    queue.claim_scoring()
+    assert queue.release('RY', ['uuid-0'], 'rate limited') == 1
+    assert queue.claim_scoring() == []  # backing off
+    clock.now += 10
+    assert len(queue.claim_scoring()) == 1
+    queue.release('RY', ['uuid-0'], 'rate limited')
+    assert queue.counts()[FAILED] == 1
+    clock.now += 1000
+    assert queue.claim_scoring() == []
+
+
+def test_restart_resumes_where_the_run_stopped(tmp_path, clock):
+    queue = WorkQueue(tmp_path / 'queue.db', lease_seconds=60, clock=clock)
+    queue.enqueue('RY', make_items(3))
+    claimed = queue.claim_scoring(limit=2)
+    queue.mark_scored('RY', {claimed[0][1].uuid: ANSWER})
+    queue.close()  # the process dies with uuid-1 leased
+
+    clock.now += 61
+    queue = WorkQueue(tmp_path / 'queue.db', lease_seconds=60, clock=clock)
+    assert queue.counts() == {FETCHED: 1, SCORING: 1, SCORED: 1, STORED: 0, FAILED: 0}
+    assert [item.uuid for _, item in queue.claim_scored()] == ['uuid-0']
+    assert sorted(item.uuid for _, item in queue.claim_scoring()) == ['uuid-1', 'uuid-2']
+
+
+def drain_worker(path, results):
+    queue = WorkQueue(path)
+    claimed = []
+    while True:
+        batch = queue.claim_scoring(limit=7)
+        if not batch:
+            break
+        claimed.extend(item.uuid for _, item in batch)
+        queue.mark_scored('RY', {item.uuid: ANSWER for _, item in batch})
+    results.put(claimed)
+
+
+def test_processes_claim_disjoint_articles(tmp_path):
+    path = tmp_path / 'queue.db'
+    WorkQueue(path).enqueue('RY', make_items(200))
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    workers = [context.Process(target=drain_worker, args=(path, results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    claimed = [uuid for _ in workers for uuid in results.get(timeout=60)]
+    for worker in workers:
+        worker.join()
+
+    assert len(claimed) == 200 and len(set(claimed)) == 200
+    assert WorkQueue(path).counts()[SCORED] == 200
+
+
+def test_leases_of_dead_local_workers_are_reclaimed(tmp_path, clock):
+    process = multiprocessing.Process(target=int)
+    process.start()
+    process.join()
+    dead = WorkQueue(tmp_path / 'queue.db', lease_seconds=600, owner=f"{socket.gethostname()}:{process.pid}:0",
+                     clock=clock)
+    dead.enqueue('RY', make_items(3))
+    dead.claim_scoring(limit=2)
+    remote = WorkQueue(tmp_path / 'queue.db', lease_seconds=600, owner='elsewhere:1:0', clock=clock)
+    remote.claim_scoring()
+
+    queue = WorkQueue(tmp_path / 'queue.db', clock=clock)
+    assert queue.reclaim() == 2  # the lease of the other host is still valid
+    assert [item.uuid for _, item in queue.claim_scoring()] == ['uuid-0', 'uuid-1']
+    clock.now += 601
+    assert queue.reclaim() == 3  # expired, including our own new claims
+
+
+def test_failed_articles_are_requeued_and_purged(tmp_path, clock):
+    queue = WorkQueue(tmp_path / 'queue.db', max_attempts=1, clock=clock)
+    queue.enqueue('RY', make_items(1))
+    queue.enqueue('TD', make_items(1))
+    for symbol, item in queue.claim_scoring():
+        queue.release(symbol, [item.uuid], 'boom')
+    assert queue.counts()[FAILED] == 2
+
+    assert queue.requeue_failed(['TD']) == 1
+    assert [symbol for symbol, _ in queue.claim_scoring()] == ['TD']
+    clock.now += 2 * 86400
+    assert queue.purge(1) == 1
+    assert queue.counts() == {FETCHED: 0, SCORING: 1, SCORED: 0, STORED: 0, FAILED: 0}
@@ -0,0 +1,164 @@
+import sqlite3
+from unittest.mock import MagicMock
+
+from utils.ynews_daily import (REFRESH_CHUNK_SIZE, YNEWS_DAILY_REFRESH, create_ynews_daily, rebuild_ynews_daily,
+                               refresh_days, symbols_missing_daily, touched_days)
+from utils.ynews_writer import YnewsWriter
+
+NEWS = [
+    # uuid, symbol, trading_dt, news_type, sentiment_score
+    ('1', 'RY', '2024-03-28', 'story', 1),
+    ('2', 'RY', '2024-03-28', 'story', -1),
+    ('3', 'RY', '2024-03-28', 'story', 0),
+    ('4', 'RY', '2024-03-28', 'fs', 1),
+    ('5', 'RY', '2024-04-01', 'fs', 0),
+    ('6', 'TD', '2024-03-28', 'story', 1),
+    ('7', 'TD', None, 'story', 1),
+]
+
+
+def make_record(uuid, symbol='RY', trading_dt='2024-03-28'):
+    return (uuid, symbol, None, trading_dt, 'Title', 'http://link.com', 'Description', 'story', 1, 'Positive', 'model')
+
+
+def aggregate_select(where):
+    # The SELECT part of the refresh, which runs unchanged on SQLite
+    query = YNEWS_DAILY_REFRESH.format(where=where)
+    return query[query.index('SELECT'):query.index('ON DUPLICATE KEY')]
+
+
+def test_aggregate_matches_the_raw_news_query():
+    connection = sqlite3.connect(':memory:')
+    connection.execute("CREATE TABLE ynews (uuid, symbol, trading_dt, news_type, sentiment_score)")
+    connection.executemany("INSERT INTO ynews VALUES (?, ?, ?, ?, ?)", NEWS)
+
+    rows = connection.execute(aggregate_select("1 = 1") + " ORDER BY symbol, trading_dt").fetchall()
+    assert rows == [
+        ('RY', '2024-03-28', 3, 1, -1, 1, 0.0, 1, 1),
+        ('RY', '2024-04-01', 0, 1, None, None, None, 0, 0),
+        ('TD', '2024-03-28', 1, 0, 1, 1, 1.0, 1, 0),
+    ]
+
+    # What process_ticker used to compute from ynews: days with stories, min clipped at 0 and max at 0
+    raw = connection.execute("""
+        SELECT symbol, trading_dt,
+        COALESCE(MIN(CASE WHEN sentiment_score < 0 THEN sentiment_score END), 0),
+        COALESCE(MAX(CASE WHEN sentiment_score > 0 THEN sentiment_score END), 0)
+        FROM ynews WHERE news_type <> 'fs' AND trading_dt IS NOT NULL
+        GROUP BY symbol, trading_dt ORDER BY symbol, trading_dt""").fetchall()
+    assert raw == [(symbol, day, min(low, 0), max(high, 0))
+                   for symbol, day, count, fs, low, high, *_ in rows if count > 0]
+
+
+def test_touched_days_are_distinct_and_dated():
+    records = [make_record('1'), make_record('2'), make_record('3', 'TD'), make_record('4', trading_dt=None)]
+    assert touched_days(records) == [('RY', '2024-03-28'), ('TD', '2024-03-28')]
+
+
+def test_refresh_days_in_chunks():
+    cursor = MagicMock()
+    days = [('RY', f'day-{i}') for i in range(REFRESH_CHUNK_SIZE + 1)]
+    assert refresh_days(cursor, days) == len(days)
+
+    assert cursor.execute.call_count == 2
+    query, params = cursor.execute.call_args_list[1][0]
+    assert '(symbol, trading_dt) IN ((%s, %s))' in query
+    assert params == ('RY', f'day-{REFRESH_CHUNK_SIZE}')
+
+
+def test_writer_refreshes_touched_days_before_commit():
+    connection = MagicMock()
+    cursor = connection.cursor.return_value
+    connection.commit.side_effect = lambda: calls.append('commit')
+    cursor.execute.side_effect = lambda query, params: calls.append(params)
+    cursor.fetchall.return_value = [('RY', '2024-03-28'), ('TD', '2024-03-28')]
+    calls = []
+
+    writer = YnewsWriter(connection)
+    writer.add(make_record('1'))
+    writer.add(make_record('2', 'TD'))
+    writer.flush()
+
+    # The stored days of the flushed articles are looked up, then refreshed
+    assert calls == [('1', '2'), ('RY', '2024-03-28', 'TD', '2024-03-28'), 'commit']
+    assert not YnewsWriter(MagicMock(), daily=False).daily
+
+
+def test_same_article_under_two_symbols_stays_with_the_first():
+    connection = MagicMock()
+    cursor = connection.cursor.return_value
+    # ynews kept the article under RY, the ticker that stored it first
+    cursor.fetchall.return_value = [('RY', '2024-03-28')]
+
+    writer = YnewsWriter(connection)
+    writer.add(make_record('1', 'RY'))
+    writer.add(make_record('1', 'TD'))
+    writer.flush()
+
+    upsert, rows = cursor.executemany.call_args[0]
+    updated = upsert.split('ON DUPLICATE KEY UPDATE')[1]
+    assert [row[1] for row in rows] == ['RY', 'TD']
+    assigned = [line.split(' = ')[0].strip() for line in updated.strip().splitlines()]
+    assert assigned == ['news_type', 'sentiment_score', 'comment', 'sentiment_model']
+    assert 'sentiment_score = IF(symbol = VALUES(symbol), VALUES(sentiment_score), sentiment_score)' in updated
+    (lookup, uuids), (refresh, days) = [call[0] for call in cursor.execute.call_args_list]
+    assert uuids == ('1',)
+    assert days == ('RY', '2024-03-28')
+
+
+def test_rebuild_limited_to_symbols():
+    connection = MagicMock()
+    cursor = connection.cursor.return_value
+    cursor.fetchone.return_value = (12,)
+
+    assert rebuild_ynews_daily(connection, ['RY', 'TD']) == 12
+    statements = [call[0] for call in cursor.execute.call_args_list]
+    assert statements[1] == ("DELETE FROM ynews_daily WHERE symbol IN (%s, %s)", ('RY', 'TD'))
+    assert 'INSERT INTO ynews_daily' in statements[2][0] and statements[2][1] == ('RY', 'TD')
+    assert connection.commit.called
+
+
+def test_create_fills_a_new_aggregate():
+    connection = MagicMock()
+    cursor = connection.cursor.return_value
+    cursor.__enter__.return_value = cursor
+    cursor.fetchall.return_value = [(0,)]
+    cursor.fetchone.return_value = (3,)
+
+    assert create_ynews_daily(connection)
+    statements = [call[0][0] for call in cursor.execute.call_args_list]
+    assert 'information_schema' in statements[0]
+    assert any('INSERT INTO ynews_daily' in statement for statement in statements)
+
+    cursor.fetchall.return_value = [(1,)]
+    cursor.execute.reset_mock()
+    assert not create_ynews_daily(connection)
+    assert cursor.execute.call_count == 1
+
+
+def sqlite_fetching(connection):
+    # What db.fetch_all needs of a connection, answered by SQLite: context-managed cursors, ? placeholders
+    mock = MagicMock()
+    cursor = mock.cursor.return_value.__enter__.return_value
+    cursor.execute.side_effect = lambda query, params=(): setattr(
+        cursor, 'rows', connection.execute(query.replace('%s', '?'), params).fetchall())
+    cursor.fetchall.side_effect = lambda: cursor.rows
+    return mock
+
+
+def test_partly_built_aggregate_is_reported():
+    connection = sqlite3.connect(':memory:')
+    connection.execute("CREATE TABLE ynews (uuid, symbol, trading_dt, news_type, sentiment_score)")
+    connection.executemany("INSERT INTO ynews VALUES (?, ?, ?, ?, ?)", NEWS + [('8', 'TD', '2024-04-02', 'story', 0)])
+    connection.execute("""CREATE TABLE ynews_daily (symbol, trading_dt, news_count, fs_count, min_score, max_score,
+                          mean_score, positive_count, negative_count)""")
+    connection.execute("INSERT INTO ynews_daily " + aggregate_select("1 = 1"))
+    fetching = sqlite_fetching(connection)
+    assert symbols_missing_daily(fetching) == []
+
+    # An interrupted rebuild left out one of TD's days
+    connection.execute("DELETE FROM ynews_daily WHERE symbol = 'TD' AND trading_dt = '2024-04-02'")
+    assert symbols_missing_daily(fetching) == ['TD']
+    assert symbols_missing_daily(fetching, ['RY']) == []
+    connection.execute("DELETE FROM ynews_daily WHERE symbol = 'RY'")
+    assert symbols_missing_daily(fetching, ['RY', 'TD']) == ['RY', 'TD']
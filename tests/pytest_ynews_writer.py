@@ -0,0 +1,93 @@
+import re
+import sqlite3
+from unittest.mock import MagicMock, patch
+
+from utils.ynews_writer import YNEWS_UPSERT, YnewsWriter, add_sentiment_model_column
+
+
+def make_record(uuid, symbol='RY', score=1):
+    return (uuid, symbol, None, None, 'Title', 'http://link.com', 'Description', 'story', score, 'Positive', 'model')
+
+
+def sqlite_upsert():
+    # The MySQL upsert in SQLite syntax: VALUES(col) is excluded.col and IF is IIF
+    query = YNEWS_UPSERT.replace('%s', '?').replace('IF(', 'IIF(')
+    query = query.replace('ON DUPLICATE KEY UPDATE', 'ON CONFLICT(uuid) DO UPDATE SET')
+    return re.sub(r'VALUES\((\w+)\)', r'excluded.\1', query)
+
+
+def test_flush_on_max_rows():
+    mock_conn = MagicMock()
+    writer = YnewsWriter(mock_conn, max_rows=2, max_interval=3600)
+
+    writer.add(make_record('1'))
+    assert not mock_conn.commit.called
+
+    writer.add(make_record('2'))
+    mock_conn.cursor.return_value.executemany.assert_called_once()
+    assert len(mock_conn.cursor.return_value.executemany.call_args[0][1]) == 2
+    assert mock_conn.commit.call_count == 1
+    assert writer.buffer == []
+    assert writer.rows_written == 2
+
+
+def test_flush_on_interval():
+    mock_conn = MagicMock()
+    writer = YnewsWriter(mock_conn, max_rows=100, max_interval=5)
+
+    with patch('utils.ynews_writer.time.monotonic', return_value=writer.last_flush + 10):
+        writer.add(make_record('1'))
+
+    assert mock_conn.commit.call_count == 1
+
+
+def test_failed_flush_keeps_rows_for_retry():
+    mock_conn = MagicMock()
+    mock_conn.cursor.return_value.executemany.side_effect = [Exception("lost connection"), None]
+    writer = YnewsWriter(mock_conn, max_rows=100)
+
+    writer.add(make_record('1'))
+    assert writer.flush() == 0
+    assert mock_conn.rollback.called
+    assert len(writer.buffer) == 1
+
+    assert writer.flush() == 1
+    assert writer.buffer == []
+
+
+def test_close_flushes_remaining_rows():
+    mock_conn = MagicMock()
+    with YnewsWriter(mock_conn) as writer:
+        writer.add(make_record('1'))
+
+    assert mock_conn.commit.call_count == 1
+    assert 'ON DUPLICATE KEY UPDATE' in mock_conn.cursor.return_value.executemany.call_args[0][0]
+
+
+def test_upsert_keeps_the_score_of_the_first_symbol():
+    connection = sqlite3.connect(':memory:')
+    connection.execute("""CREATE TABLE ynews (uuid PRIMARY KEY, symbol, news_ts, trading_dt, title, link, description,
+                          news_type, sentiment_score, comment, sentiment_model)""")
+    connection.execute(sqlite_upsert(), make_record('1', 'RY', 1))
+
+    # The same syndicated story scored for TD does not overwrite the RY row
+    connection.execute(sqlite_upsert(), make_record('1', 'TD', -1))
+    assert connection.execute("SELECT symbol, sentiment_score FROM ynews").fetchall() == [('RY', 1)]
+
+    # A rescore for RY still updates it
+    connection.execute(sqlite_upsert(), make_record('1', 'RY', 0))
+    assert connection.execute("SELECT symbol, sentiment_score FROM ynews").fetchall() == [('RY', 0)]
+
+
+def test_add_sentiment_model_column_to_old_tables():
+    mock_conn = MagicMock()
+    mock_cursor = mock_conn.cursor.return_value
+    mock_cursor.fetchone.return_value = (0,)
+    assert add_sentiment_model_column(mock_conn) is True
+    assert mock_cursor.execute.call_args[0][0] == "ALTER TABLE ynews ADD COLUMN sentiment_model VARCHAR(128)"
+    mock_conn.commit.assert_called_once()
+
+    mock_cursor.reset_mock()
+    mock_cursor.fetchone.return_value = (1,)
+    assert add_sentiment_model_column(mock_conn) is False
+    assert mock_cursor.execute.call_count == 1